@@ -1,6 +1,13 @@
+import hashlib
+import hmac
+import os
+import uuid
+
 import streamlit as st
 import requests
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configure page
 st.set_page_config(
@@ -11,6 +18,74 @@ st.set_page_config(
 )
 
 
+#-----------------------------talking to the backend--------------------------------------------------------
+#streamlit reruns this whole script on every click, so the session and the answers live in its caches
+#BACKEND_URL points the GUI at another server
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001")
+#(connect, read) seconds
+BACKEND_TIMEOUT = (3.05, 10)
+#how long the answer for one set of choices is reused before asking the backend again
+BUILD_CACHE_TTL = 300
+#answers worth keeping: a build, or no build for these choices; anything else is asked again next click
+CACHEABLE_STATUS = (200, 404)
+
+
+#one keep-alive connection pool for every rerun and every browser session of this process
+#connection errors and busy/overloaded answers are retried with backoff, honouring Retry-After
+@st.cache_resource
+def backend_session() -> requests.Session:
+    retries = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=10, max_retries=retries)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+#the backend rate limits per client, every request from this process would share one limit without an id
+#per browser session; the backend only believes an id signed with the secret it shares with this GUI
+#(RATE_LIMIT_CLIENT_ID_SECRET on both, see admission.py in the backend), without it no id is sent
+CLIENT_ID_SECRET = os.environ.get("RATE_LIMIT_CLIENT_ID_SECRET", "").encode()
+
+
+#"<id>.<hmac>" for this browser session, same as admission.sign_client_id; "" when there is no secret
+def client_id() -> str:
+    if not CLIENT_ID_SECRET:
+        return ""
+    if "client_id" not in st.session_state:
+        session_id = uuid.uuid4().hex
+        signature = hmac.new(CLIENT_ID_SECRET, session_id.encode(), hashlib.sha256).hexdigest()
+        st.session_state.client_id = f"{session_id}.{signature}"
+    return st.session_state.client_id
+
+
+#(status code, json) for one set of choices, cached on the arguments; other statuses raise so they aren't cached
+#_client_id is left out of the cache key (leading underscore), every session shares the answers
+@st.cache_data(ttl=BUILD_CACHE_TTL, max_entries=512, show_spinner=False)
+def fetch_build(cpu_model: str, case_size: str, cooling: str, pref_storage_size: int, pref_memory_size: str,
+                pref_storage_type: str, pref_memory_type: str, _client_id: str = ""):
+    user_input = {
+        "cpu_model": cpu_model,
+        "case_size": case_size,
+        "cooling": cooling,
+        "pref_storage_size": pref_storage_size,
+        "pref_memory_size": pref_memory_size,
+        "pref_storage_type": pref_storage_type,
+        "pref_memory_type": pref_memory_type,
+    }
+    res = backend_session().post(f"{BACKEND_URL}/get_user_build", json=user_input, timeout=BACKEND_TIMEOUT,
+                                 headers={"X-Client-Id": _client_id} if _client_id else None)
+    if res.status_code not in CACHEABLE_STATUS:
+        raise requests.HTTPError(f"Status code: {res.status_code}", response=res)
+    return res.status_code, res.json()
+
+
 
 
 
@@ -232,10 +307,9 @@ with tab1:
                 
                 
                 try:
-                    res = requests.post("http://localhost:8001/get_user_build", json = user_input)
+                    status_code, data = fetch_build(**user_input, _client_id=client_id())
 
-                    if res.status_code == 200:
-                        data = res.json()
+                    if status_code == 200:
                         if "build" in data:
                             
                             build = data["build"]                           
@@ -288,7 +362,14 @@ with tab1:
                         else:
                             st.warning(data.get("message", "No recommendation available for your criteria."))
                     else:
-                        st.error(f"Failed to get recommendation. Status code: {res.status_code} ")
+                        st.error(f"Failed to get recommendation. Status code: {status_code} ")
+                except requests.HTTPError as e:
+                    #the backend turns requests away when it is overloaded, the retries above already waited for it
+                    if e.response.status_code in (429, 503):
+                        retry_after = e.response.headers.get("Retry-After", "a few")
+                        st.warning(f"The recommendation service is busy, please try again in {retry_after} seconds.")
+                    else:
+                        st.error(f"Failed to get recommendation. Status code: {e.response.status_code} ")
                 except Exception as e:
                     st.error(f"Error connecting to the recommendation service: {str(e)}")
 
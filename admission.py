@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import hmac
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastjson import JSON_MEDIA_TYPE, dumps
+from metrics import Histogram, quantile
+
+
+#-------------------admission control--------------
+#every worker takes at most MAX_IN_FLIGHT requests at a time, up to MAX_QUEUE more wait for a slot for at most
+#QUEUE_TIMEOUT seconds, and anything beyond that is turned away at once with a 503 and a Retry-After instead of
+#piling up behind the blocking sqlite calls until the client gives up; a request that got in is served about
+#as fast as it is unloaded, so p99 stays near service time plus QUEUE_TIMEOUT however hard the spike
+#each client also gets a token bucket (RATE_LIMIT per second, RATE_BURST at once) so one busy caller can't
+#take every slot, past it they get a 429 with a Retry-After
+#queue wait and service time (slot taken to last byte sent) are histograms on /metrics
+#the limits are per process, run several uvicorn workers and each one has its own
+MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "16"))
+MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "1.0"))
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT", "20"))
+RATE_BURST = float(os.environ.get("RATE_BURST", "40"))
+#behind a proxy every request comes from the proxy, set TRUST_FORWARDED=1 to key clients on X-Forwarded-For
+TRUST_FORWARDED = os.environ.get("TRUST_FORWARDED") == "1"
+#the streamlit GUI asks on behalf of all its users from one address, so a bucket per address would have them
+#share one; GUI.py sends an X-Client-Id per browser session, "<id>.<hmac-sha256 of id>" keyed with
+#RATE_LIMIT_CLIENT_ID_SECRET (the same value set on the GUI), and a request whose id verifies gets a bucket of
+#its own under its address; off unless the secret is set, an address can't be trusted for this (behind a proxy
+#on this host every caller is 127.0.0.1) and an unsigned or forged id is ignored, so nobody can mint a fresh
+#bucket per request; RATE_LIMIT_CLIENT_ID_PEERS optionally narrows it to the addresses listed, compared with the
+#address the bucket is keyed on (the X-Forwarded-For one under TRUST_FORWARDED)
+CLIENT_ID_HEADER = b"x-client-id"
+CLIENT_ID_SECRET = os.environ.get("RATE_LIMIT_CLIENT_ID_SECRET", "").encode()
+CLIENT_ID_PEERS = frozenset(filter(None, os.environ.get("RATE_LIMIT_CLIENT_ID_PEERS", "").split(",")))
+CLIENT_ID_MAX = 64
+#buckets kept, least recently seen clients are forgotten first (a forgotten client starts with a full bucket)
+MAX_CLIENTS = 10_000
+
+#only these paths are admitted through the limits; /metrics, /stats and the docs always answer
+ADMITTED_PREFIXES = ("/get_user_build", "/solve_build", "/components")
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    def __init__(self, rate: float = RATE_LIMIT, burst: float = RATE_BURST, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        #client -> (tokens, when they were counted)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    #takes a token for `client`; 0 when there was one, otherwise the seconds until there is
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, counted = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - counted) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.queue_wait = Histogram()
+        self.service = Histogram()
+
+    def reject(self, status_code: int, reason: str, retry_after: float) -> Rejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return Rejected(status_code, reason, retry_after)
+
+    #how long the queue in front of a new request takes to drain, from the recent service times
+    def drain_estimate(self) -> float:
+        _, _, _, _, recent = self.service.snapshot()
+        return (self.queued + 1) * quantile(recent, 0.5) / self.max_in_flight
+
+    #waits for a slot and returns how long that took; raises Rejected when the queue is full or the wait too long
+    #the caller gives the slot back with release()
+    async def acquire(self) -> float:
+        started = time.perf_counter()
+        if not self._slots.locked():
+            #a free slot and nobody waiting for it, taken without suspending
+            await self._slots.acquire()
+        elif self.queued >= self.max_queue:
+            raise self.reject(503, "queue_full", self.drain_estimate())
+        else:
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self.reject(503, "queue_timeout", self.drain_estimate())
+            finally:
+                self.queued -= 1
+        waited = time.perf_counter() - started
+        self.in_flight += 1
+        self.admitted += 1
+        self.queue_wait.observe(waited)
+        return waited
+
+    def release(self, service_seconds: float):
+        self.in_flight -= 1
+        self._slots.release()
+        self.service.observe(service_seconds)
+
+    def stats(self) -> dict:
+        stats = {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+        }
+        for reason, n in sorted(self.rejected.items()):
+            stats[f"rejected_{reason}"] = n
+        return stats
+
+
+def sign_client_id(client_id: str, secret: bytes) -> str:
+    return f"{client_id}.{hmac.new(secret, client_id.encode(), hashlib.sha256).hexdigest()}"
+
+
+#the id out of a signed X-Client-Id header value, None when there is no secret or it doesn't verify
+def verified_client_id(value: str, secret: bytes) -> Optional[str]:
+    client_id = value.rpartition(".")[0]
+    if not secret or not client_id or len(client_id) > CLIENT_ID_MAX:
+        return None
+    if not hmac.compare_digest(sign_client_id(client_id, secret).encode("latin-1"), value.encode("latin-1")):
+        return None
+    return client_id
+
+
+def client_key(scope) -> str:
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    client_id = None
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for" and TRUST_FORWARDED:
+            address = value.decode("latin-1").split(",")[0].strip()
+        elif name == CLIENT_ID_HEADER and CLIENT_ID_SECRET:
+            client_id = verified_client_id(value.decode("latin-1"), CLIENT_ID_SECRET)
+    if client_id is not None and (not CLIENT_ID_PEERS or address in CLIENT_ID_PEERS):
+        return f"{address}/{client_id}"
+    return address
+
+
+#asgi middleware in front of the app, same shape as logs.RequestIdMiddleware
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController, buckets: TokenBuckets,
+                 prefixes: Tuple[str, ...] = ADMITTED_PREFIXES):
+        self.app = app
+        self.controller = controller
+        self.buckets = buckets
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+        try:
+            wait = self.buckets.take(client_key(scope))
+            if wait > 0:
+                raise self.controller.reject(429, "rate_limited", wait)
+            await self.controller.acquire()
+        except Rejected as e:
+            return await send_rejection(send, e)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - started)
+
+
+async def send_rejection(send, rejected: Rejected):
+    body = dumps({"error": "too many requests" if rejected.status_code == 429 else "server overloaded, try again later",
+                  "reason": rejected.reason})
+    retry_after = str(max(1, math.ceil(rejected.retry_after)))
+    await send({
+        "type": "http.response.start",
+        "status": rejected.status_code,
+        "headers": [
+            (b"content-type", JSON_MEDIA_TYPE.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,18 +1,109 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import itertools
+import json
+import os
 import sqlite3
+import time
 from pathlib import Path
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Dict, Optional, List
+from pydantic import BaseModel, Field
 from enum import Enum
+from contextlib import asynccontextmanager
+
+from admission import AdmissionController, AdmissionMiddleware, TokenBuckets
+from build_cache import BuildCache
+from catalog import (BatchResolver, Catalog, ComponentNotFound, DependencyRecorder, build_summary, catalog_generation, catalog_version, changed_tags,
+                     db_fingerprint, dependent_keys, form_factor_key, input_key, key_text, last_change_seq, norm, read_changes)
+from columnar import np, read_catalog
+from db_pool import ConnectionPool, PoolTimeout
+from fastjson import FastJSONResponse, dumps, raw_json
+from http_cache import CONDITIONAL, etag_matches, make_etag, not_modified, with_validators
+from listing import MAX_PAGE_SIZE, PAGE_SIZE, ListingError, decode_cursor, encode_cursor, page_key, page_query, read_page
+from logs import RequestIdMiddleware, configure_logging
+from metrics import BUILD_METRICS, render_histograms, render_stats
+from search import search_components
+from single_flight import SingleFlight
+from shared_catalog import SharedCatalog, SharedCatalogStore, SnapshotError, snapshot_path
+from solver import DEFAULT_WEIGHTS, BuildFilters, iter_alternatives, solve_budget_build
+
+
+# Database path, COMPONENTS_DB points the server at another copy (e.g. a scaled catalog from benchmarks/)
+BASE_DIR = Path(__file__).parent
+DATABASE_URL = Path(os.environ.get("COMPONENTS_DB", BASE_DIR / "components.db"))
 
-app = FastAPI()
+#json lines to stderr from a background thread, see logs.py for LOG_LEVEL / LOG_SAMPLE / LOG_RATE
+LOGGING = configure_logging()
+LOGGING.start()
+log = LOGGING.logger
 
+#in memory copy of the component tables, loaded once at startup (None means fall back to querying the db)
+#a columnar.ColumnarCatalog when numpy is installed, the solver and the alternatives then filter with masks
+CATALOG: Optional[Catalog] = None
 
-# Database path
-BASE_DIR = Path(__file__).parent
-DATABASE_URL = BASE_DIR / "components.db"
+
+#the compiled catalog init_db.py writes next to the database, mapped instead of reading the tables when current
+SNAPSHOT_PATH = snapshot_path(DATABASE_URL)
+
+#SHARED_CATALOG=1: one compiled copy of the catalog mapped by every uvicorn worker, see shared_catalog.py
+SHARED_CATALOG = SharedCatalogStore(DATABASE_URL) if os.environ.get("SHARED_CATALOG") == "1" else None
+
+
+#finished builds keyed on the normalized input, most traffic repeats the same few configurations
+#the values are the encoded response bodies, a hit is sent without touching the model or the encoder
+BUILD_CACHE = BuildCache()
+
+#answers computed ahead of time by `python init_db.py precompute`,
+#key_text(input_key) -> (build fields, error, tags, response body encoded when loaded)
+PRECOMPUTED: dict = {}
+
+#last component_changes entry the build cache has been invalidated for
+CHANGE_SEQ = 0
+
+#catalog_version the served data is at least as new as, the ETags are built on it (None: unknown, no ETags)
+#always read before the data it covers, an ETag may be older than the body it goes with but never newer
+CATALOG_VERSION: Optional[int] = None
+#catalog_generation of the catalog being served, a new one (init_db.publish) replaces every in memory state at once
+CATALOG_GENERATION = 0
+#the background load of a newly published generation, while it runs requests keep the old one
+GENERATION_SWITCH: Optional[asyncio.Task] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global CATALOG, PRECOMPUTED, CHANGE_SEQ, CATALOG_VERSION, CATALOG_GENERATION
+    LOGGING.start()
+    try:
+        BUILD_CACHE.check_fingerprint(db_fingerprint(DATABASE_URL))
+        CATALOG_GENERATION, CATALOG_VERSION = read_catalog_state_from_pool()
+        CATALOG = load_catalog_from_pool()
+        log.info("catalog loaded", extra={"components": len(CATALOG), "db": str(DATABASE_URL)})
+    except (sqlite3.Error, PoolTimeout) as e:
+        log.warning("could not load catalog, falling back to per request queries", extra={"error": str(e)})
+    try:
+        CHANGE_SEQ = read_change_seq_from_pool()
+    except (sqlite3.Error, PoolTimeout) as e:
+        log.warning("no change log, any database change drops the whole build cache", extra={"error": str(e)})
+    try:
+        PRECOMPUTED = load_precomputed_from_pool()
+        log.info("precomputed builds loaded", extra={"builds": len(PRECOMPUTED)})
+    except (sqlite3.Error, PoolTimeout) as e:
+        log.info("no precomputed builds", extra={"error": str(e)})
+    yield
+    DB_POOL.close()
+    #flush what is still queued
+    LOGGING.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+#the last one added runs first, rejected requests still get their request id
+ADMISSION = AdmissionController()
+RATE_LIMITS = TokenBuckets()
+app.add_middleware(AdmissionMiddleware, controller=ADMISSION, buckets=RATE_LIMITS)
+app.add_middleware(RequestIdMiddleware)
 
 
 
@@ -54,486 +145,761 @@ class RecommendedBuildForUser(BaseModel):
      recommended_total_cost: int
 
 
+#Request model for the budget solver, everything except the budget is optional
+class BudgetBuildInput(BaseModel):
+
+    budget: int = Field(gt=0)
+    cpu_brand: Optional[str] = None
+    cpu_model: Optional[str] = None
+    case_size: Optional[str] = None
+    cooling: Optional[str] = None
+    pref_storage_size: Optional[int] = None
+    pref_storage_type: Optional[str] = None
+    pref_memory_size: Optional[str] = None
+    pref_memory_type: Optional[str] = None
+    #category -> weight, see solver.DEFAULT_WEIGHTS
+    weights: Optional[Dict[str, float]] = None
+
+
+#many inputs in one request, answered in the same order
+class BatchBuildInput(BaseModel):
+
+    inputs: List[UserComponentInput] = Field(max_length=10_000)
+
+
+#how /get_user_build/alternatives orders and sends its builds
+class RankBy(str, Enum):
+    price = "price"
+    score = "score"
+
+
+class StreamFormat(str, Enum):
+    ndjson = "ndjson"
+    sse = "sse"
+
+
+#the component tables, as named in components.db
+class ComponentType(str, Enum):
+    cpus = "cpus"
+    motherboards = "motherboards"
+    gpus = "gpus"
+    cases = "cases"
+    cooling_systems = "cooling_systems"
+    storage = "storage"
+    ram = "ram"
+    psus = "psus"
+
+
+class ListSort(str, Enum):
+    price = "price"
+    watt_output = "watt_output"
+    id = "id"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class ListFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+
+
+#listing filters, each one only applies to some component types (see listing.FILTERS)
+class ListingFilters(BaseModel):
+
+    series: Optional[str] = None
+    socket: Optional[str] = None
+    slot: Optional[str] = None
+    form_factor: Optional[str] = None
+    size: Optional[str] = None
+    cooling_type: Optional[str] = None
+    storage_type: Optional[str] = None
+    capacity: Optional[int] = None
+    ram_type: Optional[str] = None
+    min_watts: Optional[int] = Field(None, ge=0)
+    max_watts: Optional[int] = Field(None, ge=0)
+    min_price: Optional[int] = Field(None, ge=0)
+    max_price: Optional[int] = Field(None, ge=0)
+
+
 
 #-------------------code thhat interacts with database--------------
 #note we are fetching one build muna so we have to use the function Fetchone instead of fetchall here
 
 
 
-#function to establish DB connection
-def get_db_connection():
-    try:
-        conn = sqlite3.connect(str(DATABASE_URL))
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"DB connection error on {DATABASE_URL}: {e}")
+#pooled read only connections, shared by the fetch_* lookups, the catalog reads, search and the listings
+DB_POOL = ConnectionPool(DATABASE_URL)
+
+
+#run a query on a pooled connection, the connection goes back to the pool on every path
+def query_one(query: str, params=()):
+    with DB_POOL.connection() as conn:
+        row = conn.execute(query, params).fetchone()
+    return dict(row) if row else None
+
+
+#turn whatever went wrong inside a fetch into the matching http error
+def db_error(e: Exception) -> HTTPException:
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, PoolTimeout):
+        return HTTPException(status_code=503, detail=f"Database busy: {e}")
+    if isinstance(e, sqlite3.Error):
+        return HTTPException(status_code=500, detail=f"Database error: {e}")
+    return HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
     
 #fetch compatible gpu from database
 def fetch_gpu(mobo_gpu_socket):
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM gpus WHERE compatible_sockets LIKE ? "      
-        cursor.execute( query, (f"%{mobo_gpu_socket}%",))
-        
-      
-        row = cursor.fetchone()
-        
-
-        if row:
-            gpu = dict(row)
-
-            print(f"Fetched GPU: {gpu}")
-            conn.close()
+        query = "SELECT g.* FROM gpu_slots s JOIN gpus g ON g.id = s.gpu_id WHERE s.slot = ? ORDER BY g.id LIMIT 1"
+        gpu = query_one(query, (norm(mobo_gpu_socket),))
+
+        if gpu:
+            log.debug("fetched gpu", extra={"component": gpu})
             return {"recommended_gpu": gpu}
         raise HTTPException(status_code=404, detail="GPU not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        raise db_error(e)
 
 #fetch mother board with cpu socket
-def get_mobo_with_cpu(cpu_socket_type:str):
+#case_size picks the first board that some case of that size can take
+def get_mobo_with_cpu(cpu_socket_type:str, case_size: Optional[str] = None):
     try:
-             
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM motherboards WHERE socket_type LIKE ? "      
-        cursor.execute( query, (f"%{cpu_socket_type}%",))
-        
-      
-        row = cursor.fetchone()
-        mobo = dict(row)
-
-        print(f"Fetched Motherboards: {mobo}")
-        conn.close()
+        if case_size is None:
+            query = "SELECT * FROM motherboards WHERE socket_type = ? COLLATE NOCASE ORDER BY id LIMIT 1"
+            mobo = query_one(query, (cpu_socket_type.strip(),))
+        else:
+            query = """SELECT m.* FROM motherboards m
+                       WHERE m.socket_type = ? COLLATE NOCASE
+                         AND EXISTS (SELECT 1 FROM case_form_factors f JOIN cases c ON c.id = f.case_id
+                                     WHERE f.form_factor = lower(trim(m.form_factor)) AND c.case_size = ? COLLATE NOCASE)
+                       ORDER BY m.id LIMIT 1"""
+            mobo = query_one(query, (cpu_socket_type.strip(), case_size.strip()))
 
         if mobo:
+            log.debug("fetched motherboard", extra={"component": mobo})
             return {"recommended_mobo": mobo}
         raise HTTPException(status_code=404, detail="mobo not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        raise db_error(e)
 
 #fetch cpu with user input
 def get_cpu(cpu_model:str):
     try:
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM cpus WHERE series LIKE ? "      
-        cursor.execute( query, (f"%{cpu_model}%",))
-        
-      
-        row = cursor.fetchone()
-        cpu = dict(row)
-        print(f"Fetched CPUs: {cpu}")
-        conn.close()
+        query = "SELECT c.* FROM cpu_series_keys k JOIN cpus c ON c.id = k.cpu_id WHERE k.series_key = ? ORDER BY c.id LIMIT 1"
+        cpu = query_one(query, (norm(cpu_model),))
 
         if cpu:
+            log.debug("fetched cpu", extra={"component": cpu})
             return {"recommended_cpu":  cpu}
-
-        
         raise HTTPException(status_code=404, detail="CPU not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        raise db_error(e)
 
 #fetch psu in db
 def fetch_psu(components_required_watts:int):
     try:
         components_required_watts += int(components_required_watts * 0.10)
-        print(components_required_watts)
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM psus WHERE watt_output >= ? "      
-        cursor.execute( query, (f"{components_required_watts}",))
-        
-      
-        row = cursor.fetchone()
-        if row:
-         psu = dict(row) 
-
-         print(f"Fetched PSU: {psu}")
-         conn.close()
-
-        
-         return {"recommended_psu": psu}
+        log.debug("psu watts with headroom", extra={"watts": components_required_watts})
+        query = "SELECT * FROM psus WHERE watt_output >= ? ORDER BY id LIMIT 1"
+        psu = query_one(query, (components_required_watts,))
+
+        if psu:
+            log.debug("fetched psu", extra={"component": psu})
+            return {"recommended_psu": psu}
         raise HTTPException(status_code=404, detail="psu not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        raise db_error(e)
 
 #fetch case in db    
 def fetch_case(mobo_form_factor:str,pref_size:str):
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM cases WHERE form_factor_compatability LIKE ? AND case_size LIKE ? "      
-        cursor.execute( query, (f"%{mobo_form_factor}%",f"%{pref_size}%"))
-        
-      
-        row = cursor.fetchone()
-        if row:
-            case = dict(row)
-
-            print(f"Fetched compatible case: {case}")
-            conn.close()
+        query = """SELECT c.* FROM case_form_factors f JOIN cases c ON c.id = f.case_id
+                   WHERE f.form_factor = ? AND c.case_size = ? COLLATE NOCASE ORDER BY c.id LIMIT 1"""
+        case = query_one(query, (form_factor_key(mobo_form_factor), pref_size.strip()))
 
+        if case:
+            log.debug("fetched case", extra={"component": case})
             return {"recommended_case": case}
-        else:
-            return{"no case in our database compatible with your case preference"}
-        raise HTTPException(status_code=404, detail="case not found")
-        
-        
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        raise HTTPException(status_code=404, detail="no case in our database compatible with your case preference")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        raise db_error(e)
     
 #fetch cooling in db
 def fetch_cooling(mobo_socket_type:str,cooling:str):
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM cooling_systems WHERE compatible_sockets LIKE ? AND cooling_type LIKE ? "      
-        cursor.execute( query, (f"%{mobo_socket_type}%",f"%{cooling}%"))
-        
-      
-        row = cursor.fetchone()
-        if row:
-            cooling = dict(row)
-
-            print(f"Fetched compatible cooling: {cooling}")
-            conn.close()
-
-            return {"recommended_cooling": cooling}
-        else:
-            return{"no cooling in our database compatible with your cooling preference check other options"}
-        raise HTTPException(status_code=404, detail="case not found")
-        
-        
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        query = """SELECT c.* FROM cooler_sockets s JOIN cooling_systems c ON c.id = s.cooler_id
+                   WHERE s.socket_type = ? AND c.cooling_type = ? COLLATE NOCASE ORDER BY c.id LIMIT 1"""
+        cooler = query_one(query, (norm(mobo_socket_type), cooling.strip()))
+
+        if cooler:
+            log.debug("fetched cooling", extra={"component": cooler})
+            return {"recommended_cooling": cooler}
+        raise HTTPException(status_code=404, detail="no cooling in our database compatible with your cooling preference check other options")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")    
+        raise db_error(e)
 
 def fetch_storage(pref_storage_type: str, pref_storage_size: int ):
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM storage WHERE storage_type LIKE ? AND capacity == ? "      
-        cursor.execute( query, (f"%{pref_storage_type}%",f"{pref_storage_size:}"))
-        
-      
-        row = cursor.fetchone()
-        if row:
-            storage = dict(row)
-
-            print(f"Fetched storage: {storage}")
-            conn.close()
+        query = "SELECT * FROM storage WHERE storage_type = ? COLLATE NOCASE AND capacity = ? ORDER BY id LIMIT 1"
+        storage = query_one(query, (pref_storage_type.strip(), int(pref_storage_size)))
 
+        if storage:
+            log.debug("fetched storage", extra={"component": storage})
             return {"recommended_storage": storage}
-        else:
-            return{"no cooling in our database compatible with your cooling preference check other options"}
-        raise HTTPException(status_code=404, detail="case not found")
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        raise HTTPException(status_code=404, detail="no storage in our database matching your storage preference")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")   
+        raise db_error(e)
 
 def fetch_memory(pref_memory_type: str, pref_memory_size: str ):
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM ram WHERE ram_type LIKE ? AND size LIKE ? "      
-        cursor.execute( query, (f"%{pref_memory_type}%",f"%{pref_memory_size}%"))
-        
-      
-        row = cursor.fetchone()
-        if row:
-            memory = dict(row)
-
-            print(f"Fetched memory: {memory}")
-            conn.close()
+        query = "SELECT * FROM ram WHERE ram_type = ? COLLATE NOCASE AND size = ? COLLATE NOCASE ORDER BY id LIMIT 1"
+        memory = query_one(query, (pref_memory_type.strip(), pref_memory_size.strip()))
 
+        if memory:
+            log.debug("fetched memory", extra={"component": memory})
             return {"recommended_memory": memory}
-        else:
-            return{"no cooling in our database compatible with your cooling preference check other options"}
-        raise HTTPException(status_code=404, detail="case not found")
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        raise HTTPException(status_code=404, detail="no memory in our database matching your memory preference")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")   
+        raise db_error(e)
 #-------------------code thhat interacts with database end--------------
 
-#User input 
-@app.post("/get_user_build")
-async def get_user_build(input: UserComponentInput):
+#-------------------building the recommendation--------------
+#same selection as the sql path below, everything is already in memory so nothing blocks the event loop
+#`run` is the stage hook, a DependencyRecorder's when the caller wants the build's dependency tags
+#the fields come straight from catalog rows, they are not run through RecommendedBuildForUser again
+def build_from_catalog(catalog: Catalog, input: UserComponentInput, run=BUILD_METRICS.run) -> Dict[str, object]:
+    parts = catalog.resolve(input.cpu_model, input.case_size, input.cooling, input.pref_storage_type,
+                            input.pref_storage_size, input.pref_memory_type, input.pref_memory_size, run=run)
+    return BUILD_METRICS.run("model", build_summary, parts)
+
+
+#the response body, encoded once when the build is made and then kept as bytes; timed as its own stage
+def encode_build(build: Dict[str, object]) -> bytes:
+    return dumps({"build": build})
+
+
+#per request queries, used when the catalog could not be loaded
+async def build_from_db(input: UserComponentInput, run=BUILD_METRICS.run) -> RecommendedBuildForUser:
+    #getting the data we need from the database to send the recommended build to the user
+    #the fetch_* helpers block on sqlite so they run on the threadpool, independent lookups at the same time:
+    #cpu, storage and memory first, then the motherboard (needs the cpu socket), then gpu, case and cooling
+    #(all need the motherboard) and last the psu (needs everyone's watts); each one is timed as its stage
+    cpu, storage, memory = await asyncio.gather(
+        run_in_threadpool(run, "cpu", get_cpu, input.cpu_model),
+        run_in_threadpool(run, "storage", fetch_storage, input.pref_storage_type, input.pref_storage_size),
+        run_in_threadpool(run, "memory", fetch_memory, input.pref_memory_type, input.pref_memory_size),
+    )
+    cpu_socket = cpu.get("recommended_cpu", {}).get("socket_type")
+
+    mobo = await run_in_threadpool(run, "mobo", get_mobo_with_cpu, cpu_socket, input.case_size)
+    mobo_gpu_socket = mobo.get("recommended_mobo", {}).get("gpu_socket")
+    mobo_form_factor = mobo.get("recommended_mobo", {}).get("form_factor")
+    mobo_socket_type = mobo.get("recommended_mobo", {}).get("socket_type")
+
+    gpu, ComCase, cooling = await asyncio.gather(
+        run_in_threadpool(run, "gpu", fetch_gpu, mobo_gpu_socket),
+        run_in_threadpool(run, "case", fetch_case, mobo_form_factor, input.case_size),
+        run_in_threadpool(run, "cooling", fetch_cooling, mobo_socket_type, input.cooling),
+    )
+
+    # to get recommended PSU
+    cpu_watts=int(cpu.get("recommended_cpu", {}).get("required_watt"))
+    mobo_watts=int(mobo.get("recommended_mobo", {}).get("required_watt"))
+    gpu_watts=int(gpu.get("recommended_gpu", {}).get("required_watt"))
+    cooling_watts=int(cooling.get("recommended_cooling", {}).get("required_watt"))
+    storage_watts=int(storage.get("recommended_storage", {}).get("required_watt"))
+    memory_watts=int(memory.get("recommended_memory", {}).get("required_watt"))
+
+    required_watts= cpu_watts + mobo_watts + gpu_watts + cooling_watts + storage_watts + memory_watts
+
+    psu= await run_in_threadpool(run, "psu", fetch_psu, required_watts)
+
+    #to get the name of all the components
+    cpu_name=str(cpu.get("recommended_cpu", {}).get("name"))
+    mobo_name=str(mobo.get("recommended_mobo", {}).get("name"))
+    gpu_name=str(gpu.get("recommended_gpu", {}).get("model"))
+    cooling_name=str(cooling.get("recommended_cooling", {}).get("name"))     
+    psu_name=str(psu.get("recommended_psu", {}).get("name"))
+    case_name=str(ComCase.get("recommended_case", {}).get("name"))
+
+    #need different way of handling it
+    storage_name=str(storage.get("recommended_storage", {}).get("storage_type")) + " " + str(storage.get("recommended_storage", {}).get("capacity")) + " GB Storage"
+    memory_name=str(memory.get("recommended_memory", {}).get("ram_type")) +" "+ str(memory.get("recommended_memory", {}).get("size")) +" Memory"
+
+    #to get price of all components
+
+    cpu_price=cpu.get("recommended_cpu", {}).get("price")
+    mobo_price=mobo.get("recommended_mobo", {}).get("price")
+    gpu_price=gpu.get("recommended_gpu", {}).get("price")
+    cooling_price=cooling.get("recommended_cooling", {}).get("price")
+    storage_price=storage.get("recommended_storage", {}).get("price")
+    memory_price=memory.get("recommended_memory", {}).get("price")
+    psu_price=psu.get("recommended_psu", {}).get("price")
+    case_price=ComCase.get("recommended_case", {}).get("price")
+
+    total_price= cpu_price + mobo_price + gpu_price + cooling_price + storage_price + memory_price + psu_price + case_price
+
+    fields = {
+        "recommended_cpu_name": cpu_name,
+        "recommended_cpu_price": cpu_price,
+        "recommended_gpu_name": gpu_name,
+        "recommended_gpu_price": gpu_price,
+        "recommended_mobo_name": mobo_name,
+        "recommended_mobo_price": mobo_price,
+        "recommended_psu_name": psu_name,
+        "recommended_psu_price": psu_price,
+        "recommended_case_name": case_name,
+        "recommended_case_price": case_price,
+        "recommended_cooling_name": cooling_name,
+        "recommended_cooling_price": cooling_price,
+        "recommended_storage_name": storage_name,
+        "recommended_storage_price": storage_price,
+        "recommended_memory_name": memory_name,
+        "recommended_memory_price": memory_price,
+        "recommended_total_cost": total_price,
+    }
+    #the model stage looks nothing up, it is timed like build_from_catalog's and has no dependency tags
+    build = BUILD_METRICS.run("model", RecommendedBuildForUser.model_validate, fields)
+
+    return build
+
+
+#reload the catalog and drop cached builds when components.db changes, looked at most once a second
+CATALOG_CHECK_INTERVAL = 1.0
+last_catalog_check = 0.0
+
+
+def read_catalog_from_pool() -> Catalog:
+    with DB_POOL.connection() as conn:
+        return read_catalog(conn)
+
+
+#the snapshot when it was compiled at the database's catalog_version, None when there is none or it is stale
+def open_snapshot() -> Optional[SharedCatalog]:
+    if np is None or not SNAPSHOT_PATH.exists():
+        return None
     try:
-     
-
-
-     #getting the data we need from the database to send the recommended build to the user
-     cpu = get_cpu(input.cpu_model)   
-     cpu_socket = cpu.get("recommended_cpu", {}).get("socket_type")
-
-     mobo = get_mobo_with_cpu(cpu_socket)
-     mobo_gpu_socket = mobo.get("recommended_mobo", {}).get("gpu_socket")
-     mobo_form_factor = mobo.get("recommended_mobo", {}).get("form_factor")
-     mobo_socket_type = mobo.get("recommended_mobo", {}).get("socket_type")
-
-     gpu = fetch_gpu(mobo_gpu_socket)
-     ComCase= fetch_case(mobo_form_factor, input.case_size)
-     cooling = fetch_cooling(mobo_socket_type, input.cooling) 
-     storage= fetch_storage(input.pref_storage_type,input.pref_storage_size)
-     memory= fetch_memory(input.pref_memory_type,input.pref_memory_size)
-     
-
-
-     # to get recommended PSU
-     cpu_watts=int(cpu.get("recommended_cpu", {}).get("required_watt"))
-     mobo_watts=int(mobo.get("recommended_mobo", {}).get("required_watt"))
-     gpu_watts=int(gpu.get("recommended_gpu", {}).get("required_watt"))
-     cooling_watts=int(cooling.get("recommended_cooling", {}).get("required_watt"))
-     storage_watts=int(storage.get("recommended_storage", {}).get("required_watt"))
-     memory_watts=int(memory.get("recommended_memory", {}).get("required_watt"))
-    
-     required_watts= cpu_watts + mobo_watts + gpu_watts + cooling_watts + storage_watts + memory_watts
-
-     psu= fetch_psu(required_watts)
-     
-     #to get the name of all the components
-     cpu_name=str(cpu.get("recommended_cpu", {}).get("name"))
-     mobo_name=str(mobo.get("recommended_mobo", {}).get("name"))
-     gpu_name=str(gpu.get("recommended_gpu", {}).get("model"))
-     cooling_name=str(cooling.get("recommended_cooling", {}).get("name"))     
-     psu_name=str(psu.get("recommended_psu", {}).get("name"))
-     case_name=str(ComCase.get("recommended_case", {}).get("name"))
-
-     #need different way of handling it
-     storage_name=str(storage.get("recommended_storage", {}).get("storage_type")) + " " + str(storage.get("recommended_storage", {}).get("capacity")) + " GB Storage"
-     memory_name=str(memory.get("recommended_memory", {}).get("ram_type")) +" "+ str(memory.get("recommended_memory", {}).get("size")) +" Memory"
-
-     #to get price of all components
-
-     cpu_price=cpu.get("recommended_cpu", {}).get("price")
-     mobo_price=mobo.get("recommended_mobo", {}).get("price")
-     gpu_price=gpu.get("recommended_gpu", {}).get("price")
-     cooling_price=cooling.get("recommended_cooling", {}).get("price")
-     storage_price=storage.get("recommended_storage", {}).get("price")
-     memory_price=memory.get("recommended_memory", {}).get("price")
-     psu_price=psu.get("recommended_psu", {}).get("price")
-     case_price=ComCase.get("recommended_case", {}).get("price")
-
-     total_price= cpu_price + mobo_price + gpu_price + cooling_price + storage_price + memory_price + psu_price + case_price
-     
-     build= RecommendedBuildForUser(recommended_cpu_name= cpu_name, recommended_cpu_price= cpu_price, recommended_gpu_name= gpu_name, recommended_gpu_price= gpu_price, recommended_mobo_name=mobo_name, recommended_mobo_price=mobo_price,recommended_psu_name=psu_name,recommended_psu_price=psu_price,recommended_case_name=case_name,recommended_case_price=case_price,recommended_cooling_name=cooling_name,recommended_cooling_price=cooling_price,recommended_storage_name=storage_name, recommended_storage_price=storage_price, recommended_memory_name=memory_name, recommended_memory_price= memory_price, recommended_total_cost=total_price)
-
-     return{"build":build}
+        snapshot = SharedCatalog(SNAPSHOT_PATH)
+    except (OSError, SnapshotError) as e:
+        log.warning("ignoring the catalog snapshot", extra={"error": str(e)})
+        return None
+    with DB_POOL.connection() as conn:
+        version = catalog_version(conn)
+    if snapshot.catalog_version != version:
+        log.info("catalog snapshot is stale", extra={"snapshot_version": snapshot.catalog_version, "catalog_version": version})
+        return None
+    return snapshot
+
+
+#the snapshot if current, else the shared generation for the database as it is now (compiled by whichever
+#worker gets there first), else the tables read through the pool
+def load_catalog_from_pool() -> Catalog:
+    snapshot = open_snapshot()
+    if snapshot is not None:
+        return snapshot
+    if SHARED_CATALOG is not None:
+        return SHARED_CATALOG.load(db_fingerprint(DATABASE_URL), read_catalog_from_pool)
+    return read_catalog_from_pool()
+
+
+#every precomputed row except the ones depending on a component changed since the last precompute/refresh
+def load_precomputed_from_pool() -> dict:
+    with DB_POOL.connection() as conn:
+        rows = conn.execute("SELECT input_key, build_json, error FROM precomputed_builds").fetchall()
+        tags = {}
+        for key, table, dependency in conn.execute("SELECT input_key, component_table, dependency FROM build_dependencies"):
+            tags.setdefault(key, []).append((table, dependency))
+        since = conn.execute("SELECT value FROM catalog_meta WHERE key = 'precomputed_seq'").fetchone()[0]
+        changes = read_changes(conn, since)
+        if changes is None:
+            return {}
+        stale = dependent_keys(conn, changed_tags(changes))
+    precomputed = {}
+    for key, build_json, error in rows:
+        if key in stale:
+            continue
+        fields = json.loads(build_json) if build_json else None
+        body = dumps({"error": error}) if error else encode_build(fields)
+        precomputed[key] = (fields, error, tags.get(key, ()), body)
+    return precomputed
+
+
+#(catalog_generation, catalog_version)
+def read_catalog_state_from_pool() -> tuple:
+    with DB_POOL.connection() as conn:
+        return catalog_generation(conn), catalog_version(conn)
+
+
+def read_change_seq_from_pool() -> int:
+    with DB_POOL.connection() as conn:
+        return last_change_seq(conn)
+
+
+#drop the cached builds that depend on components changed since CHANGE_SEQ; everything when that can't be
+#worked out (no change log, or it was pruned past CHANGE_SEQ)
+def invalidate_changed_builds():
+    global CHANGE_SEQ
+    try:
+        with DB_POOL.connection() as conn:
+            changes = read_changes(conn, CHANGE_SEQ)
+    except (sqlite3.Error, PoolTimeout) as e:
+        log.warning("could not read the change log, dropping the build cache", extra={"error": str(e)})
+        changes = None
+    if changes is None:
+        BUILD_CACHE.clear()
+        try:
+            CHANGE_SEQ = read_change_seq_from_pool()
+        except (sqlite3.Error, PoolTimeout):
+            pass
+        return
+    if changes:
+        dropped = BUILD_CACHE.invalidate(changed_tags(changes))
+        CHANGE_SEQ = changes[-1][0]
+        log.info("build cache invalidated", extra={"changes": len(changes), "dropped": dropped})
+
+
+async def refresh_catalog():
+    global CATALOG, PRECOMPUTED, CATALOG_VERSION, GENERATION_SWITCH, last_catalog_check
+    now = time.monotonic()
+    if now - last_catalog_check < CATALOG_CHECK_INTERVAL:
+        return
+    last_catalog_check = now
+    if BUILD_CACHE.check_fingerprint(db_fingerprint(DATABASE_URL), clear=False):
+        try:
+            generation, version = await run_in_threadpool(read_catalog_state_from_pool)
+        except (sqlite3.Error, PoolTimeout):
+            generation, version = CATALOG_GENERATION, None
+        if generation != CATALOG_GENERATION:
+            #no request waits for the load, this one and the ones after it are answered from the old generation
+            if GENERATION_SWITCH is None or GENERATION_SWITCH.done():
+                GENERATION_SWITCH = asyncio.create_task(switch_generation(generation, version))
+            return
+        CATALOG_VERSION = version
+        await run_in_threadpool(invalidate_changed_builds)
+        if CATALOG is not None:
+            CATALOG = await run_in_threadpool(load_catalog_from_pool)
+            log.info("catalog reloaded", extra={"components": len(CATALOG)})
+        try:
+            PRECOMPUTED = await run_in_threadpool(load_precomputed_from_pool)
+        except (sqlite3.Error, PoolTimeout):
+            PRECOMPUTED = {}
+
+
+#a published catalog: everything is loaded in the threadpool while requests keep being served from the old
+#generation, then swapped in with no await in between, so a request sees the old state or the new one whole
+#requests already running finish on the catalog they started with (they hold their own reference to it)
+async def switch_generation(generation: int, version: Optional[int]):
+    global CATALOG, PRECOMPUTED, CHANGE_SEQ, CATALOG_VERSION, CATALOG_GENERATION
+    started = time.perf_counter()
+    catalog = CATALOG
+    try:
+        if catalog is not None:
+            catalog = await run_in_threadpool(load_catalog_from_pool)
+        precomputed = await run_in_threadpool(load_precomputed_from_pool)
+        change_seq = await run_in_threadpool(read_change_seq_from_pool)
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        #the next check tries again, meanwhile the old generation keeps serving
+        log.warning("could not load the published catalog", extra={"generation": generation, "error": str(e)})
+        BUILD_CACHE.forget_fingerprint()
+        return
+    BUILD_CACHE.clear()
+    CATALOG, PRECOMPUTED, CHANGE_SEQ = catalog, precomputed, change_seq
+    CATALOG_VERSION, CATALOG_GENERATION = version, generation
+    log.info("switched to a published catalog", extra={"generation": generation, "catalog_version": version,
+                                                       "seconds": round(time.perf_counter() - started, 3)})
+
+
+#identical inputs missing the cache at the same time (a preset everyone clicks, right after the cache was
+#invalidated or the catalog reloaded) wait for one computation instead of each running the whole chain
+BUILD_FLIGHTS = SingleFlight()
+
+
+#one build from the catalog or the database, encoded and put in the build cache
+async def compute_build(input: UserComponentInput, key) -> bytes:
+    generation, catalog = CATALOG_GENERATION, CATALOG
+    recorder = DependencyRecorder(BUILD_METRICS.run)
+    if catalog is not None:
+        BUILD_METRICS.source("catalog")
+        build = build_from_catalog(catalog, input, recorder.run)
+    else:
+        BUILD_METRICS.source("db")
+        #fields put together from raw rows still go through the model
+        build = (await build_from_db(input, recorder.run)).model_dump()
+    body = BUILD_METRICS.run("serialize", encode_build, build)
+    #a build from a generation that was replaced while it ran is answered but not cached
+    if generation == CATALOG_GENERATION:
+        BUILD_CACHE.put(key, body, recorder.tags)
+    return body
+
+
+#strong ETag for a response computed from the request `parts` and the catalog at CATALOG_VERSION
+def catalog_etag(*parts) -> Optional[str]:
+    if CATALOG_VERSION is None:
+        return None
+    return make_etag(CATALOG_VERSION, *parts)
+#-------------------building the recommendation end--------------
 
 
-
-#-------------------to test code thhat interacts with database easily--------------
-@app.get("/user_input/cpu/{preferred_cpu}")
-def test_fetch_cpu(cpu_model:str):
+#User input 
+@app.post("/get_user_build")
+async def get_user_build(input: UserComponentInput, if_none_match: Optional[str] = Header(None)):
+    started = time.perf_counter()
     try:
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM cpus WHERE series LIKE ? "      
-        cursor.execute( query, (f"%{cpu_model}%",))
-        
-      
-        cpus = cursor.fetchall()
-        result = [dict(row) for row in cpus]
-
-        print(f"Fetched CPUs: {result}")
-        conn.close()
-
-        if result:
-            return {"cpus": result}
-
-        
-        raise HTTPException(status_code=404, detail="CPU not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+     await refresh_catalog()
+     key = input_key(input.cpu_model, input.case_size, input.cooling, input.pref_storage_type,
+                     input.pref_storage_size, input.pref_memory_type, input.pref_memory_size)
+     #ETags only go out with builds, a match means this input had one at this catalog version
+     etag = catalog_etag("build", key_text(key))
+     if etag_matches(if_none_match, etag):
+        BUILD_METRICS.source("not_modified")
+        return not_modified("POST", etag, "get_user_build")
+     body = BUILD_CACHE.get(key)
+     if body is not None:
+        BUILD_METRICS.source("cache")
+     else:
+        precomputed = PRECOMPUTED.get(key_text(key))
+        if precomputed is not None:
+            BUILD_METRICS.source("precomputed")
+            _, error, tags, body = precomputed
+            if error:
+                return raw_json(body, status_code=404)
+            BUILD_CACHE.put(key, body, tags)
+        else:
+            body, leader = await BUILD_FLIGHTS.do((CATALOG_GENERATION, key), compute_build, input, key)
+            if not leader:
+                BUILD_METRICS.source("coalesced")
+
+     return with_validators(raw_json(body), "POST", if_none_match, etag, "get_user_build")
+    except ComponentNotFound as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.detail})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-    
-#Testing Motherboard fetching
-@app.get("/user_input/mobo/{recommeded_mobo}")
-def test_mobo_for_cpu(preferred_cpu_socket:str):
+        log.exception("get_user_build failed")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        BUILD_METRICS.observe("request", time.perf_counter() - started)
+
+
+#best build for a budget, searched over every compatible combination in the catalog
+@app.post("/solve_build")
+async def solve_build(input: BudgetBuildInput, if_none_match: Optional[str] = Header(None)):
+    await refresh_catalog()
+    etag = catalog_etag("solve_build", input.model_dump_json())
+    if etag_matches(if_none_match, etag):
+        return not_modified("POST", etag, "solve_build")
+    catalog = CATALOG
+    if catalog is None:
+        return JSONResponse(status_code=503, content={"error": "component catalog is not loaded"})
+    filters = BuildFilters(**input.model_dump(exclude={"budget", "weights"}))
+    unknown = set(input.weights or {}) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        return JSONResponse(status_code=422, content={"error": f"unknown weight categories: {sorted(unknown)}"})
+
+    #the search is pure cpu work, keep it off the event loop
+    result = await run_in_threadpool(solve_budget_build, catalog, input.budget, filters, input.weights)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": f"no compatible build fits a budget of {input.budget}"})
+    return with_validators(FastJSONResponse(content={
+        "build": build_summary(result.parts),
+        "score": round(result.score, 2),
+        "optimal": result.optimal,
+        "nodes_explored": result.nodes,
+    }), "POST", if_none_match, etag, "solve_build")
+
+
+#one answer per distinct input, every stage lookup shared across the batch (see catalog.BatchResolver)
+#answers are shared by identical inputs only, "Xeon" and "xeon" share the lookups but each gets its own error text
+def resolve_batch(catalog: Catalog, inputs: List[UserComponentInput]):
+    resolver = BatchResolver(catalog)
+    answers = {}
+    results = []
+    for input in inputs:
+        values = input.model_dump()
+        raw = tuple(values.values())
+        if raw not in answers:
+            key = input_key(input.cpu_model, input.case_size, input.cooling, input.pref_storage_type,
+                            input.pref_storage_size, input.pref_memory_type, input.pref_memory_size)
+            precomputed = PRECOMPUTED.get(key_text(key))
+            if precomputed is not None:
+                fields, error, _, _ = precomputed
+                answers[raw] = {"error": error} if error else {"build": fields}
+            else:
+                try:
+                    answers[raw] = {"build": build_summary(resolver.resolve(**values))}
+                except ComponentNotFound as e:
+                    answers[raw] = {"error": str(e)}
+        results.append(answers[raw])
+    return results, {"inputs": len(inputs), "distinct_inputs": len(answers), **resolver.stats()}
+
+
+#bulk builds (quote sheets, price change checks): results line up with the inputs, a failed item only fails itself
+@app.post("/get_user_builds/batch")
+async def get_user_builds_batch(batch: BatchBuildInput, if_none_match: Optional[str] = Header(None)):
+    await refresh_catalog()
+    etag = catalog_etag("batch", batch.model_dump_json())
+    if etag_matches(if_none_match, etag):
+        return not_modified("POST", etag, "batch")
+    catalog = CATALOG
     try:
-        cpu_socket_type =  preferred_cpu_socket   
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM motherboards WHERE socket_type LIKE ? "      
-        cursor.execute( query, (f"%{cpu_socket_type}%",))
-        
-      
-        mobo = cursor.fetchall()
-        result = [dict(row) for row in mobo]
-
-        print(f"Fetched Motherboards: {result}")
-        conn.close()
-
-        if result:
-            return {"mobo": result}
-        raise HTTPException(status_code=404, detail="mobo not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-    
-#test GPU retrieval
-@app.get("/user_input/gpu/{recommeded_gpu}")
-def test_gpu_for_mobo(mobo_gpu_socket:str):
+        #without the shared catalog the batch reads every table once instead of querying per item
+        if catalog is None:
+            catalog = await run_in_threadpool(load_catalog_from_pool)
+    except (sqlite3.Error, PoolTimeout) as e:
+        return JSONResponse(status_code=503, content={"error": f"could not read the component catalog: {e}"})
+    results, stats = await run_in_threadpool(resolve_batch, catalog, batch.inputs)
+    return with_validators(FastJSONResponse(content={"results": results, "stats": stats}), "POST", if_none_match, etag, "batch")
+
+
+#the k best builds for one input, cheapest (or best scoring) first, streamed one per line as they are found
+@app.post("/get_user_build/alternatives")
+async def get_user_build_alternatives(input: UserComponentInput, k: int = Query(5, ge=1, le=100),
+                                      rank_by: RankBy = RankBy.price, format: StreamFormat = StreamFormat.ndjson,
+                                      if_none_match: Optional[str] = Header(None)):
+    await refresh_catalog()
+    etag = catalog_etag("alternatives", input.model_dump_json(), k, rank_by.value, format.value)
+    if etag_matches(if_none_match, etag):
+        return not_modified("POST", etag, "alternatives")
+    catalog = CATALOG
+    if catalog is None:
+        return JSONResponse(status_code=503, content={"error": "component catalog is not loaded"})
+    alternatives = itertools.islice(iter_alternatives(catalog, rank_by=rank_by.value, **input.model_dump()), k)
+    first = await run_in_threadpool(next, alternatives, None)
+    if first is None:
+        return JSONResponse(status_code=404, content={"error": "no compatible build for this input"})
+
+    def lines():
+        for ranked in itertools.chain([first], alternatives):
+            item = {"rank": ranked.rank, "build": build_summary(ranked.parts)}
+            if rank_by == RankBy.score:
+                item["score"] = round(-ranked.value, 2)
+            line = dumps(item)
+            yield b"data: " + line + b"\n\n" if format == StreamFormat.sse else line + b"\n"
+
+    media_type = "text/event-stream" if format == StreamFormat.sse else "application/x-ndjson"
+    return with_validators(StreamingResponse(lines(), media_type=media_type), "POST", if_none_match, etag, "alternatives")
+
+
+#type ahead over every component table: each term is a prefix ("ryz 7", "rtx 40"), best bm25 match first
+#backed by the component_search fts5 index init_db.py builds and its triggers keep in sync, see search.py
+@app.get("/components/search")
+async def search(q: str = Query(min_length=1, max_length=100), type: Optional[ComponentType] = None,
+                 min_price: Optional[int] = Query(None, ge=0), max_price: Optional[int] = Query(None, ge=0),
+                 limit: int = Query(10, ge=1, le=50), prefix: bool = True, if_none_match: Optional[str] = Header(None)):
+    await refresh_catalog()
+    table = type.value if type else None
+    etag = catalog_etag("search", q, table, min_price, max_price, limit, prefix)
+    if etag_matches(if_none_match, etag):
+        return not_modified("GET", etag, "search")
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM gpus WHERE compatible_sockets LIKE ? "      
-        cursor.execute( query, (f"%{mobo_gpu_socket}%",))
-        
-      
-        gpu = cursor.fetchall()
-        result = [dict(row) for row in gpu]
-
-        print(f"Fetched GPU: {result}")
-        conn.close()
-
-        if result:
-            return {"gpu": result}
-        raise HTTPException(status_code=404, detail="GPU not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-
-
-#Test PSU retrieval
-@app.get("/user_input/psu/{recommeded_psu}")
-def test_psu_fetch(components_required_watts:int):
+        results = await run_in_threadpool(search_from_pool, q, table, min_price, max_price, limit, prefix)
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return JSONResponse(status_code=503, content={"error": "no search index, run `python init_db.py migrate`"})
+        raise db_error(e)
+    except (sqlite3.Error, PoolTimeout) as e:
+        raise db_error(e)
+    return with_validators(FastJSONResponse(content={"results": results}), "GET", if_none_match, etag, "search")
+
+
+def search_from_pool(*args):
+    with DB_POOL.connection() as conn:
+        return search_components(conn, *args)
+
+
+#-------------------component listings--------------
+#one page at a time with a cursor, or every row from the cursor on as ndjson read a page at a time;
+#either way a request holds at most `limit` rows, see listing.py for the keyset queries
+#GET /components/gpus?slot=pcie%204.0&sort=price&limit=50  ->  {"items": [...], "next_cursor": "..."}
+@app.get("/components/{type}")
+async def list_components(type: ComponentType, filters: ListingFilters = Depends(), sort: ListSort = ListSort.price,
+                          order: SortOrder = SortOrder.asc, limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          cursor: Optional[str] = None, format: ListFormat = ListFormat.json,
+                          if_none_match: Optional[str] = Header(None)):
+    await refresh_catalog()
+    given = filters.model_dump(exclude_none=True)
+    descending = order == SortOrder.desc
+    etag = catalog_etag("components", type.value, sorted(given.items()), sort.value, order.value, limit, cursor, format.value)
+    if etag_matches(if_none_match, etag):
+        return not_modified("GET", etag, "components")
     try:
-        components_required_watts += int(components_required_watts * 0.10)
-        print(components_required_watts)
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM psus WHERE watt_output <= ? "      
-        cursor.execute( query, (f"{components_required_watts}",))
-        
-      
-        psu = cursor.fetchall()
-        result = [dict(row) for row in psu]
-
-        print(f"Fetched PSU: {result}")
-        conn.close()
-
-        if result:
-            return {"gpu": result}
-        raise HTTPException(status_code=404, detail="GPU not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-    
-
-#Test Fetching case test
-@app.get("/user_input/case/{recommeded_case}")
-def test_mobo_for_cpu(mobo_form_factor:str, pref_size):
+        after = decode_cursor(cursor, sort.value, descending) if cursor else None
+        #checks the sort and the filters apply to this type before anything is sent
+        page_query(type.value, sort.value, descending, given, after, limit)
+    except ListingError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    if format == ListFormat.ndjson:
+        stream = StreamingResponse(stream_components(type.value, sort.value, descending, given, after, limit),
+                                   media_type="application/x-ndjson")
+        return with_validators(stream, "GET", if_none_match, etag, "components")
     try:
-        
-    
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-       
-       #query
-        query = "SELECT * FROM cases WHERE form_factor_compatability LIKE ? AND case_size LIKE ? "      
-        cursor.execute( query, (f"%{mobo_form_factor}%",f"%{pref_size}%"))
-        
-      
-        gpu = cursor.fetchall()
-        result = [dict(row) for row in gpu]
-
-        print(f"Fetched compatible case: {result}")
-        conn.close()
-
-        if result:
-            return {"case": result}
-        raise HTTPException(status_code=404, detail="case not found")
-    
-    except sqlite3.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        items, more = await run_in_threadpool(read_page_from_pool, type.value, sort.value, descending, given, after, limit)
+    except (sqlite3.Error, PoolTimeout) as e:
+        raise db_error(e)
+    next_cursor = encode_cursor(sort.value, descending, page_key(sort.value, items[-1])) if more else None
+    return with_validators(FastJSONResponse(content={"items": items, "next_cursor": next_cursor}), "GET", if_none_match, etag,
+                           "components")
+
+
+def read_page_from_pool(*args):
+    with DB_POOL.connection() as conn:
+        return read_page(conn, *args)
+
+
+#each page is its own query on a connection checked out just for it, a slow reader never holds one
+def stream_components(table: str, sort: str, descending: bool, filters: dict, after, page_size: int):
+    while True:
+        try:
+            with DB_POOL.connection() as conn:
+                rows, more = read_page(conn, table, sort, descending, filters, after, page_size)
+        except (sqlite3.Error, PoolTimeout):
+            #the status line is already sent, the client sees the stream end early
+            log.exception("component listing stream failed", extra={"table": table})
+            return
+        for row in rows:
+            yield dumps(row) + b"\n"
+        if not more:
+            return
+        after = page_key(sort, rows[-1])
+
+
+#prometheus text format: per stage latency histograms and counters, plus the pool and cache numbers
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    lines = BUILD_METRICS.render()
+    lines += render_stats("db_pool", DB_POOL.stats())
+    lines += render_stats("build_cache", BUILD_CACHE.stats())
+    lines += render_stats("precomputed_builds", {"loaded": len(PRECOMPUTED)})
+    lines += render_stats("build_coalescing", BUILD_FLIGHTS.stats())
+    lines += render_stats("http", CONDITIONAL.stats())
+    lines += render_stats("admission", {**ADMISSION.stats(), "rate_limited_clients": len(RATE_LIMITS)})
+    lines += render_histograms("admission_duration_seconds", "Time admitted requests waited for a slot and then took to serve.",
+                               "phase", {"queue_wait": ADMISSION.queue_wait, "service": ADMISSION.service})
+    lines += render_stats("log", LOGGING.stats())
+    lines += render_stats("catalog", {"components": len(CATALOG) if CATALOG is not None else 0,
+                                      "generation": CATALOG_GENERATION, "version": CATALOG_VERSION or 0})
+    if SHARED_CATALOG is not None:
+        lines += render_stats("shared_catalog", SHARED_CATALOG.stats())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+#connection pool checkouts, waits and timeouts
+@app.get("/stats/db_pool")
+def db_pool_stats():
+    return DB_POOL.stats()
+
+
+#build cache hits, misses and evictions
+@app.get("/stats/build_cache")
+def build_cache_stats():
+    return BUILD_CACHE.stats()
     
 
-#-------------------to test code thhat interacts with database easily end --------------
 
 
 
@@ -0,0 +1,209 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+#-------------------load generator--------------
+#replays a request mix against a running server from `concurrency` threads, each on its own keep alive
+#connection, and reports throughput and latency percentiles overall and per path; stdlib only
+#every line of the mix file is {"method": "POST", "path": "/get_user_build", "body": {...}, "weight": 1}
+#python benchmarks/loadgen.py --start-server --concurrency 16 --duration 20
+#python benchmarks/loadgen.py --url http://127.0.0.1:8001 --mix benchmarks/requests.jsonl --requests 5000
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_MIX = BENCH_DIR / "requests.jsonl"
+
+
+def load_mix(path):
+    mix = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if "path" not in entry:
+                raise ValueError(f"{path}:{line_no}: every request needs a path")
+            mix.append((entry.get("method", "POST" if "body" in entry else "GET"), entry["path"],
+                        json.dumps(entry["body"]).encode() if "body" in entry else None, entry.get("weight", 1)))
+    if not mix:
+        raise ValueError(f"{path} has no requests")
+    return mix
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LoadRun:
+    def __init__(self, url: str, mix: list, concurrency: int, duration: float, total: int, seed: int):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.mix = mix
+        self.weights = [weight for *_, weight in mix]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total = total
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.issued = 0
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    #True while this worker should send another request
+    def claim(self, deadline) -> bool:
+        with self.lock:
+            if self.total and self.issued >= self.total:
+                return False
+            if not self.total and time.perf_counter() >= deadline:
+                return False
+            self.issued += 1
+            return True
+
+    def worker(self, n: int, deadline: float):
+        rng = random.Random(self.seed + n)
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        latencies = defaultdict(list)
+        statuses, errors = Counter(), Counter()
+        while self.claim(deadline):
+            method, path, body, _ = rng.choices(self.mix, weights=self.weights)[0]
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                latencies[path].append(time.perf_counter() - started)
+                statuses[response.status] += 1
+            except (OSError, http.client.HTTPException) as e:
+                errors[type(e).__name__] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        conn.close()
+        with self.lock:
+            for path, samples in latencies.items():
+                self.latencies[path].extend(samples)
+            self.statuses.update(statuses)
+            self.errors.update(errors)
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration
+        threads = [threading.Thread(target=self.worker, args=(n, deadline), daemon=True) for n in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        every = [sample for samples in self.latencies.values() for sample in samples]
+
+        def summary(samples):
+            return {
+                "requests": len(samples),
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+                "max_ms": round(max(samples) * 1000, 3),
+            }
+
+        return {
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(len(every) / elapsed, 1) if elapsed else 0.0,
+            "statuses": dict(self.statuses),
+            "errors": dict(self.errors),
+            "overall": summary(every) if every else None,
+            "paths": {path: summary(samples) for path, samples in sorted(self.latencies.items())},
+        }
+
+
+#a uvicorn child on the --url port, stopped when the run is over
+def start_server(port: int, db=None):
+    env = dict(os.environ)
+    if db:
+        env["COMPONENTS_DB"] = str(Path(db).resolve())
+    #the whole load comes from this one host, only the in flight and queue limits stay on (see admission.py)
+    env.setdefault("RATE_LIMIT", "0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port), "--log-level", "warning"],
+        cwd=str(BENCH_DIR.parent), env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before it started serving")
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start within 30s")
+
+
+def print_report(report: dict):
+    print(f"concurrency {report['concurrency']}  {report['elapsed_s']}s  {report['rps']} req/s  "
+          f"statuses {report['statuses']}  errors {report['errors']}")
+    print(f"{'path':48} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["paths"].items())
+    if report["overall"]:
+        rows.append(("(all)", report["overall"]))
+    for path, s in rows:
+        print(f"{path:48} {s['requests']:>9} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay a request mix against the recommendation server")
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--mix", default=str(DEFAULT_MIX))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8],
+                        help="one run per value, e.g. --concurrency 1 4 16 64")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests instead of --duration")
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent (and not counted) before each run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-server", action="store_true", help="run uvicorn backend:app for the test")
+    parser.add_argument("--db", help="with --start-server, the components database the server uses")
+    parser.add_argument("--save", help="write the reports as json")
+    args = parser.parse_args()
+
+    mix = load_mix(args.mix)
+    server = None
+    if args.start_server:
+        port = urlsplit(args.url).port or 8001
+        server = start_server(port, args.db)
+    try:
+        reports = []
+        for concurrency in args.concurrency:
+            if args.warmup:
+                LoadRun(args.url, mix, min(concurrency, args.warmup), 0, args.warmup, args.seed).run()
+            run = LoadRun(args.url, mix, concurrency, args.duration, args.requests, args.seed)
+            report = run.report(run.run())
+            print_report(report)
+            reports.append(report)
+        if args.save:
+            Path(args.save).write_text(json.dumps(reports, indent=2))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
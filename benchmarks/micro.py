@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import build_summary
+from search import search_components
+
+
+#-------------------in process micro benchmarks--------------
+#times every fetch_* helper on the pooled sqlite path and get_user_build end to end through TestClient,
+#once per way it can be answered (build cache, precomputed row, in memory catalog, per request queries),
+#the search index, and the columnar catalog's masked selections when numpy is installed
+#python benchmarks/micro.py [--db benchmarks/data/components_x100.db] [--save out.json] [--compare base.json]
+SAMPLE_INPUT = {
+    "cpu_model": "Ryzen 7",
+    "case_size": "Mid Tower",
+    "cooling": "Air",
+    "pref_storage_type": "SSD",
+    "pref_storage_size": 1024,
+    "pref_memory_type": "DDR5",
+    "pref_memory_size": "32 GB",
+}
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+#run fn until `seconds` have passed (at least `min_runs` times), returns per call timings in microseconds
+def measure(fn, seconds: float, min_runs: int = 20):
+    samples = []
+    #anything a benchmark writes to stdout is not what is being measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        deadline = time.perf_counter() + seconds
+        while len(samples) < min_runs or time.perf_counter() < deadline:
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1e6)
+    return {
+        "runs": len(samples),
+        "mean_us": statistics.fmean(samples),
+        "p50_us": percentile(samples, 50),
+        "p95_us": percentile(samples, 95),
+        "p99_us": percentile(samples, 99),
+    }
+
+
+def benchmarks(backend, client):
+    cpu = backend.get_cpu(SAMPLE_INPUT["cpu_model"])["recommended_cpu"]
+    mobo = backend.get_mobo_with_cpu(cpu["socket_type"], SAMPLE_INPUT["case_size"])["recommended_mobo"]
+
+    def endpoint(reset):
+        def run():
+            reset()
+            response = client.post("/get_user_build", json=SAMPLE_INPUT)
+            assert response.status_code == 200, response.text
+        return run
+
+    def cache_hit():
+        pass
+
+    def precomputed():
+        backend.BUILD_CACHE.clear()
+
+    catalog, precomputed_rows = backend.CATALOG, backend.PRECOMPUTED
+    summary = build_summary(catalog.resolve(**SAMPLE_INPUT))
+    body = backend.encode_build(summary)
+
+    def from_catalog():
+        backend.BUILD_CACHE.clear()
+        backend.PRECOMPUTED = {}
+
+    def from_db():
+        from_catalog()
+        backend.CATALOG = None
+
+    def restore():
+        backend.CATALOG, backend.PRECOMPUTED = catalog, precomputed_rows
+
+    def search(q, *args, **kwargs):
+        with backend.DB_POOL.connection() as conn:
+            return search_components(conn, q, *args, **kwargs)
+
+    def root():
+        assert client.get("/").status_code == 200
+
+    cases = []
+    if hasattr(catalog, "stage_mask"):
+        #masks over whole tables of a columnar.ColumnarCatalog, what the solver and the alternatives run on
+        gpus = catalog.columns["gpus"]
+        cases += [
+            ("columnar.mask_gpu", lambda: catalog.stage_mask("gpu", mobo["gpu_socket"]), None),
+            #one of the solver's ranked stage lists: distinct compatible rows, cheapest first
+            ("columnar.ranked_gpus", lambda: gpus.take(gpus.order(catalog.stage_mask("gpu", mobo["gpu_socket"]) & gpus.distinct,
+                                                                  gpus.price)), None),
+        ]
+    return cases + [
+        ("fetch.get_cpu", lambda: backend.get_cpu(SAMPLE_INPUT["cpu_model"]), None),
+        ("fetch.get_mobo_with_cpu", lambda: backend.get_mobo_with_cpu(cpu["socket_type"], SAMPLE_INPUT["case_size"]), None),
+        ("fetch.fetch_gpu", lambda: backend.fetch_gpu(mobo["gpu_socket"]), None),
+        ("fetch.fetch_case", lambda: backend.fetch_case(mobo["form_factor"], SAMPLE_INPUT["case_size"]), None),
+        ("fetch.fetch_cooling", lambda: backend.fetch_cooling(mobo["socket_type"], SAMPLE_INPUT["cooling"]), None),
+        ("fetch.fetch_storage", lambda: backend.fetch_storage(SAMPLE_INPUT["pref_storage_type"], SAMPLE_INPUT["pref_storage_size"]), None),
+        ("fetch.fetch_memory", lambda: backend.fetch_memory(SAMPLE_INPUT["pref_memory_type"], SAMPLE_INPUT["pref_memory_size"]), None),
+        ("fetch.fetch_psu", lambda: backend.fetch_psu(600), None),
+        ("catalog.resolve", lambda: catalog.resolve(**SAMPLE_INPUT), None),
+        #what a build costs to send: encoding a freshly resolved one, and a cached or precomputed body as is
+        ("serialize.encode_build", lambda: backend.encode_build(summary), None),
+        ("serialize.stored_body", lambda: backend.raw_json(body), None),
+        #type ahead on the fts5 index, a short prefix and a narrower query with filters
+        ("search.prefix", lambda: search("ry"), None),
+        ("search.filtered", lambda: search("rtx 40", "gpus", max_price=60_000), None),
+        #what TestClient itself costs per request, the floor under every get_user_build number
+        ("endpoint.root", root, None),
+        ("get_user_build.cache_hit", endpoint(cache_hit), restore),
+        ("get_user_build.precomputed", endpoint(precomputed), restore),
+        ("get_user_build.catalog", endpoint(from_catalog), restore),
+        ("get_user_build.db", endpoint(from_db), restore),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="micro benchmarks for the recommendation pipeline")
+    parser.add_argument("--db", help="components database to benchmark against (default: components.db)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each benchmark")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="write the results as json")
+    parser.add_argument("--compare", help="json from an earlier --save to compare against")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["COMPONENTS_DB"] = str(Path(args.db).resolve())
+    #every request comes from one TestClient, the per client rate limit would turn most of them away
+    os.environ.setdefault("RATE_LIMIT", "0")
+    #imported late so COMPONENTS_DB is set before backend opens its pool
+    import backend
+    from fastapi.testclient import TestClient
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+    results = {}
+    with contextlib.ExitStack() as stack:
+        #startup prints what it loaded, keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            client = stack.enter_context(TestClient(backend.app))
+            cases = benchmarks(backend, client)
+        print(f"database: {backend.DATABASE_URL}")
+        print(f"{'benchmark':32} {'runs':>7} {'mean us':>10} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10}  vs base")
+        for name, fn, cleanup in cases:
+            if args.filter not in name:
+                continue
+            try:
+                result = measure(fn, args.seconds)
+            finally:
+                if cleanup:
+                    cleanup()
+            results[name] = result
+            change = ""
+            if name in baseline:
+                change = f"{(result['p50_us'] / baseline[name]['p50_us'] - 1) * 100:+.1f}%"
+            print(f"{name:32} {result['runs']:>7} {result['mean_us']:>10.1f} {result['p50_us']:>10.1f} "
+                  f"{result['p95_us']:>10.1f} {result['p99_us']:>10.1f}  {change}")
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import random
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import TABLES
+from init_db import DATABASE_URL, migrate, precompute_builds
+
+
+#-------------------scaled copies of components.db--------------
+#every component table is repeated `scale` times; the original rows stay first and unchanged so the
+#first match (what get_user_build returns) is the same build as in the real catalog, the copies get a
+#" #n" suffix on their name and a price jittered by +-20 percent so sorting, the solver and the
+#alternatives have real work to do
+#python benchmarks/synth_catalog.py 10 100 1000  ->  benchmarks/data/components_x10.db, ...
+DATA_DIR = Path(__file__).resolve().parent / "data"
+NAME_COLUMNS = ("name", "model")
+
+
+def scaled_path(scale: int) -> Path:
+    return DATA_DIR / f"components_x{scale}.db"
+
+
+def copy_database(source, target):
+    target.unlink(missing_ok=True)
+    src = sqlite3.connect(str(source))
+    dst = sqlite3.connect(str(target))
+    try:
+        src.backup(dst)
+        #scaled copies are written once and read many times, no WAL file next to them
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        src.close()
+        dst.close()
+
+
+def scale_table(conn, table: str, scale: int, rng: random.Random):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "id"]
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid").fetchall()
+    copies = []
+    for n in range(1, scale):
+        for row in rows:
+            values = dict(zip(columns, row))
+            for column in NAME_COLUMNS:
+                if column in values:
+                    values[column] = f"{values[column]} #{n}"
+            values["price"] = max(1, int(values["price"] * rng.uniform(0.8, 1.2)))
+            copies.append(tuple(values[column] for column in columns))
+    marks = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks})", copies)
+    return len(rows) + len(copies)
+
+
+def build_scaled(scale: int, source=DATABASE_URL, seed: int = 0, precompute: bool = False) -> Path:
+    DATA_DIR.mkdir(exist_ok=True)
+    target = scaled_path(scale)
+    copy_database(source, target)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(str(target))
+    try:
+        with conn:
+            #the version triggers would fire once per copied row, the final migrate() sets things straight anyway
+            triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+            for name, _ in triggers:
+                conn.execute(f"DROP TRIGGER {name}")
+            conn.execute("DELETE FROM precomputed_builds")
+            conn.execute("DELETE FROM build_dependencies")
+            for table in TABLES:
+                count = scale_table(conn, table, scale, rng)
+                print(f"{target.name} {table}: {count} rows")
+            for _, sql in triggers:
+                conn.execute(sql)
+    finally:
+        conn.close()
+    migrate(target)
+    if precompute:
+        precompute_builds(target)
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write scaled copies of components.db for benchmarking")
+    parser.add_argument("scales", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("--source", default=str(DATABASE_URL))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--precompute", action="store_true", help="also fill precomputed_builds")
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        build_scaled(scale, args.source, args.seed, args.precompute)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Set
+
+
+#-------------------recommendation result cache--------------
+#LRU with a time to live, keyed on the normalized user input (see catalog.input_key)
+#entries can carry dependency tags (see catalog.DependencyRecorder) so a changed component only drops the
+#builds that used it; a database change that can't be mapped to tags still drops the whole cache
+_MISSING = object()
+
+
+class BuildCache:
+    def __init__(self, max_entries: int = 4096, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        #tag -> keys of the entries carrying it
+        self._tagged: Dict[Hashable, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.fingerprint = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.targeted_invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, _ = entry
+            if expires_at <= now:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            tags = frozenset(tags)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    #remove one entry and its tag references, caller holds the lock
+    def _drop(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    #drop the entries carrying any of the tags, returns how many went
+    def invalidate(self, tags) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tagged.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            self.targeted_invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    #True if the data the entries came from has changed; then everything is dropped unless clear=False,
+    #where the caller invalidates just what changed
+    def check_fingerprint(self, fingerprint, clear: bool = True) -> bool:
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return False
+            changed = self.fingerprint is not None
+            self.fingerprint = fingerprint
+        if changed and clear:
+            self.clear()
+        return changed
+
+    #the next check_fingerprint reports a change whatever it is given
+    def forget_fingerprint(self):
+        with self._lock:
+            self.fingerprint = ()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "targeted_invalidations": self.targeted_invalidations,
+                "tags": len(self._tagged),
+            }
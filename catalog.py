@@ -0,0 +1,582 @@
+import json
+import sqlite3
+from bisect import bisect_left
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+#-------------------in memory component catalog--------------
+#the component tables almost never change so we load all of them once and answer
+#build lookups from dicts instead of opening a connection and querying per request
+#every index keeps rows in table order so the first match is the same row the sql path returns
+#compatibility follows the normalized join tables built by init_db.py (same key functions below)
+
+
+class ComponentNotFound(LookupError):
+    def __init__(self, stage: str, detail: str):
+        super().__init__(f"{stage} not found: {detail}")
+        self.stage = stage
+        self.detail = detail
+
+
+#helpers to turn the free text columns into lookup keys
+def norm(value) -> str:
+    return str(value).strip().lower()
+
+
+def split_list(value) -> List[str]:
+    #compatibility columns are stored like 'LGA1700, AM4, AM5'
+    if value is None:
+        return []
+    return [norm(part) for part in str(value).split(",") if part.strip()]
+
+
+#cases list form factors by their long names, motherboards use the short ones
+FORM_FACTOR_ALIASES = {
+    "micro-atx": "matx",
+    "micro atx": "matx",
+    "mini-itx": "itx",
+    "mini itx": "itx",
+    "eatx": "e-atx",
+}
+
+
+def form_factor_key(value) -> str:
+    key = norm(value)
+    return FORM_FACTOR_ALIASES.get(key, key)
+
+
+def form_factor_keys(value) -> List[str]:
+    return [FORM_FACTOR_ALIASES.get(key, key) for key in split_list(value)]
+
+
+def series_keys(series) -> List[str]:
+    #GUI sends "i7" for "Core i7" and "Ryzen 7" for "Ryzen 7" so index the full series and each word
+    full = norm(series)
+    keys = [full]
+    for word in full.split():
+        if word not in keys:
+            keys.append(word)
+    return keys
+
+
+#canonical form of a UserComponentInput: two inputs with the same key always resolve to the same build
+def input_key(cpu_model, case_size, cooling, pref_storage_type, pref_storage_size, pref_memory_type, pref_memory_size) -> tuple:
+    return (norm(cpu_model), norm(case_size), norm(cooling), norm(pref_storage_type), int(pref_storage_size),
+            norm(pref_memory_type), norm(pref_memory_size))
+
+
+#input_key as a single string, how it is stored in precomputed_builds
+def key_text(key: tuple) -> str:
+    return "|".join(str(part) for part in key)
+
+
+#cheap change detector for components.db: size and mtime of the file and its WAL (writes land in the WAL first)
+#an empty WAL is the same as no WAL, readers create one just by opening the database
+def db_fingerprint(db_path) -> tuple:
+    fingerprint = []
+    for path in (Path(db_path), Path(f"{db_path}-wal")):
+        try:
+            st = path.stat()
+            fingerprint.append((st.st_mtime_ns, st.st_size) if st.st_size else None)
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+#-------------------typed rows--------------
+@dataclass(frozen=True, slots=True)
+class Cpu:
+    id: int
+    brand: str
+    series: str
+    name: str
+    socket_type: str
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Motherboard:
+    id: int
+    name: str
+    socket_type: str
+    form_factor: str
+    gpu_socket: str
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Gpu:
+    id: int
+    brand: str
+    model: str
+    compatible_sockets: str
+    form_factor: str
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Case:
+    id: int
+    case_size: str
+    form_factor_compatability: str
+    name: str
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Cooler:
+    id: int
+    name: str
+    cooling_type: str
+    compatible_sockets: str
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Storage:
+    id: int
+    storage_type: str
+    capacity: int
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Memory:
+    id: int
+    size: str
+    ram_type: str
+    required_watt: int
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class Psu:
+    id: int
+    name: str
+    certification: str
+    form_factor: str
+    watt_output: int
+    price: int
+
+
+#table name -> row type, in the order get_user_build resolves them
+TABLES = {
+    "cpus": Cpu,
+    "motherboards": Motherboard,
+    "gpus": Gpu,
+    "cases": Case,
+    "cooling_systems": Cooler,
+    "storage": Storage,
+    "ram": Memory,
+    "psus": Psu,
+}
+
+
+def load_rows(conn, table: str, row_type):
+    #ids in components.db are NULL (INT AUTO_INCREMENT is not a rowid alias in sqlite) so fall back to rowid
+    columns = [f.name for f in fields(row_type) if f.name != "id"]
+    query = f"SELECT COALESCE(id, rowid), {', '.join(columns)} FROM {table} ORDER BY rowid"
+    return [row_type(*row) for row in conn.execute(query)]
+
+
+def index_by(rows, keys_of) -> Dict:
+    #one row can sit under several keys (e.g. every socket a cooler supports)
+    index: Dict = {}
+    for row in rows:
+        for key in keys_of(row):
+            index.setdefault(key, []).append(row)
+    return index
+
+
+#the bundle of components get_user_build returns
+@dataclass(frozen=True, slots=True)
+class BuildParts:
+    cpu: Cpu
+    mobo: Motherboard
+    gpu: Gpu
+    case: Case
+    cooling: Cooler
+    storage: Storage
+    memory: Memory
+    psu: Psu
+
+
+class Catalog:
+    def __init__(self, tables: Dict[str, list]):
+        self.tables = tables
+        self.cpus: List[Cpu] = tables["cpus"]
+        self.motherboards: List[Motherboard] = tables["motherboards"]
+        self.gpus: List[Gpu] = tables["gpus"]
+        self.cases: List[Case] = tables["cases"]
+        self.coolers: List[Cooler] = tables["cooling_systems"]
+        self.storage: List[Storage] = tables["storage"]
+        self.memory: List[Memory] = tables["ram"]
+        self.psus: List[Psu] = tables["psus"]
+
+        self.cpus_by_series = index_by(self.cpus, lambda r: series_keys(r.series))
+        self.gpus_by_slot = index_by(self.gpus, lambda r: split_list(r.compatible_sockets))
+        self.cases_by_form_factor = index_by(
+            self.cases, lambda r: [(ff, norm(r.case_size)) for ff in form_factor_keys(r.form_factor_compatability)]
+        )
+        self.coolers_by_socket = index_by(
+            self.coolers, lambda r: [(socket, norm(r.cooling_type)) for socket in split_list(r.compatible_sockets)]
+        )
+        self.storage_by_type = index_by(self.storage, lambda r: [(norm(r.storage_type), int(r.capacity))])
+        self.memory_by_type = index_by(self.memory, lambda r: [(norm(r.ram_type), norm(r.size))])
+
+        #a motherboard is only useful if some case of the wanted size takes its form factor,
+        #so boards are also indexed by (socket, case size) for every size they fit
+        case_sizes = {norm(case.case_size) for case in self.cases}
+        self.mobos_by_socket = index_by(self.motherboards, lambda r: [norm(r.socket_type)])
+        self.mobos_by_socket_and_size = index_by(
+            self.motherboards,
+            lambda r: [(norm(r.socket_type), size) for size in case_sizes
+                       if (form_factor_key(r.form_factor), size) in self.cases_by_form_factor],
+        )
+
+        #psus are picked as the first row in table order with enough watts, so only rows that beat
+        #every earlier row's wattage can ever be picked; their wattages are increasing and can be bisected
+        self.psu_steps: List[Psu] = []
+        for psu in self.psus:
+            if not self.psu_steps or psu.watt_output > self.psu_steps[-1].watt_output:
+                self.psu_steps.append(psu)
+        self.psu_step_watts = [psu.watt_output for psu in self.psu_steps]
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.tables.values())
+
+    #-------------------lookups--------------
+    def cpu(self, cpu_model: str) -> Cpu:
+        rows = self.cpus_by_series.get(norm(cpu_model))
+        if not rows:
+            raise ComponentNotFound("CPU", cpu_model)
+        return rows[0]
+
+    def mobo_for_socket(self, socket_type: str, case_size: Optional[str] = None) -> Motherboard:
+        if case_size is None:
+            rows = self.mobos_by_socket.get(norm(socket_type))
+        else:
+            rows = self.mobos_by_socket_and_size.get((norm(socket_type), norm(case_size)))
+        if not rows:
+            fits = f" that fits a {case_size} case" if case_size is not None else ""
+            raise ComponentNotFound("motherboard", f"{socket_type}{fits}")
+        return rows[0]
+
+    def gpu_for_slot(self, gpu_socket: str) -> Gpu:
+        rows = self.gpus_by_slot.get(norm(gpu_socket))
+        if not rows:
+            raise ComponentNotFound("GPU", gpu_socket)
+        return rows[0]
+
+    def case_for(self, form_factor: str, case_size: str) -> Case:
+        rows = self.cases_by_form_factor.get((form_factor_key(form_factor), norm(case_size)))
+        if not rows:
+            raise ComponentNotFound("case", f"{case_size} for {form_factor}")
+        return rows[0]
+
+    def cooler_for(self, socket_type: str, cooling_type: str) -> Cooler:
+        rows = self.coolers_by_socket.get((norm(socket_type), norm(cooling_type)))
+        if not rows:
+            raise ComponentNotFound("cooling", f"{cooling_type} for {socket_type}")
+        return rows[0]
+
+    def storage_for(self, storage_type: str, capacity: int) -> Storage:
+        rows = self.storage_by_type.get((norm(storage_type), int(capacity)))
+        if not rows:
+            raise ComponentNotFound("storage", f"{storage_type} {capacity} GB")
+        return rows[0]
+
+    def memory_for(self, ram_type: str, size: str) -> Memory:
+        rows = self.memory_by_type.get((norm(ram_type), norm(size)))
+        if not rows:
+            raise ComponentNotFound("memory", f"{ram_type} {size}")
+        return rows[0]
+
+    def psu_for(self, required_watts: int) -> Psu:
+        i = bisect_left(self.psu_step_watts, required_watts)
+        if i == len(self.psu_steps):
+            raise ComponentNotFound("PSU", f"{required_watts} W")
+        return self.psu_steps[i]
+
+    #same selection as the sql path in get_user_build, just without the database
+    #every lookup goes through run(stage, lookup, *args) so a caller can time them (metrics.StageMetrics.run)
+    def resolve(self, cpu_model: str, case_size: str, cooling: str, pref_storage_type: str,
+                pref_storage_size: int, pref_memory_type: str, pref_memory_size: str, run=None) -> BuildParts:
+        run = run or call_stage
+        cpu = run("cpu", self.cpu, cpu_model)
+        mobo = run("mobo", self.mobo_for_socket, cpu.socket_type, case_size)
+        gpu = run("gpu", self.gpu_for_slot, mobo.gpu_socket)
+        case = run("case", self.case_for, mobo.form_factor, case_size)
+        cooler = run("cooling", self.cooler_for, mobo.socket_type, cooling)
+        storage = run("storage", self.storage_for, pref_storage_type, pref_storage_size)
+        memory = run("memory", self.memory_for, pref_memory_type, pref_memory_size)
+        psu = run("psu", self.psu_for, psu_watts(cpu, mobo, gpu, cooler, storage, memory))
+        return BuildParts(cpu, mobo, gpu, case, cooler, storage, memory, psu)
+
+
+#the plain way of running a resolve stage
+def call_stage(stage: str, lookup, *args):
+    return lookup(*args)
+
+
+#-------------------what a build depends on--------------
+#a build depends on every row it contains (their names, prices and watts are in it) and on every lookup it
+#made (a new, removed or re-keyed row can change which row a lookup picks); both are kept as tags,
+#(table, "id:<row id>") and (table, "key:<lookup key>"), so a changed row maps straight to the builds it
+#can affect; lookup keys are coarser than the lookups themselves, which only ever invalidates a bit more
+STAGE_TABLES = {
+    "cpu": "cpus",
+    "mobo": "motherboards",
+    "gpu": "gpus",
+    "case": "cases",
+    "cooling": "cooling_systems",
+    "storage": "storage",
+    "memory": "ram",
+    "psu": "psus",
+}
+
+#the columns lookups select on, a change to any other column only matters to builds containing the row
+LOOKUP_COLUMNS = {
+    "cpus": ("series",),
+    "motherboards": ("socket_type", "form_factor"),
+    "gpus": ("compatible_sockets",),
+    "cases": ("case_size", "form_factor_compatability"),
+    "cooling_systems": ("cooling_type", "compatible_sockets"),
+    "storage": ("storage_type", "capacity"),
+    "ram": ("ram_type", "size"),
+    "psus": ("watt_output",),
+}
+
+
+def row_tag(table: str, row_id) -> tuple:
+    return (table, f"id:{row_id}")
+
+
+def key_tag(table: str, key) -> tuple:
+    return (table, f"key:{key}")
+
+
+#the lookup keys one resolve stage used, from the arguments it was called with
+def stage_lookup_tags(stage: str, args: tuple) -> List[tuple]:
+    if stage == "cpu":
+        return [key_tag("cpus", norm(args[0]))]
+    if stage == "mobo":
+        #which boards count depends on the cases of the wanted size too
+        tags = [key_tag("motherboards", norm(args[0]))]
+        if len(args) > 1 and args[1] is not None:
+            tags.append(key_tag("cases", norm(args[1])))
+        return tags
+    if stage == "gpu":
+        return [key_tag("gpus", norm(args[0]))]
+    if stage == "case":
+        return [key_tag("cases", norm(args[1]))]
+    if stage == "cooling":
+        return [key_tag("cooling_systems", norm(args[1]))]
+    if stage == "storage":
+        return [key_tag("storage", f"{norm(args[0])}|{int(args[1])}")]
+    if stage == "memory":
+        return [key_tag("ram", f"{norm(args[0])}|{norm(args[1])}")]
+    #any psu change can move the first psu with enough watts, every psu lookup shares one key
+    return [key_tag("psus", "any")]
+
+
+#the lookup keys a row answers to, the same keys stage_lookup_tags produces
+def row_lookup_keys(table: str, row: dict) -> List[str]:
+    if table == "cpus":
+        return series_keys(row["series"])
+    if table == "motherboards":
+        return [norm(row["socket_type"])]
+    if table == "gpus":
+        return split_list(row["compatible_sockets"])
+    if table == "cases":
+        return [norm(row["case_size"])]
+    if table == "cooling_systems":
+        return [norm(row["cooling_type"])]
+    if table == "storage":
+        return [f"{norm(row['storage_type'])}|{int(row['capacity'] or 0)}"]
+    if table == "ram":
+        return [f"{norm(row['ram_type'])}|{norm(row['size'])}"]
+    return ["any"]
+
+
+#tags of the builds one change can affect; old is None for an insert, new is None for a delete
+def change_tags(table: str, row_id, old: Optional[dict], new: Optional[dict]) -> set:
+    tags = {row_tag(table, row_id)}
+    if old is not None and new is not None and all(old[c] == new[c] for c in LOOKUP_COLUMNS[table]):
+        return tags
+    for row in (old, new):
+        if row is not None:
+            tags.update(key_tag(table, key) for key in row_lookup_keys(table, row))
+    return tags
+
+
+#catalog rows are dataclasses, the sql path returns {"recommended_x": row dict}
+def component_id(found) -> int:
+    if isinstance(found, dict):
+        return next(iter(found.values()))["id"]
+    return found.id
+
+
+#a `run` hook for Catalog.resolve (and the sql path) that collects the tags of the build being resolved,
+#wrapping another hook (metrics) if given; the lookup tags are kept even when the stage finds nothing
+class DependencyRecorder:
+    def __init__(self, run=None):
+        self.run_stage = run or call_stage
+        self.tags = set()
+
+    def run(self, stage: str, lookup, *args):
+        self.tags.update(stage_lookup_tags(stage, args))
+        found = self.run_stage(stage, lookup, *args)
+        self.tags.add(row_tag(STAGE_TABLES[stage], component_id(found)))
+        return found
+
+
+#-------------------change log--------------
+#component_changes is filled by triggers (init_db.changelog_triggers), one row per insert, update or delete
+#with the lookup columns before and after; build_dependencies holds the tags of every precomputed build
+
+#(seq, table, row id, old, new) after `seq`, or None when entries after it were already pruned
+def read_changes(conn, after_seq: int) -> Optional[list]:
+    pruned = conn.execute("SELECT value FROM catalog_meta WHERE key = 'changelog_pruned_seq'").fetchone()
+    if pruned is not None and after_seq < pruned[0]:
+        return None
+    rows = conn.execute(
+        "SELECT seq, component_table, component_id, old_row, new_row FROM component_changes WHERE seq > ? ORDER BY seq",
+        (after_seq,),
+    ).fetchall()
+    return [(seq, table, row_id, json.loads(old) if old else None, json.loads(new) if new else None)
+            for seq, table, row_id, old, new in rows]
+
+
+def changed_tags(changes) -> set:
+    tags = set()
+    for _, table, row_id, old, new in changes:
+        tags |= change_tags(table, row_id, old, new)
+    return tags
+
+
+#precomputed input keys that depend on any of the tags
+def dependent_keys(conn, tags) -> set:
+    keys = set()
+    for table, dependency in tags:
+        keys.update(row[0] for row in conn.execute(
+            "SELECT input_key FROM build_dependencies WHERE component_table = ? AND dependency = ?", (table, dependency)
+        ))
+    return keys
+
+
+def last_change_seq(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM component_changes").fetchone()[0]
+
+
+#bumped by a trigger on every write to a component table (init_db.version_triggers)
+def catalog_version(conn) -> int:
+    return conn.execute("SELECT value FROM catalog_meta WHERE key = 'catalog_version'").fetchone()[0]
+
+
+#bumped by every publish of a whole new catalog (init_db.publish), 0 for a database that was never published
+def catalog_generation(conn) -> int:
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'catalog_generation'").fetchone()
+    return row[0] if row is not None else 0
+
+
+#-------------------batches--------------
+#memo entry for a lookup that found nothing
+NOT_FOUND = object()
+
+
+#resolves many inputs against one catalog; every stage (cpu for a series, board for a socket and case size,
+#gpu for a slot, ...) is looked up once per distinct normalized argument and reused by every input that needs
+#it, not found answers included
+class BatchResolver:
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.memo: Dict[tuple, object] = {}
+
+    #`key` is what the lookup normalizes `args` to, the lookup itself gets the caller's own args so a
+    #ComponentNotFound reads exactly like Catalog.resolve's for the same input
+    def stage(self, lookup: str, key: tuple, *args):
+        memo_key = (lookup,) + key
+        found = self.memo.get(memo_key)
+        if found is None:
+            try:
+                found = self.memo[memo_key] = getattr(self.catalog, lookup)(*args)
+            except ComponentNotFound:
+                self.memo[memo_key] = NOT_FOUND
+                raise
+        if found is NOT_FOUND:
+            #known to miss, asked again only for the message in this caller's words (one dict miss)
+            return getattr(self.catalog, lookup)(*args)
+        return found
+
+    #Catalog.resolve with every lookup shared by the inputs that normalize alike, so "I7" and "i7 " share one
+    def resolve(self, cpu_model: str, case_size: str, cooling: str, pref_storage_type: str,
+                pref_storage_size: int, pref_memory_type: str, pref_memory_size: str) -> BuildParts:
+        size = norm(case_size) if case_size is not None else None
+        cpu = self.stage("cpu", (norm(cpu_model),), cpu_model)
+        mobo = self.stage("mobo_for_socket", (norm(cpu.socket_type), size), cpu.socket_type, case_size)
+        gpu = self.stage("gpu_for_slot", (norm(mobo.gpu_socket),), mobo.gpu_socket)
+        case = self.stage("case_for", (form_factor_key(mobo.form_factor), size), mobo.form_factor, case_size)
+        cooler = self.stage("cooler_for", (norm(mobo.socket_type), norm(cooling)), mobo.socket_type, cooling)
+        storage = self.stage("storage_for", (norm(pref_storage_type), int(pref_storage_size)), pref_storage_type,
+                             pref_storage_size)
+        memory = self.stage("memory_for", (norm(pref_memory_type), norm(pref_memory_size)), pref_memory_type,
+                            pref_memory_size)
+        watts = psu_watts(cpu, mobo, gpu, cooler, storage, memory)
+        psu = self.stage("psu_for", (watts,), watts)
+        return BuildParts(cpu, mobo, gpu, case, cooler, storage, memory, psu)
+
+    def stats(self):
+        return {"distinct_lookups": len(self.memo)}
+
+
+#psu headroom used everywhere: components' watts plus 10 percent
+def psu_watts(*parts) -> int:
+    required_watts = sum(int(part.required_watt) for part in parts)
+    return required_watts + int(required_watts * 0.10)
+
+
+#the 17 fields of RecommendedBuildForUser from a resolved set of parts
+def build_summary(parts: BuildParts) -> Dict[str, object]:
+    summary = {
+        "recommended_cpu_name": str(parts.cpu.name),
+        "recommended_cpu_price": parts.cpu.price,
+        "recommended_gpu_name": str(parts.gpu.model),
+        "recommended_gpu_price": parts.gpu.price,
+        "recommended_mobo_name": str(parts.mobo.name),
+        "recommended_mobo_price": parts.mobo.price,
+        "recommended_psu_name": str(parts.psu.name),
+        "recommended_psu_price": parts.psu.price,
+        "recommended_case_name": str(parts.case.name),
+        "recommended_case_price": parts.case.price,
+        "recommended_cooling_name": str(parts.cooling.name),
+        "recommended_cooling_price": parts.cooling.price,
+        "recommended_storage_name": f"{parts.storage.storage_type} {parts.storage.capacity} GB Storage",
+        "recommended_storage_price": parts.storage.price,
+        "recommended_memory_name": f"{parts.memory.ram_type} {parts.memory.size} Memory",
+        "recommended_memory_price": parts.memory.price,
+    }
+    summary["recommended_total_cost"] = sum(
+        part.price for part in (parts.cpu, parts.mobo, parts.gpu, parts.cooling, parts.storage, parts.memory, parts.psu, parts.case)
+    )
+    return summary
+
+
+#load every component table through one connection
+def read_catalog(conn) -> Catalog:
+    return Catalog({table: load_rows(conn, table, row_type) for table, row_type in TABLES.items()})
+
+
+def load_catalog(db_path) -> Catalog:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return read_catalog(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,255 @@
+from typing import Dict, Optional
+
+from catalog import (Catalog, TABLES, form_factor_key, form_factor_keys, load_rows, norm, series_keys,
+                     split_list)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#-------------------columnar catalog--------------
+#the catalog's rows once more as numpy columns: price and watts as int64 arrays and every free text column the
+#lookups select on as integer codes, so "compatible, at most this price, at most these watts" is one boolean mask
+#over a whole table and ranking is a stable argsort
+#multi valued columns (the sockets a gpu or cooler takes, the form factors a case takes, a cpu's series keys)
+#are one boolean row per distinct value, so "takes this socket" is reading one row of that matrix
+#get_user_build's first match stays on the inherited dict lookups, a dict get beats any scan; the columns are for
+#the selections that have to look at every candidate: the budget solver's stage lists and the alternatives
+#numpy is optional, without it read_catalog hands back the plain Catalog
+
+
+#how each table is encoded: single valued columns -> key function, multi valued columns -> keys function,
+#the watts the row draws (a psu's is what it delivers) and what makes two rows interchangeable for the solver
+#(solver.SIGNATURES)
+COLUMN_SPECS: Dict[str, dict] = {
+    "cpus": {
+        "codes": {"brand": lambda r: norm(r.brand), "socket_type": lambda r: norm(r.socket_type)},
+        "members": {"series": lambda r: series_keys(r.series)},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: norm(r.socket_type),
+    },
+    "motherboards": {
+        "codes": {"socket_type": lambda r: norm(r.socket_type), "form_factor": lambda r: form_factor_key(r.form_factor),
+                  "gpu_socket": lambda r: norm(r.gpu_socket)},
+        "members": {},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: (norm(r.socket_type), norm(r.gpu_socket), form_factor_key(r.form_factor)),
+    },
+    "gpus": {
+        "codes": {},
+        "members": {"compatible_sockets": lambda r: split_list(r.compatible_sockets)},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: frozenset(split_list(r.compatible_sockets)),
+    },
+    "cases": {
+        "codes": {"case_size": lambda r: norm(r.case_size)},
+        "members": {"form_factor_compatability": lambda r: form_factor_keys(r.form_factor_compatability)},
+        "watts": lambda r: 0,
+        "signature": lambda r: frozenset(form_factor_keys(r.form_factor_compatability)),
+    },
+    "cooling_systems": {
+        "codes": {"cooling_type": lambda r: norm(r.cooling_type)},
+        "members": {"compatible_sockets": lambda r: split_list(r.compatible_sockets)},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: frozenset(split_list(r.compatible_sockets)),
+    },
+    "storage": {
+        "codes": {"storage_type": lambda r: norm(r.storage_type), "capacity": lambda r: int(r.capacity)},
+        "members": {},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: (),
+    },
+    "ram": {
+        "codes": {"ram_type": lambda r: norm(r.ram_type), "size": lambda r: norm(r.size)},
+        "members": {},
+        "watts": lambda r: int(r.required_watt or 0),
+        "signature": lambda r: (),
+    },
+    "psus": {
+        "codes": {},
+        "members": {},
+        "watts": lambda r: int(r.watt_output or 0),
+        "signature": lambda r: (),
+    },
+}
+
+#resolve stage -> table
+STAGE_COLUMNS = {
+    "cpu": "cpus",
+    "mobo": "motherboards",
+    "gpu": "gpus",
+    "case": "cases",
+    "cooling": "cooling_systems",
+    "storage": "storage",
+    "memory": "ram",
+    "psu": "psus",
+}
+
+
+def encode(values: list, vocab: dict):
+    return np.fromiter((vocab.setdefault(value, len(vocab)) for value in values), np.int32, len(values))
+
+
+class ColumnTable:
+    def __init__(self, rows, price, watts, vocab: Dict[str, dict], codes: Dict[str, "np.ndarray"],
+                 members: Dict[str, "np.ndarray"], signature, distinct):
+        self.rows = rows
+        self.size = len(rows)
+        self.price = price
+        self.watts = watts
+        #column -> key -> code; a code is a value of codes[column] or a row of members[column]
+        self.vocab = vocab
+        self.codes = codes
+        self.members = members
+        self.signature = signature
+        #False for a row repeating an earlier one in everything but its id (solver.distinct_rows); such rows
+        #share every key with the earlier one so this holds within any lookup's candidates as well
+        self.distinct = distinct
+
+    def everything(self):
+        return np.ones(self.size, dtype=bool)
+
+    def nothing(self):
+        return np.zeros(self.size, dtype=bool)
+
+    #rows whose single valued column has this key
+    def eq(self, column: str, key):
+        code = self.vocab[column].get(key)
+        if code is None:
+            return self.nothing()
+        return self.codes[column] == code
+
+    #rows whose multi valued column contains this key
+    def has(self, column: str, key):
+        code = self.vocab[column].get(key)
+        if code is None:
+            return self.nothing()
+        return self.members[column][code]
+
+    #rows whose single valued column has any of the keys
+    def isin(self, column: str, keys):
+        codes = [self.vocab[column][key] for key in keys if key in self.vocab[column]]
+        return np.isin(self.codes[column], codes)
+
+    #positions of the matching rows by ascending value, table order among equal values
+    def order(self, mask, values):
+        positions = np.flatnonzero(mask)
+        return positions[np.argsort(values[positions], kind="stable")]
+
+    def take(self, positions) -> list:
+        rows = self.rows
+        return [rows[i] for i in positions.tolist()]
+
+
+def compile_table(rows: list, spec: dict) -> ColumnTable:
+    n = len(rows)
+    vocab: Dict[str, dict] = {}
+    codes = {}
+    for column, key_of in spec["codes"].items():
+        vocab[column] = {}
+        codes[column] = encode([key_of(r) for r in rows], vocab[column])
+    members = {}
+    for column, keys_of in spec["members"].items():
+        keys = vocab[column] = {}
+        pairs = [(keys.setdefault(key, len(keys)), i) for i, r in enumerate(rows) for key in keys_of(r)]
+        matrix = np.zeros((len(keys), n), dtype=bool)
+        if pairs:
+            codes_at, positions = np.array(pairs, dtype=np.int64).T
+            matrix[codes_at, positions] = True
+        members[column] = matrix
+    distinct = np.zeros(n, dtype=bool)
+    seen = set()
+    for i, r in enumerate(rows):
+        values = tuple(getattr(r, name) for name in r.__slots__ if name != "id")
+        if values not in seen:
+            seen.add(values)
+            distinct[i] = True
+    return ColumnTable(
+        rows,
+        np.fromiter((int(r.price) for r in rows), np.int64, n),
+        np.fromiter((spec["watts"](r) for r in rows), np.int64, n),
+        vocab, codes, members,
+        encode([spec["signature"](r) for r in rows], {}),
+        distinct,
+    )
+
+
+class ColumnarCatalog(Catalog):
+    def __init__(self, tables: Dict[str, list]):
+        super().__init__(tables)
+        self.columns: Dict[str, ColumnTable] = {table: compile_table(rows, COLUMN_SPECS[table]) for table, rows in tables.items()}
+
+    #the candidates of one resolve stage, called with the arguments Catalog.resolve passes that stage
+    def stage_mask(self, stage: str, *args):
+        columns = self.columns
+        if stage == "cpu":
+            return columns["cpus"].has("series", norm(args[0]))
+        if stage == "mobo":
+            boards = columns["motherboards"]
+            mask = boards.eq("socket_type", norm(args[0]))
+            if len(args) > 1 and args[1] is not None:
+                #form factors some case of the wanted size takes
+                cases = columns["cases"]
+                taken = cases.members["form_factor_compatability"][:, cases.eq("case_size", norm(args[1]))].any(axis=1)
+                vocab = cases.vocab["form_factor_compatability"]
+                mask = mask & boards.isin("form_factor", [key for key, code in vocab.items() if taken[code]])
+            return mask
+        if stage == "gpu":
+            return columns["gpus"].has("compatible_sockets", norm(args[0]))
+        if stage == "case":
+            cases = columns["cases"]
+            return cases.has("form_factor_compatability", form_factor_key(args[0])) & cases.eq("case_size", norm(args[1]))
+        if stage == "cooling":
+            coolers = columns["cooling_systems"]
+            return coolers.has("compatible_sockets", norm(args[0])) & coolers.eq("cooling_type", norm(args[1]))
+        if stage == "storage":
+            storage = columns["storage"]
+            return storage.eq("storage_type", norm(args[0])) & storage.eq("capacity", int(args[1]))
+        if stage == "memory":
+            ram = columns["ram"]
+            return ram.eq("ram_type", norm(args[0])) & ram.eq("size", norm(args[1]))
+        if stage == "psu":
+            psus = columns["psus"]
+            return psus.watts >= int(args[0])
+        raise ValueError(f"unknown stage {stage!r}")
+
+
+#drop the rows another row with the same signature beats on price, score and burden (solver.prune_dominated)
+#positions are into `table`; returns the kept positions in the order the loop version keeps them: groups by
+#first appearance, cheapest first within a group, then higher score, then lower burden
+def prune_dominated(table: ColumnTable, positions, score, burden):
+    if not len(positions):
+        return positions
+    signature = table.signature[positions]
+    _, first_seen, group = np.unique(signature, return_index=True, return_inverse=True)
+    group_rank = np.argsort(np.argsort(first_seen, kind="stable"), kind="stable")[group]
+    #scores as dense ranks, exact integer comparisons instead of float ones
+    _, score_rank = np.unique(score, return_inverse=True)
+    score_rank = score_rank.astype(np.int64) + 1
+    price = table.price[positions]
+    order = np.lexsort((np.arange(len(positions)), burden, -score_rank, price, group_rank))
+    group_sorted, score_sorted, burden_sorted = group_rank[order], score_rank[order], burden[order]
+
+    #a row is dominated when an earlier row of its group (not dearer) has no more burden and at least its score;
+    #per burden value: a running max of the scores of rows with at most that burden, restarted at every group
+    width = int(score_rank.max()) + 1
+    offset = group_sorted.astype(np.int64) * width
+    dominated = np.zeros(len(order), dtype=bool)
+    for value in np.unique(burden_sorted):
+        at = burden_sorted == value
+        running = np.maximum.accumulate(np.where(burden_sorted <= value, score_sorted, 0) + offset)
+        before = np.concatenate(([0], running[:-1])) - offset
+        dominated |= at & (before >= score_sorted)
+    return positions[order[~dominated]]
+
+
+#component tables through one connection, as numpy columns when numpy is there
+def read_catalog(conn) -> Catalog:
+    tables = {table: load_rows(conn, table, row_type) for table, row_type in TABLES.items()}
+    return ColumnarCatalog(tables) if np is not None else Catalog(tables)
+
+
+def columns_of(catalog: Catalog) -> Optional[ColumnarCatalog]:
+    return catalog if isinstance(catalog, ColumnarCatalog) else None
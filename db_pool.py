@@ -0,0 +1,141 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+#-------------------pooled sqlite connections--------------
+#FastAPI runs plain def endpoints on a threadpool, so connections are opened with check_same_thread=False
+#and handed between threads; a thread that already holds one (nested fetch_* calls) gets the same one back
+#the pool is bounded so a burst of requests waits for a connection instead of opening a new file handle each
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+#switch the database to WAL once so readers never block on a writer (the setting is stored in the file)
+def enable_wal(db_path) -> bool:
+    try:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0].lower() == "wal"
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_size: int = 8, timeout: float = 5.0, read_only: bool = True, wal: bool = True):
+        self.db_path = Path(db_path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.read_only = read_only
+        self.wal = enable_wal(self.db_path) if wal else False
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.in_use = 0
+
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                   check_same_thread=False, timeout=self.timeout)
+        else:
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _acquire(self):
+        started = None
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise PoolTimeout(f"no database connection free after {self.timeout}s ({self.max_size} in use)")
+        waited = time.perf_counter() - started if started is not None else 0.0
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except BaseException:
+                self._slots.release()
+                raise
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            if started is not None:
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return conn
+
+    def _release(self, conn, broken: bool):
+        with self._lock:
+            self.in_use -= 1
+        if broken:
+            conn.close()
+        else:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        self._slots.release()
+
+    #with pool.connection() as conn: ... the connection always goes back, whatever happens inside
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            #plain query errors leave the connection usable, anything worse gets it replaced
+            broken = not isinstance(e, sqlite3.OperationalError)
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn, broken)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": self._idle.qsize(),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "max_wait_seconds": round(self.max_wait_seconds, 6),
+                "timeouts": self.timeouts,
+                "read_only": self.read_only,
+                "wal": self.wal,
+            }
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+from fastjson import dumps, raw_json
+
+
+#-------------------conditional requests on the catalog version--------------
+#every read endpoint answers from the request and components.db alone, so catalog_meta.catalog_version (bumped
+#by triggers on every component write) plus a digest of the request is a strong validator for the response:
+#the ETag is "<format>.<catalog version>.<request digest>" and a matching If-None-Match gets a 304 before any
+#lookup runs (304 on GET and HEAD, 412 on the POST endpoints, RFC 9110 13.1.2); RESPONSE_FORMAT is bumped
+#whenever response bodies change shape so old ETags stop matching
+#CACHE_MAX_AGE=30 is how long clients and shared caches may reuse a response without asking again
+RESPONSE_FORMAT = 2
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "30"))
+
+
+def make_etag(catalog_version: int, *parts) -> str:
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=8).hexdigest()
+    return f'"{RESPONSE_FORMAT}.{catalog_version}.{digest}"'
+
+
+def cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"}
+
+
+#If-None-Match uses the weak comparison, a W/ prefix on what the client sends doesn't matter
+#"*" matches any current representation, so it only counts once the handler knows it has one (`exists`)
+def etag_matches(if_none_match: Optional[str], etag: Optional[str], exists: bool = False) -> bool:
+    if not if_none_match or etag is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            if exists:
+                return True
+        elif candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ConditionalStats:
+    def __init__(self):
+        self.answered: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, outcome: str, route: str):
+        name = f"{outcome}_{route}"
+        with self._lock:
+            self.answered[name] = self.answered.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(sorted(self.answered.items()))
+
+
+CONDITIONAL = ConditionalStats()
+
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+#the answer to a request whose If-None-Match matched, `route` names it in the metrics
+def not_modified(method: str, etag: str, route: str) -> Response:
+    if method in SAFE_METHODS:
+        CONDITIONAL.count("not_modified", route)
+        return Response(status_code=304, headers=cache_headers(etag))
+    CONDITIONAL.count("precondition_failed", route)
+    return raw_json(dumps({"error": "If-None-Match matched, the response has not changed"}), status_code=412,
+                    headers=cache_headers(etag))
+
+
+#`response` with its validators, or the 304/412 when it was asked for with If-None-Match: *
+def with_validators(response: Response, method: str, if_none_match: Optional[str], etag: Optional[str],
+                    route: str) -> Response:
+    if etag_matches(if_none_match, etag, exists=True):
+        return not_modified(method, etag, route)
+    response.headers.update(cache_headers(etag))
+    return response
@@ -0,0 +1,926 @@
+import argparse
+import ast
+import csv
+import itertools
+import json
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from catalog import (FORM_FACTOR_ALIASES, LOOKUP_COLUMNS, TABLES, ComponentNotFound, DependencyRecorder, build_summary, catalog_generation,
+                     catalog_version, changed_tags, dependent_keys, form_factor_keys, input_key, key_text, last_change_seq, read_catalog, read_changes,
+                     series_keys, split_list)
+from columnar import np
+from listing import SORTS
+from search import SEARCH_COLUMNS, SEARCH_RANK, SEARCH_TABLE, field_sql, rowid_sql, table_filter_sql
+from columnar import read_catalog as read_columnar_catalog
+from shared_catalog import FORMAT_VERSION, snapshot_path, snapshot_version, write_snapshot
+
+
+# Database path
+BASE_DIR = Path(__file__).parent
+DATABASE_URL = BASE_DIR / "components.db"
+
+
+#-------------------normalized compatibility schema and catalog versioning--------------
+#the comma joined columns (cases.form_factor_compatability, gpus/cooling_systems.compatible_sockets)
+#are split into one row per value so lookups are indexed equality joins instead of LIKE '%x%' scans
+#values are stored as lookup keys (see catalog.norm / form_factor_key), case form factors use the
+#motherboard names (Micro-ATX -> matx, Mini-ITX -> itx) so they join straight onto motherboards.form_factor
+MIGRATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS case_form_factors (
+    form_factor VARCHAR(50) NOT NULL,
+    case_id INT NOT NULL,
+    PRIMARY KEY (form_factor, case_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cooler_sockets (
+    socket_type VARCHAR(50) NOT NULL,
+    cooler_id INT NOT NULL,
+    PRIMARY KEY (socket_type, cooler_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS gpu_slots (
+    slot VARCHAR(50) NOT NULL,
+    gpu_id INT NOT NULL,
+    PRIMARY KEY (slot, gpu_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cpu_series_keys (
+    series_key VARCHAR(50) NOT NULL,
+    cpu_id INT NOT NULL,
+    PRIMARY KEY (series_key, cpu_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_case_form_factors_case ON case_form_factors (case_id);
+CREATE INDEX IF NOT EXISTS idx_cooler_sockets_cooler ON cooler_sockets (cooler_id);
+CREATE INDEX IF NOT EXISTS idx_gpu_slots_gpu ON gpu_slots (gpu_id);
+CREATE INDEX IF NOT EXISTS idx_cpu_series_keys_cpu ON cpu_series_keys (cpu_id);
+
+CREATE INDEX IF NOT EXISTS idx_motherboards_socket ON motherboards (socket_type COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_cases_size ON cases (case_size COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_cooling_type ON cooling_systems (cooling_type COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_storage_type_capacity ON storage (storage_type COLLATE NOCASE, capacity, id);
+CREATE INDEX IF NOT EXISTS idx_ram_type_size ON ram (ram_type COLLATE NOCASE, size COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_psus_watt_output ON psus (watt_output, id);
+
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key VARCHAR(50) PRIMARY KEY,
+    value INT NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('catalog_version', 1);
+
+CREATE TABLE IF NOT EXISTS precomputed_builds (
+    input_key VARCHAR(255) PRIMARY KEY,
+    catalog_version INT NOT NULL,
+    build_json TEXT,
+    error TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS component_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    component_table VARCHAR(50) NOT NULL,
+    component_id INT,
+    old_row TEXT,
+    new_row TEXT,
+    changed_at INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS build_dependencies (
+    component_table VARCHAR(50) NOT NULL,
+    dependency VARCHAR(255) NOT NULL,
+    input_key VARCHAR(255) NOT NULL,
+    PRIMARY KEY (component_table, dependency, input_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_build_dependencies_input ON build_dependencies (input_key);
+
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('precomputed_seq', 0);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('changelog_pruned_seq', 0);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('catalog_generation', 0);
+"""
+
+
+#every write to a component table bumps catalog_meta.catalog_version, anything computed from an older version is stale
+def version_triggers() -> str:
+    statements = []
+    for table in TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS bump_catalog_version_{table}_{event.lower()} AFTER {event} ON {table} "
+                f"BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'catalog_version'; END;"
+            )
+    return "\n".join(statements)
+
+
+#every insert, update (that changes something) and delete on a component table is logged with the row's
+#lookup columns before and after, see catalog.change_tags for how a change maps to the builds it affects
+def changelog_triggers() -> str:
+    statements = []
+    for table, row_type in TABLES.items():
+        def lookup_json(ref):
+            return "json_object(" + ", ".join(f"'{c}', {ref}.{c}" for c in LOOKUP_COLUMNS[table]) + ")"
+        changed = " OR ".join(f"OLD.{f.name} IS NOT NEW.{f.name}" for f in fields(row_type))
+        log = "INSERT INTO component_changes (component_table, component_id, old_row, new_row, changed_at) VALUES"
+        now = "CAST(strftime('%s', 'now') AS INT)"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS log_change_{table}_insert AFTER INSERT ON {table} BEGIN "
+            f"{log} ('{table}', COALESCE(NEW.id, NEW.rowid), NULL, {lookup_json('NEW')}, {now}); END;",
+            f"CREATE TRIGGER IF NOT EXISTS log_change_{table}_update AFTER UPDATE ON {table} WHEN {changed} BEGIN "
+            f"{log} ('{table}', COALESCE(NEW.id, NEW.rowid), {lookup_json('OLD')}, {lookup_json('NEW')}, {now}); END;",
+            f"CREATE TRIGGER IF NOT EXISTS log_change_{table}_delete AFTER DELETE ON {table} BEGIN "
+            f"{log} ('{table}', COALESCE(OLD.id, OLD.rowid), {lookup_json('OLD')}, NULL, {now}); END;",
+        ]
+    return "\n".join(statements)
+
+
+#-------------------full text search index--------------
+#component_search (see search.py) is an fts5 table over all component tables, filled by rebuild_search and
+#kept in sync by per table triggers; prefix indexes on the first 1-3 characters keep type ahead queries fast
+SEARCH_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    {', '.join(SEARCH_COLUMNS)}, price UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+);
+INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', '{SEARCH_RANK}');
+"""
+
+
+def search_triggers() -> str:
+    statements = []
+    columns = f"rowid, {', '.join(SEARCH_COLUMNS)}, price"
+    for table, row_type in TABLES.items():
+        #skipped when the row is already indexed: compatibility_triggers' id assignment is an update that may fire first
+        #and index the row under the same rowid
+        insert = (f"INSERT INTO {SEARCH_TABLE} ({columns}) SELECT {rowid_sql(table, 'NEW')}, {', '.join(field_sql(table, 'NEW'))}, "
+                  f"NEW.price WHERE NOT EXISTS (SELECT 1 FROM {SEARCH_TABLE} WHERE rowid = {rowid_sql(table, 'NEW')});")
+        delete = f"DELETE FROM {SEARCH_TABLE} WHERE rowid = {rowid_sql(table, 'OLD')};"
+        changed = " OR ".join(f"OLD.{f.name} IS NOT NEW.{f.name}" for f in fields(row_type))
+        #recreated rather than IF NOT EXISTS, triggers from an older layout of the index would write stale rowids
+        for event, body in (("insert", f"AFTER INSERT ON {table} BEGIN {insert} END"),
+                            ("update", f"AFTER UPDATE ON {table} WHEN {changed} BEGIN {delete} {insert} END"),
+                            ("delete", f"AFTER DELETE ON {table} BEGIN {delete} END")):
+            statements += [f"DROP TRIGGER IF EXISTS search_sync_{table}_{event};",
+                           f"CREATE TRIGGER search_sync_{table}_{event} {body};"]
+    return "\n".join(statements)
+
+
+#refill the index rows of some tables from the tables themselves, the whole index when tables is None
+def rebuild_search(conn, tables=None):
+    if tables is None:
+        conn.execute(f"DELETE FROM {SEARCH_TABLE}")
+    for table in tables or TABLES:
+        if tables is not None:
+            conn.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {table_filter_sql(table)}")
+        conn.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}, price) "
+            f"SELECT {rowid_sql(table, table)}, {', '.join(field_sql(table, table))}, {table}.price FROM {table}"
+        )
+    #merge the index segments the inserts left behind into one, queries then read a single b-tree per term
+    conn.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+#(sort column, id) on every table for every sort listing.py offers, the keyset pages walk these
+#(idx_psus_watt_output is already in MIGRATION_SCHEMA with the same definition)
+def sort_indexes() -> str:
+    statements = []
+    for sort, tables in SORTS.items():
+        columns = "id" if sort == "id" else f"{sort}, id"
+        statements += [f"CREATE INDEX IF NOT EXISTS idx_{table}_{sort} ON {table} ({columns});" for table in tables or TABLES]
+    return "\n".join(statements)
+
+
+#join table -> (source table, source column, key column, id column, function splitting the source column into keys)
+COMPATIBILITY_SOURCES = {
+    "case_form_factors": ("cases", "form_factor_compatability", "form_factor", "case_id", form_factor_keys),
+    "cooler_sockets": ("cooling_systems", "compatible_sockets", "socket_type", "cooler_id", split_list),
+    "gpu_slots": ("gpus", "compatible_sockets", "slot", "gpu_id", split_list),
+    "cpu_series_keys": ("cpus", "series", "series_key", "cpu_id", series_keys),
+}
+
+
+#ids were declared INT AUTO_INCREMENT which sqlite leaves NULL, give every row its rowid
+def backfill_ids(conn):
+    for table in TABLES:
+        conn.execute(f"UPDATE {table} SET id = rowid WHERE id IS NULL")
+
+
+#refill one join table from its comma joined source column, optionally only for some source ids
+def rebuild_compatibility(conn, join_table: str, ids=None):
+    source, column, key_column, id_column, keys_of = COMPATIBILITY_SOURCES[join_table]
+    if ids is None:
+        conn.execute(f"DELETE FROM {join_table}")
+        rows = conn.execute(f"SELECT id, {column} FROM {source}")
+    else:
+        ids = list(ids)
+        marks = ", ".join("?" for _ in ids)
+        conn.execute(f"DELETE FROM {join_table} WHERE {id_column} IN ({marks})", ids)
+        rows = conn.execute(f"SELECT id, {column} FROM {source} WHERE id IN ({marks})", ids)
+    insert_compatibility(conn, join_table, rows.fetchall())
+
+
+#join rows for (source id, source column value) pairs
+def insert_compatibility(conn, join_table: str, rows):
+    _, _, key_column, id_column, keys_of = COMPATIBILITY_SOURCES[join_table]
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {join_table} ({key_column}, {id_column}) VALUES (?, ?)",
+        ((key, row_id) for row_id, value in rows for key in keys_of(value)),
+    )
+
+
+#-------------------keeping the join tables in sync--------------
+#the join tables above are refilled by migrate and the ingest loader, these triggers keep them right for any other
+#write (a plain INSERT/UPDATE/DELETE from the sqlite shell or a script) so the sql path in backend.build_from_db
+#never joins on stale rows, and a row inserted without an id gets its rowid like backfill_ids would give it
+#the split is done in sql (triggers can't use WITH, so a comma list becomes a json array for json_each) and
+#matches split_list / form_factor_keys / series_keys for the values a catalog holds; a value json can't carry
+#gets no join rows
+WHITESPACE_SQL = "' ' || char(9, 10, 11, 12, 13)"
+
+
+#`value` as a json array of its parts between `separator`s, '[]' for NULL
+def json_parts_sql(value: str, separator: str) -> str:
+    for char, escape in (("'\\'", "'\\\\'"), ("'\"'", "'\\\"'"), ("char(9)", "'\\t'"), ("char(10)", "'\\n'"),
+                         ("char(13)", "'\\r'")):
+        value = f"replace({value}, {char}, {escape})"
+    array = f"'[\"' || replace({value}, {separator}, '\",\"') || '\"]'"
+    return f"CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END"
+
+
+#split_list(ref.column) as rows of `key`
+def split_list_sql(ref: str, column: str) -> str:
+    parts = json_parts_sql(f"{ref}.{column}", "','")
+    return f"SELECT key FROM (SELECT lower(trim(value, {WHITESPACE_SQL})) AS key FROM json_each({parts})) WHERE key != ''"
+
+
+def form_factor_keys_sql(ref: str, column: str) -> str:
+    aliases = " ".join(f"WHEN '{name}' THEN '{key}'" for name, key in FORM_FACTOR_ALIASES.items())
+    return f"SELECT CASE key {aliases} ELSE key END AS key FROM ({split_list_sql(ref, column)})"
+
+
+def series_keys_sql(ref: str, column: str) -> str:
+    full = f"lower(trim({ref}.{column}, {WHITESPACE_SQL}))"
+    spaced = full
+    for code in (9, 10, 11, 12, 13):
+        spaced = f"replace({spaced}, char({code}), ' ')"
+    words = json_parts_sql(spaced, "' '")
+    return f"SELECT {full} AS key UNION SELECT value FROM json_each({words}) WHERE value != ''"
+
+
+#join table -> the sql twin of its COMPATIBILITY_SOURCES key function
+COMPATIBILITY_KEYS_SQL = {
+    "case_form_factors": form_factor_keys_sql,
+    "cooler_sockets": split_list_sql,
+    "gpu_slots": split_list_sql,
+    "cpu_series_keys": series_keys_sql,
+}
+
+
+def compatibility_triggers() -> str:
+    statements = []
+    for table in TABLES:
+        statements += [f"DROP TRIGGER IF EXISTS assign_id_{table};",
+                       f"CREATE TRIGGER assign_id_{table} AFTER INSERT ON {table} WHEN NEW.id IS NULL "
+                       f"BEGIN UPDATE {table} SET id = NEW.rowid WHERE rowid = NEW.rowid; END;"]
+    for join_table, (table, column, key_column, id_column, _) in COMPATIBILITY_SOURCES.items():
+        keys_sql = COMPATIBILITY_KEYS_SQL[join_table]
+        insert = (f"INSERT OR IGNORE INTO {join_table} ({key_column}, {id_column}) "
+                  f"SELECT key, COALESCE(NEW.id, NEW.rowid) FROM ({keys_sql('NEW', column)}) WHERE key IS NOT NULL;")
+        delete = f"DELETE FROM {join_table} WHERE {id_column} = COALESCE(OLD.id, OLD.rowid);"
+        changed = f"OLD.{column} IS NOT NEW.{column} OR OLD.id IS NOT NEW.id"
+        #recreated rather than IF NOT EXISTS like the search triggers, so a fix to the split reaches old databases
+        for event, body in (("insert", f"AFTER INSERT ON {table} BEGIN {insert} END"),
+                            ("update", f"AFTER UPDATE ON {table} WHEN {changed} BEGIN {delete} {insert} END"),
+                            ("delete", f"AFTER DELETE ON {table} BEGIN {delete} END")):
+            statements += [f"DROP TRIGGER IF EXISTS sync_{join_table}_{event};",
+                           f"CREATE TRIGGER sync_{join_table}_{event} {body};"]
+    return "\n".join(statements)
+
+
+def migrate(db_path=DATABASE_URL, snapshot: bool = True, precompute: bool = True):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        conn.executescript(MIGRATION_SCHEMA)
+        conn.executescript(natural_key_indexes())
+        conn.executescript(sort_indexes())
+        conn.executescript(version_triggers())
+        conn.executescript(changelog_triggers())
+        conn.executescript(SEARCH_SCHEMA)
+        conn.executescript(search_triggers())
+        conn.executescript(compatibility_triggers())
+        with conn:
+            backfill_ids(conn)
+            for join_table in COMPATIBILITY_SOURCES:
+                rebuild_compatibility(conn, join_table)
+            rebuild_search(conn)
+        conn.execute("ANALYZE")
+        for join_table in COMPATIBILITY_SOURCES:
+            count = conn.execute(f"SELECT COUNT(*) FROM {join_table}").fetchone()[0]
+            print(f"{join_table}: {count} rows")
+        #precomputed_builds and build_dependencies are derived, components.db is committed without them and they
+        #are filled here at deploy time; builds precomputed before dependencies were tracked get redone the same way
+        missing = conn.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM precomputed_builds) OR NOT EXISTS (SELECT 1 FROM build_dependencies)"
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    if missing and precompute:
+        precompute_builds(db_path)
+    if snapshot:
+        update_snapshot(db_path)
+
+
+#-------------------bulk ingestion of vendor feeds--------------
+#python init_db.py ingest gpus vendor_gpus.csv [--batch 5000] [--rejects rejects.jsonl]
+#a feed is CSV with a header row or JSON lines, keyed by the table's column names (ids are assigned here)
+#rows are read, validated and written one batch at a time so memory depends on --batch, not on the feed
+#each batch is one transaction: it is loaded into a temp staging table, stored rows with the same natural key
+#are updated where something changed, the rest are inserted, and the join tables are refreshed for those ids
+#the table's secondary indexes and triggers are dropped for the load and recreated at the end, so the
+#version bumps once per feed instead of once per row (python init_db.py migrate puts them back after a crash)
+
+#what identifies the same product across feeds, a feed row replaces the stored rows with the same key
+NATURAL_KEYS = {
+    "cpus": ("name",),
+    "cases": ("name",),
+    "motherboards": ("name",),
+    "psus": ("name",),
+    "gpus": ("brand", "model"),
+    "cooling_systems": ("name",),
+    "ram": ("ram_type", "size"),
+    "storage": ("storage_type", "capacity"),
+}
+
+#besides the natural key every row needs a price, builds add them up
+REQUIRED_COLUMNS = ("price",)
+
+#upper bound for --batch, the touched ids of a batch go into one IN (...) list
+MAX_BATCH = 20_000
+
+
+def natural_key_indexes() -> str:
+    return "\n".join(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_natural_key ON {table} ({', '.join(key)});"
+        for table, key in NATURAL_KEYS.items()
+    )
+
+
+class RowRejected(ValueError):
+    pass
+
+
+@dataclass
+class Column:
+    name: str
+    declared: str
+    kind: type
+    max_length: Optional[int]
+    default: object
+
+
+#the columns a feed may set, from the table definition; id is left out, it is assigned on insert
+def table_columns(conn, table: str) -> List[Column]:
+    columns = []
+    for _, name, declared, _, default, _ in conn.execute(f"PRAGMA table_info({table})"):
+        if name == "id":
+            continue
+        declared = (declared or "").upper()
+        length = re.search(r"\((\d+)\)", declared)
+        columns.append(Column(
+            name=name,
+            declared=declared,
+            kind=int if "INT" in declared else str,
+            max_length=int(length.group(1)) if length and "CHAR" in declared else None,
+            default=ast.literal_eval(default) if default is not None else None,
+        ))
+    return columns
+
+
+#one feed row as a tuple in column order, or RowRejected saying what is wrong with it
+def validate_row(record, columns: List[Column], required) -> tuple:
+    if not isinstance(record, dict):
+        raise RowRejected("not an object")
+    if None in record:
+        raise RowRejected("more fields than the header")
+    unknown = set(record) - {column.name for column in columns} - {"id"}
+    if unknown:
+        raise RowRejected(f"unknown columns: {', '.join(sorted(map(str, unknown)))}")
+    values = []
+    for column in columns:
+        value = record.get(column.name)
+        if isinstance(value, str):
+            value = value.strip() or None
+        if value is None:
+            value = column.default
+        if value is None:
+            if column.name in required:
+                raise RowRejected(f"{column.name} is required")
+            values.append(None)
+            continue
+        if column.kind is int:
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                raise RowRejected(f"{column.name} is not an integer: {value!r}")
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise RowRejected(f"{column.name} is not an integer: {value!r}")
+            if value < 0:
+                raise RowRejected(f"{column.name} is negative: {value}")
+        else:
+            if isinstance(value, (dict, list)):
+                raise RowRejected(f"{column.name} is not text: {value!r}")
+            value = str(value)
+            if column.max_length is not None and len(value) > column.max_length:
+                raise RowRejected(f"{column.name} is longer than {column.max_length} characters")
+        values.append(value)
+    return tuple(values)
+
+
+#(line number, row) pairs; json lines are decoded by the caller so a bad line is a rejected row, not a crash
+def read_feed(path, fmt: Optional[str] = None) -> Iterator[Tuple[int, object]]:
+    fmt = fmt or ("csv" if Path(path).suffix.lower() == ".csv" else "jsonl")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            #line 1 is the header; a row with too many fields shows up under the None key and is rejected
+            yield from enumerate(csv.DictReader(f), 2)
+        else:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_no, line
+
+
+@dataclass
+class IngestStats:
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    batches: int = 0
+    #the first few rejections, the full list goes to --rejects
+    samples: List[str] = field(default_factory=list)
+
+
+class FeedLoader:
+    def __init__(self, conn, table: str, columns: List[Column]):
+        self.conn = conn
+        self.table = table
+        self.names = [column.name for column in columns]
+        self.key = NATURAL_KEYS[table]
+        self.join_tables = [join_table for join_table, source in COMPATIBILITY_SOURCES.items() if source[0] == table]
+
+        column_defs = ", ".join(f"{column.name} {column.declared}" for column in columns)
+        conn.execute("DROP TABLE IF EXISTS temp.ingest_staging")
+        conn.execute(f"CREATE TEMP TABLE ingest_staging ({column_defs}, PRIMARY KEY ({', '.join(self.key)}))")
+
+        cols = ", ".join(self.names)
+        key_match = " AND ".join(f"t.{k} = s.{k}" for k in self.key)
+        changed = " OR ".join(f"t.{c} IS NOT s.{c}" for c in self.names if c not in self.key)
+        #CROSS JOIN keeps staging as the outer loop, otherwise the planner may scan the whole table per batch
+        changed_rows = f"FROM ingest_staging s CROSS JOIN {table} t ON {key_match} WHERE {changed}"
+        self.stage_sql = f"INSERT OR REPLACE INTO ingest_staging ({cols}) VALUES ({', '.join('?' for _ in self.names)})"
+        self.changed_ids_sql = f"SELECT t.id {changed_rows}"
+        self.matched_sql = f"SELECT COUNT(*) FROM ingest_staging s WHERE EXISTS (SELECT 1 FROM {table} t WHERE {key_match})"
+        self.changed_sql = (f"SELECT COUNT(*) FROM ingest_staging s "
+                            f"WHERE EXISTS (SELECT 1 FROM {table} t WHERE {key_match} AND ({changed}))")
+        self.update_sql = (f"UPDATE {table} AS t SET ({cols}) = "
+                           f"(SELECT {', '.join(f's.{c}' for c in self.names)} FROM ingest_staging s WHERE {key_match}) "
+                           f"WHERE t.rowid IN (SELECT t.rowid {changed_rows})")
+        #new rows get id = rowid = the next free rowid, like backfill_ids would give them
+        self.insert_sql = (f"INSERT INTO {table} (rowid, id, {cols}) "
+                           f"SELECT :top + n, :top + n, {cols} FROM (SELECT row_number() OVER (ORDER BY s.rowid) AS n, "
+                           f"{', '.join(f's.{c}' for c in self.names)} FROM ingest_staging s "
+                           f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {key_match}))")
+        self.new_sources_sql = {
+            join_table: f"SELECT id, {COMPATIBILITY_SOURCES[join_table][1]} FROM {table} WHERE rowid > ?"
+            for join_table in self.join_tables
+        }
+
+    #upsert one batch in its own transaction, adds what happened to each row to stats
+    def load(self, rows: List[tuple], stats: IngestStats):
+        conn = self.conn
+        with conn:
+            conn.execute("DELETE FROM ingest_staging")
+            conn.executemany(self.stage_sql, rows)
+            staged = conn.execute("SELECT COUNT(*) FROM ingest_staging").fetchone()[0]
+            matched = conn.execute(self.matched_sql).fetchone()[0]
+            updated = conn.execute(self.changed_sql).fetchone()[0]
+            touched = [row[0] for row in conn.execute(self.changed_ids_sql)] if self.join_tables else []
+            conn.execute(self.update_sql)
+            top = conn.execute(f"SELECT MAX(rowid) FROM {self.table}").fetchone()[0] or 0
+            inserted = conn.execute(self.insert_sql, {"top": top}).rowcount
+            for join_table in self.join_tables:
+                if touched:
+                    rebuild_compatibility(conn, join_table, touched)
+                #new rows have no join rows yet, nothing to delete first
+                if inserted:
+                    insert_compatibility(conn, join_table, conn.execute(self.new_sources_sql[join_table], (top,)))
+        stats.batches += 1
+        stats.inserted += inserted
+        stats.updated += updated
+        stats.unchanged += matched - updated
+        #a key repeated inside one batch is written once, the last row wins
+        stats.duplicates += len(rows) - staged
+
+
+#drop the table's secondary indexes (the natural key one is needed by the upsert) and its triggers but the
+#change log ones (every changed row still has to reach the builds depending on it), returns the sql that
+#recreates them
+def drop_for_load(conn, table: str) -> List[str]:
+    objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+        "AND ((type = 'trigger' AND name NOT LIKE 'log_change_%') OR (type = 'index' AND name != ?))",
+        (table, f"idx_{table}_natural_key"),
+    ).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in objects]
+
+
+def ingest(table: str, feed, db_path=DATABASE_URL, fmt: Optional[str] = None, batch_size: int = 5000,
+           rejects: Optional[str] = None) -> IngestStats:
+    if table not in NATURAL_KEYS:
+        raise ValueError(f"unknown table {table!r}, expected one of {', '.join(NATURAL_KEYS)}")
+    batch_size = max(1, min(batch_size, MAX_BATCH))
+    stats = IngestStats()
+    conn = sqlite3.connect(str(db_path))
+    reject_file = open(rejects, "w") if rejects else None
+    try:
+        conn.executescript(MIGRATION_SCHEMA)
+        conn.executescript(natural_key_indexes())
+        conn.executescript(sort_indexes())
+        conn.executescript(version_triggers())
+        conn.executescript(changelog_triggers())
+        conn.executescript(SEARCH_SCHEMA)
+        conn.executescript(search_triggers())
+        conn.executescript(compatibility_triggers())
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        columns = table_columns(conn, table)
+        required = set(NATURAL_KEYS[table]) | set(REQUIRED_COLUMNS)
+        loader = FeedLoader(conn, table, columns)
+
+        with conn:
+            recreate = drop_for_load(conn, table)
+        try:
+            batch = []
+            for line_no, record in read_feed(feed, fmt):
+                stats.read += 1
+                try:
+                    if isinstance(record, str):
+                        record = json.loads(record)
+                    batch.append(validate_row(record, columns, required))
+                except (RowRejected, json.JSONDecodeError) as e:
+                    stats.rejected += 1
+                    if len(stats.samples) < 10:
+                        stats.samples.append(f"line {line_no}: {e}")
+                    if reject_file:
+                        reject_file.write(json.dumps({"line": line_no, "error": str(e), "row": record}, default=str) + "\n")
+                if len(batch) >= batch_size:
+                    loader.load(batch, stats)
+                    batch = []
+            if batch:
+                loader.load(batch, stats)
+        finally:
+            with conn:
+                for sql in recreate:
+                    conn.execute(sql)
+                if stats.inserted or stats.updated:
+                    conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'catalog_version'")
+                    #the search triggers were dropped with the others for the load
+                    rebuild_search(conn, [table])
+        conn.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+        if reject_file:
+            reject_file.close()
+    if stats.inserted or stats.updated:
+        update_snapshot(db_path)
+    return stats
+
+
+#-------------------precomputed builds--------------
+#the GUI only offers a closed set of inputs (see the *_values lists in GUI.py), so every answer
+#get_user_build can give it is computed here ahead of time and served with one keyed lookup
+GUI_CPU_SERIES = ["Ryzen 3", "Ryzen 5", "Ryzen 7", "Ryzen 9", "i3", "i5", "i7", "i9"]
+GUI_CASE_SIZES = ["Mini Tower", "Mid Tower", "Full Tower"]
+GUI_COOLING = ["Air", "Liquid"]
+GUI_STORAGE_SIZES = [256, 512, 1024, 2048, 4096, 8192]
+GUI_RAM_SIZES = ["8 GB", "16 GB", "32 GB", "64 GB", "128 GB"]
+GUI_STORAGE_TYPES = ["SSD"]
+GUI_MEMORY_TYPES = ["DDR5"]
+
+
+#every input the GUI can send, in UserComponentInput field order
+def gui_inputs():
+    for cpu_model, case_size, cooling, storage_type, storage_size, memory_type, memory_size in itertools.product(
+        GUI_CPU_SERIES, GUI_CASE_SIZES, GUI_COOLING, GUI_STORAGE_TYPES, GUI_STORAGE_SIZES, GUI_MEMORY_TYPES, GUI_RAM_SIZES
+    ):
+        yield {
+            "cpu_model": cpu_model,
+            "case_size": case_size,
+            "cooling": cooling,
+            "pref_storage_type": storage_type,
+            "pref_storage_size": storage_size,
+            "pref_memory_type": memory_type,
+            "pref_memory_size": memory_size,
+        }
+
+
+#the build (or the not found error) for one input, the same selection get_user_build makes,
+#and the tags of every row and lookup it depends on
+def precompute_row(catalog, input_fields: dict):
+    recorder = DependencyRecorder()
+    try:
+        parts = catalog.resolve(**input_fields, run=recorder.run)
+        return json.dumps(build_summary(parts)), None, recorder.tags
+    except ComponentNotFound as e:
+        return None, str(e), recorder.tags
+
+
+#(re)write precomputed rows together with their dependencies, rows are (input fields, catalog version, row)
+def write_precomputed(conn, rows):
+    for input_fields, version, (build_json, error, tags) in rows:
+        key = key_text(input_key(**input_fields))
+        conn.execute(
+            "INSERT OR REPLACE INTO precomputed_builds (input_key, catalog_version, build_json, error) VALUES (?, ?, ?, ?)",
+            (key, version, build_json, error),
+        )
+        conn.execute("DELETE FROM build_dependencies WHERE input_key = ?", (key,))
+        conn.executemany(
+            "INSERT INTO build_dependencies (component_table, dependency, input_key) VALUES (?, ?, ?)",
+            ((table, dependency, key) for table, dependency in sorted(tags)),
+        )
+
+
+def set_meta(conn, key: str, value: int):
+    conn.execute("UPDATE catalog_meta SET value = ? WHERE key = ?", (value, key))
+
+
+def get_meta(conn, key: str) -> int:
+    return conn.execute("SELECT value FROM catalog_meta WHERE key = ?", (key,)).fetchone()[0]
+
+
+def precompute_builds(db_path=DATABASE_URL):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        conn.executescript(MIGRATION_SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        version = catalog_version(conn)
+        catalog = read_catalog(conn)
+        rows = [(input_fields, version, precompute_row(catalog, input_fields)) for input_fields in gui_inputs()]
+        conn.execute("DELETE FROM precomputed_builds")
+        conn.execute("DELETE FROM build_dependencies")
+        write_precomputed(conn, rows)
+        #every change logged so far is part of what was just computed
+        set_meta(conn, "precomputed_seq", last_change_seq(conn))
+        conn.commit()
+        missing = sum(1 for _, _, row in rows if row[1] is not None)
+        print(f"precomputed_builds: {len(rows)} inputs at catalog version {version} ({missing} with no build)")
+    finally:
+        conn.close()
+
+
+#changes older than this that every precomputed row already reflects are deleted by refresh; a server that
+#has not looked at the log for longer finds them gone (read_changes returns None) and drops its whole cache
+CHANGELOG_RETENTION = 3600
+
+
+#recompute only the precomputed builds that depend on a row changed since the last precompute or refresh
+def refresh_precomputed(db_path=DATABASE_URL):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        conn.executescript(MIGRATION_SCHEMA)
+        #no writer can slip a change in between reading the log and recording how far it was applied
+        conn.execute("BEGIN IMMEDIATE")
+        since = get_meta(conn, "precomputed_seq")
+        changes = read_changes(conn, since)
+        if not changes:
+            conn.rollback()
+            if changes is not None:
+                print(f"precomputed_builds: up to date at change {since}")
+            return
+        keys = dependent_keys(conn, changed_tags(changes))
+        version = catalog_version(conn)
+        catalog = read_catalog(conn)
+        inputs = list(gui_inputs())
+        rows = [(input_fields, version, precompute_row(catalog, input_fields))
+                for input_fields in inputs if key_text(input_key(**input_fields)) in keys]
+        write_precomputed(conn, rows)
+        last = changes[-1][0]
+        set_meta(conn, "precomputed_seq", last)
+        pruned = conn.execute(
+            "SELECT MAX(seq) FROM component_changes WHERE seq <= ? AND changed_at < CAST(strftime('%s', 'now') AS INT) - ?",
+            (last, CHANGELOG_RETENTION),
+        ).fetchone()[0]
+        if pruned is not None:
+            conn.execute("DELETE FROM component_changes WHERE seq <= ?", (pruned,))
+            set_meta(conn, "changelog_pruned_seq", pruned)
+        conn.commit()
+        print(f"precomputed_builds: {len(changes)} changes since change {since}, "
+              f"{len(rows)} of {len(inputs)} builds recomputed")
+    finally:
+        conn.close()
+    if changes is None:
+        print("component_changes was pruned past precomputed_builds, recomputing everything")
+        precompute_builds(db_path)
+
+
+#-------------------catalog snapshot--------------
+#the compiled catalog (see shared_catalog.py for the layout) next to the database, components.catalog for
+#components.db; the server maps it at startup instead of reading the component tables when it was compiled
+#at the database's current catalog_version, so migrate and ingest rewrite it whenever the tables change
+#python init_db.py snapshot [--force]
+def update_snapshot(db_path=DATABASE_URL, force: bool = False):
+    if np is None:
+        print("catalog snapshot: skipped, numpy is not installed")
+        return
+    path = snapshot_path(db_path)
+    conn = sqlite3.connect(str(db_path))
+    try:
+        #one read transaction, the version and the rows it describes come from the same state of the database
+        conn.execute("BEGIN")
+        version = catalog_version(conn)
+        if not force and snapshot_version(path) == (FORMAT_VERSION, version):
+            print(f"catalog snapshot: {path.name} is up to date at catalog version {version}")
+            return
+        catalog = read_columnar_catalog(conn)
+    finally:
+        conn.close()
+    size = write_snapshot(catalog, path, version)
+    print(f"catalog snapshot: {path.name} at catalog version {version}, {len(catalog)} components, {size} bytes")
+
+
+
+#-------------------atomic catalog publish--------------
+#python init_db.py publish [schema.sql | other.db]
+#rewriting components.db in place (re-piping schema.sql into sqlite3) lets running servers read half written
+#tables; instead the new catalog is built into a side file next to it (components.next.db), migrated,
+#precomputed and validated there, and only then copied over the live database with sqlite's backup api in
+#one write transaction: WAL readers see the old catalog or the new one, never a mix, and nothing is renamed
+#under a server's open connections (a renamed-over file would lose its -wal/-shm pairing)
+#the published catalog gets the next catalog_generation and a catalog_version above the live one, so ETags
+#and snapshots from the old catalog never match it; servers notice the generation on their next fingerprint
+#check and switch over between requests (see backend.refresh_catalog)
+#publish and ingest both write components.db, run one at a time
+class PublishError(ValueError):
+    pass
+
+
+def side_path(db_path) -> Path:
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.next{db_path.suffix}")
+
+
+def remove_database(path: Path):
+    for file in (path, Path(f"{path}-wal"), Path(f"{path}-shm"), Path(f"{path}-journal")):
+        file.unlink(missing_ok=True)
+
+
+#the side file from a schema script or a copy of another database, with everything migrate and precompute add
+def build_side_file(source, side: Path, page_size: int):
+    remove_database(side)
+    conn = sqlite3.connect(str(side))
+    try:
+        #the backup api can't change the page size of a WAL database, match the live one from the start
+        conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        if Path(source).suffix == ".sql":
+            #schema.sql builds the components rows with concat(), built into sqlite from 3.44 on
+            if sqlite3.sqlite_version_info < (3, 44):
+                conn.create_function("concat", -1, lambda *args: "".join(str(arg) for arg in args if arg is not None))
+            conn.executescript(Path(source).read_text())
+        else:
+            source_conn = sqlite3.connect(f"{Path(source).resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                source_conn.backup(conn)
+            finally:
+                source_conn.close()
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+    migrate(side, snapshot=False, precompute=False)
+    precompute_builds(side)
+
+
+#everything a server needs from the catalog is there and readable; raises PublishError listing what is not
+def validate_catalog(conn):
+    problems = []
+    integrity = conn.execute("PRAGMA integrity_check").fetchall()
+    if integrity != [("ok",)]:
+        problems.append(f"integrity_check: {'; '.join(row[0] for row in integrity[:5])}")
+    components = 0
+    for table in TABLES:
+        try:
+            rows, unpriced = conn.execute(
+                f"SELECT COUNT(*), COUNT(*) - COUNT(price) FROM {table}"
+            ).fetchone()
+        except sqlite3.Error as e:
+            problems.append(f"{table}: {e}")
+            continue
+        components += rows
+        if not rows:
+            problems.append(f"{table} is empty")
+        if unpriced:
+            problems.append(f"{table}: {unpriced} rows without a price")
+    indexed = conn.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}").fetchone()[0]
+    if indexed != components:
+        problems.append(f"{SEARCH_TABLE} has {indexed} rows for {components} components")
+    try:
+        read_catalog(conn)
+    except Exception as e:
+        problems.append(f"the catalog does not load: {e}")
+    builds, answered = conn.execute("SELECT COUNT(*), COUNT(*) - COUNT(error) FROM precomputed_builds").fetchone()
+    if not answered:
+        problems.append(f"none of the {builds} precomputed inputs has a build")
+    if problems:
+        raise PublishError("; ".join(problems))
+
+
+def publish(source, db_path=DATABASE_URL) -> int:
+    db_path = Path(db_path)
+    side = side_path(db_path)
+    live = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        page_size = live.execute("PRAGMA page_size").fetchone()[0]
+        try:
+            build_side_file(source, side, page_size)
+        except sqlite3.Error as e:
+            raise PublishError(f"building {side.name} from {source}: {e}")
+        conn = sqlite3.connect(str(side))
+        try:
+            validate_catalog(conn)
+            try:
+                live_generation, live_version = catalog_generation(live), catalog_version(live)
+            except sqlite3.Error:
+                live_generation, live_version = 0, 0
+            generation = live_generation + 1
+            version = max(live_version, catalog_version(conn)) + 1
+            with conn:
+                set_meta(conn, "catalog_generation", generation)
+                set_meta(conn, "catalog_version", version)
+                conn.execute("UPDATE precomputed_builds SET catalog_version = ?", (version,))
+            #the snapshot for the new version goes in first, servers switching over map it instead of reading tables
+            if np is not None:
+                conn.execute("BEGIN")
+                catalog = read_columnar_catalog(conn)
+                conn.rollback()
+                write_snapshot(catalog, snapshot_path(db_path), version)
+            #every page in one step: one write transaction on the live database
+            try:
+                conn.backup(live, pages=-1)
+            except sqlite3.Error:
+                update_snapshot(db_path, force=True)
+                raise
+        finally:
+            conn.close()
+        live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        live.close()
+    remove_database(side)
+    print(f"published catalog generation {generation} at catalog version {version} from {source}")
+    return generation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="components.db maintenance")
+    parser.add_argument("command", nargs="?", default="migrate", choices=["migrate", "precompute", "refresh", "ingest", "snapshot", "publish"])
+    parser.add_argument("table", nargs="?", choices=list(NATURAL_KEYS), help="ingest: the component table the feed is for")
+    parser.add_argument("feed", nargs="?", help="ingest: a .csv (with a header row) or .jsonl file")
+    parser.add_argument("--source", default=str(BASE_DIR / "schema.sql"), help="publish: a .sql script or a database to publish")
+    parser.add_argument("--db", default=str(DATABASE_URL))
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="ingest: feed format when the suffix does not say")
+    parser.add_argument("--batch", type=int, default=5000, help=f"ingest: rows per transaction (at most {MAX_BATCH})")
+    parser.add_argument("--rejects", help="ingest: write rejected rows and why to this json lines file")
+    parser.add_argument("--force", action="store_true", help="snapshot: rewrite it even when it is up to date")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate(args.db)
+    elif args.command == "precompute":
+        precompute_builds(args.db)
+    elif args.command == "refresh":
+        refresh_precomputed(args.db)
+    elif args.command == "snapshot":
+        update_snapshot(args.db, args.force)
+    elif args.command == "publish":
+        try:
+            publish(args.source, args.db)
+        except PublishError as e:
+            parser.exit(1, f"not published, {side_path(args.db).name} is left for a look: {e}\n")
+    elif args.command == "ingest":
+        if not args.table or not args.feed:
+            parser.error("ingest needs a table and a feed file")
+        started = time.perf_counter()
+        stats = ingest(args.table, args.feed, args.db, args.format, args.batch, args.rejects)
+        elapsed = time.perf_counter() - started
+        for sample in stats.samples:
+            print(f"rejected {sample}")
+        print(f"{args.table}: {stats.read} rows read in {stats.batches} batches, {stats.inserted} inserted, "
+              f"{stats.updated} updated, {stats.unchanged} unchanged, {stats.duplicates} repeated keys, {stats.rejected} rejected "
+              f"({elapsed:.1f}s, {stats.read / elapsed if elapsed else 0:.0f} rows/s)")
+        if stats.inserted or stats.updated:
+            print("catalog_version bumped, run `python init_db.py refresh` to recompute the affected precomputed builds")
@@ -0,0 +1,121 @@
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+from catalog import TABLES, form_factor_key, norm
+
+
+#-------------------keyset paginated component listings--------------
+#pages are read with `WHERE (sort column, id) > (last value, last id) ORDER BY sort column, id LIMIT n` on the
+#(column, id) indexes init_db.py creates, so page 1000 costs the same as page 1 and nothing is ever offset
+#past; the cursor is that last (value, id) with the sort it belongs to, opaque to clients
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+#sort key -> tables it applies to (None: every table)
+SORTS = {"price": None, "watt_output": ("psus",), "id": None}
+
+#table -> filter name -> (condition on `t`, converts the query value to what the condition compares against)
+#the comma joined compatibility columns are matched through their join tables, see init_db.COMPATIBILITY_SOURCES
+FILTERS = {
+    "cpus": {
+        "series": ("EXISTS (SELECT 1 FROM cpu_series_keys k WHERE k.cpu_id = t.id AND k.series_key = ?)", norm),
+        "socket": ("t.socket_type = ? COLLATE NOCASE", str.strip),
+    },
+    "motherboards": {
+        "socket": ("t.socket_type = ? COLLATE NOCASE", str.strip),
+        "form_factor": ("lower(trim(t.form_factor)) = ?", form_factor_key),
+    },
+    "gpus": {
+        "slot": ("EXISTS (SELECT 1 FROM gpu_slots s WHERE s.gpu_id = t.id AND s.slot = ?)", norm),
+    },
+    "cases": {
+        "form_factor": ("EXISTS (SELECT 1 FROM case_form_factors f WHERE f.case_id = t.id AND f.form_factor = ?)", form_factor_key),
+        "size": ("t.case_size = ? COLLATE NOCASE", str.strip),
+    },
+    "cooling_systems": {
+        "socket": ("EXISTS (SELECT 1 FROM cooler_sockets s WHERE s.cooler_id = t.id AND s.socket_type = ?)", norm),
+        "cooling_type": ("t.cooling_type = ? COLLATE NOCASE", str.strip),
+    },
+    "storage": {
+        "storage_type": ("t.storage_type = ? COLLATE NOCASE", str.strip),
+        "capacity": ("t.capacity = ?", int),
+    },
+    "ram": {
+        "ram_type": ("t.ram_type = ? COLLATE NOCASE", str.strip),
+        "size": ("t.size = ? COLLATE NOCASE", str.strip),
+    },
+    "psus": {
+        "min_watts": ("t.watt_output >= ?", int),
+        "max_watts": ("t.watt_output <= ?", int),
+    },
+}
+PRICE_FILTERS = {"min_price": ("t.price >= ?", int), "max_price": ("t.price <= ?", int)}
+
+
+class ListingError(ValueError):
+    pass
+
+
+#(sort value, id) of a row, where the page after it starts
+def page_key(sort: str, row: dict) -> tuple:
+    return row[sort], row["id"]
+
+
+def encode_cursor(sort: str, descending: bool, key: tuple) -> str:
+    raw = json.dumps([sort, descending, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, value, row_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ListingError(f"malformed cursor: {e}")
+    if (cursor_sort, cursor_descending) != (sort, descending):
+        raise ListingError("the cursor belongs to a listing with a different sort")
+    return value, row_id
+
+
+#the sql for one page and its parameters; `filters` are the ones given (name -> value from the query string)
+def page_query(table: str, sort: str, descending: bool, filters: Dict[str, object],
+               after: Optional[tuple], limit: int) -> Tuple[str, list]:
+    if table not in TABLES:
+        raise ListingError(f"unknown component type {table!r}")
+    tables = SORTS.get(sort, ())
+    if tables is not None and table not in tables:
+        raise ListingError(f"{table} can't be sorted by {sort}")
+    allowed = {**FILTERS[table], **PRICE_FILTERS}
+    where: List[str] = []
+    params: list = []
+    direction = "DESC" if descending else "ASC"
+    order = f"t.id {direction}" if sort == "id" else f"t.{sort} {direction}, t.id {direction}"
+    #the keyset bound goes first, sqlite then seeks the index to it even when a filter also bounds the sort column
+    if after is not None:
+        comparison = "<" if descending else ">"
+        if sort == "id":
+            where.append(f"t.id {comparison} ?")
+            params.append(after[1])
+        else:
+            where.append(f"(t.{sort}, t.id) {comparison} (?, ?)")
+            params += after
+    for name, value in filters.items():
+        if name not in allowed:
+            raise ListingError(f"filter {name} does not apply to {table}")
+        condition, convert = allowed[name]
+        try:
+            params.append(convert(value))
+        except (TypeError, ValueError) as e:
+            raise ListingError(f"bad value for {name}: {e}")
+        where.append(condition)
+    sql = f"SELECT t.* FROM {table} t {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order} LIMIT ?"
+    return sql, params + [limit]
+
+
+#one page of rows as dicts and whether there is another page after it (one extra row is read to know)
+def read_page(conn, table: str, sort: str, descending: bool, filters: Dict[str, object],
+              after: Optional[tuple], limit: int) -> Tuple[List[dict], bool]:
+    sql, params = page_query(table, sort, descending, filters, after, limit + 1)
+    rows = [dict(row) for row in conn.execute(sql, params)]
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+
+#-------------------structured logging off the request path--------------
+#records go onto a bounded queue as they are and a listener thread formats them as one json object per
+#line and writes them out, so a slow terminal or log pipe never stalls a request; a full queue drops the
+#record and counts it instead of blocking
+#disabled levels are one isEnabledFor check, the component dumps are debug and off by default
+#LOG_LEVEL=DEBUG LOG_SAMPLE="debug=0.05" LOG_RATE="debug=200,info=1000" uvicorn backend:app
+#  LOG_SAMPLE keeps that fraction of a level, LOG_RATE caps a level at that many records per second
+
+#set per request by RequestIdMiddleware, copied onto every record logged while the request runs
+REQUEST_ID: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+#attributes every LogRecord has, anything else on a record came from extra= and is written as a field
+RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+#level name -> value from "debug=0.1,info=1"
+def parse_levels(spec: str) -> Dict[int, float]:
+    levels = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"unknown log level in {spec!r}: {name}")
+        levels[level] = float(value)
+    return levels
+
+
+#per level sampling and a token bucket per level, runs in the logging thread before the record is queued
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample: Dict[int, float] = None, rate: Dict[int, float] = None):
+        super().__init__()
+        self.sample = dict(sample or {})
+        self.rate = dict(rate or {})
+        self._tokens = dict(self.rate)
+        self._refilled = dict.fromkeys(self.rate, time.monotonic())
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        level = record.levelno
+        keep = self.sample.get(level)
+        if keep is not None and random.random() >= keep:
+            self.sampled_out += 1
+            return False
+        limit = self.rate.get(level)
+        if limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(limit, self._tokens[level] + (now - self._refilled[level]) * limit)
+            self._refilled[level] = now
+            if tokens < 1:
+                self._tokens[level] = tokens
+                self.rate_limited += 1
+                return False
+            self._tokens[level] = tokens - 1
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    #the stock prepare() formats the message here, in the request; only what can't cross threads is done now
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = REQUEST_ID.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueLogging:
+    def __init__(self, name: str = "pcbuilder", level: str = "INFO", sample: str = "", rate: str = "",
+                 max_queue: int = 10_000, stream=None):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level.upper())
+        #records stop here, uvicorn's root handlers would write them again synchronously
+        self.logger.propagate = False
+        self.queue = queue.Queue(max_queue)
+        self.sampling = SamplingFilter(parse_levels(sample), parse_levels(rate))
+        self.handler = DeferredQueueHandler(self.queue)
+        self.handler.addFilter(self.sampling)
+        self.logger.addHandler(self.handler)
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, output)
+        self._running = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if not self._running:
+                self.listener.start()
+                self._running = True
+
+    #writes out whatever is still queued before returning
+    def stop(self):
+        with self._lock:
+            if self._running:
+                self.listener.stop()
+                self._running = False
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampling.sampled_out,
+            "rate_limited": self.sampling.rate_limited,
+        }
+
+
+def configure_logging() -> QueueLogging:
+    return QueueLogging(
+        level=os.environ.get("LOG_LEVEL", "INFO"),
+        sample=os.environ.get("LOG_SAMPLE", ""),
+        rate=os.environ.get("LOG_RATE", "debug=200"),
+    )
+
+
+#pure asgi so it adds nothing but a contextvar set per request; honours an incoming X-Request-ID
+class RequestIdMiddleware:
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = REQUEST_ID.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            REQUEST_ID.reset(token)
@@ -0,0 +1,165 @@
+import threading
+from bisect import bisect_left
+from collections import deque
+from time import perf_counter
+from typing import Dict, Iterable, List, Tuple
+
+
+#-------------------build pipeline instrumentation--------------
+#per stage latency histograms and counters, rendered in the prometheus text format by /metrics
+#recording is one perf_counter pair, a bisect and a short locked update, a couple of microseconds;
+#everything that sorts or formats happens when /metrics is scraped, never on the request path
+
+#seconds, from a dict lookup in the catalog up to a slow database round trip
+LATENCY_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+ROLLING_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, window: int = 1024):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.rows = 0
+        #the last `window` observations, for quantiles that follow what is happening now
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, rows: int = 0):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.rows += rows
+            self.recent.append(value)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count, self.rows, sorted(self.recent)
+
+
+def quantile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class StageMetrics:
+    def __init__(self, stages: Iterable[str]):
+        self.histograms: Dict[str, Histogram] = {stage: Histogram() for stage in stages}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.sources: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float, rows: int = 0):
+        (self.histograms.get(stage) or self.histogram(stage)).observe(seconds, rows)
+
+    def error(self, stage: str, e: BaseException):
+        key = (stage, type(e).__name__)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    #where a build came from: cache, precomputed, catalog or db
+    def source(self, name: str):
+        with self._lock:
+            self.sources[name] = self.sources.get(name, 0) + 1
+
+    #run one stage, timing it and counting its failures; passed as `run` to Catalog.resolve
+    def run(self, stage: str, fn, *args, **kwargs):
+        started = perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.observe(stage, perf_counter() - started)
+            self.error(stage, e)
+            raise
+        (self.histograms.get(stage) or self.histogram(stage)).observe(perf_counter() - started, result is not None)
+        return result
+
+    def render(self) -> List[str]:
+        with self._lock:
+            errors = dict(self.errors)
+            sources = dict(self.sources)
+        lines = [
+            "# HELP build_stage_duration_seconds Time spent in each stage of building a recommendation.",
+            "# TYPE build_stage_duration_seconds histogram",
+        ]
+        rolling = []
+        rows = []
+        for stage, histogram in sorted(self.histograms.items()):
+            counts, total, count, stage_rows, recent = histogram.snapshot()
+            rows.append(f'build_stage_rows_total{{stage="{stage}"}} {stage_rows}')
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'build_stage_duration_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'build_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'build_stage_duration_seconds_sum{{stage="{stage}"}} {total:.9f}')
+            lines.append(f'build_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+            for q in ROLLING_QUANTILES:
+                rolling.append(f'build_stage_recent_duration_seconds{{stage="{stage}",quantile="{q:g}"}} '
+                               f'{quantile(recent, q):.9f}')
+        lines += [
+            "# HELP build_stage_recent_duration_seconds Quantiles over each stage's most recent calls.",
+            "# TYPE build_stage_recent_duration_seconds gauge",
+            *rolling,
+            "# HELP build_stage_rows_total Rows each stage got back from the catalog or the database.",
+            "# TYPE build_stage_rows_total counter",
+            *rows,
+            "# HELP build_stage_errors_total Failed stage calls by exception type.",
+            "# TYPE build_stage_errors_total counter",
+            *(f'build_stage_errors_total{{stage="{stage}",error="{error}"}} {n}'
+              for (stage, error), n in sorted(errors.items())),
+            "# HELP build_source_total Builds served by where the answer came from.",
+            "# TYPE build_source_total counter",
+            *(f'build_source_total{{source="{name}"}} {n}' for name, n in sorted(sources.items())),
+        ]
+        return lines
+
+
+#label value -> Histogram as one prometheus histogram `name` plus `name`_recent quantile gauges
+def render_histograms(name: str, help: str, label: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    rolling = [f"# TYPE {name}_recent gauge"]
+    for value, histogram in sorted(histograms.items()):
+        counts, total, count, _, recent = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {total:.9f}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {count}')
+        for q in ROLLING_QUANTILES:
+            rolling.append(f'{name}_recent{{{label}="{value}",quantile="{q:g}"}} {quantile(recent, q):.9f}')
+    return lines + rolling
+
+
+#stats() dicts (pool, cache, ...) as gauges: numbers only, booleans as 0/1
+def render_stats(prefix: str, stats: dict) -> List[str]:
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return lines
+
+
+#the stages of one get_user_build, in the order they run, and the whole request around them
+BUILD_STAGES = ("cpu", "mobo", "gpu", "case", "cooling", "storage", "memory", "psu", "model", "serialize", "request")
+
+BUILD_METRICS = StageMetrics(BUILD_STAGES)
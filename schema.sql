@@ -1,4 +1,6 @@
---Get-Content ".\schema.sql" | sqlite3 "components.db"
+--python init_db.py publish
+--builds a new components.db from this file beside the live one and swaps it in whole, running servers included
+--(piping it straight into sqlite3 "components.db" lets them read half written tables)
 
 CREATE TABLE cpus (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -88,6 +90,63 @@ CREATE TABLE components (
 );
 
 
+--normalized compatibility, one row per value of the comma joined columns above
+--values are lowercase lookup keys and case form factors use the motherboard names (Micro-ATX -> matx, Mini-ITX -> itx)
+--these are filled from the rows below by running: python init_db.py migrate, which also creates the triggers that
+--keep them in sync with later inserts, updates and deletes on the component tables
+CREATE TABLE IF NOT EXISTS case_form_factors (
+    form_factor VARCHAR(50) NOT NULL,
+    case_id INT NOT NULL,
+    PRIMARY KEY (form_factor, case_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cooler_sockets (
+    socket_type VARCHAR(50) NOT NULL,
+    cooler_id INT NOT NULL,
+    PRIMARY KEY (socket_type, cooler_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS gpu_slots (
+    slot VARCHAR(50) NOT NULL,
+    gpu_id INT NOT NULL,
+    PRIMARY KEY (slot, gpu_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cpu_series_keys (
+    series_key VARCHAR(50) NOT NULL,
+    cpu_id INT NOT NULL,
+    PRIMARY KEY (series_key, cpu_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_case_form_factors_case ON case_form_factors (case_id);
+CREATE INDEX IF NOT EXISTS idx_cooler_sockets_cooler ON cooler_sockets (cooler_id);
+CREATE INDEX IF NOT EXISTS idx_gpu_slots_gpu ON gpu_slots (gpu_id);
+CREATE INDEX IF NOT EXISTS idx_cpu_series_keys_cpu ON cpu_series_keys (cpu_id);
+
+CREATE INDEX IF NOT EXISTS idx_motherboards_socket ON motherboards (socket_type COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_cases_size ON cases (case_size COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_cooling_type ON cooling_systems (cooling_type COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_storage_type_capacity ON storage (storage_type COLLATE NOCASE, capacity, id);
+CREATE INDEX IF NOT EXISTS idx_ram_type_size ON ram (ram_type COLLATE NOCASE, size COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_psus_watt_output ON psus (watt_output, id);
+
+--catalog_version is bumped by triggers on every component table (created by init_db.py), anything
+--computed from an older version is stale; precomputed_builds and build_dependencies are derived and not committed,
+--python init_db.py migrate fills them at deploy time (python init_db.py precompute redoes them)
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key VARCHAR(50) PRIMARY KEY,
+    value INT NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('catalog_version', 1);
+
+CREATE TABLE IF NOT EXISTS precomputed_builds (
+    input_key VARCHAR(255) PRIMARY KEY,
+    catalog_version INT NOT NULL,
+    build_json TEXT,
+    error TEXT
+) WITHOUT ROWID;
+
+
 INSERT INTO cases (case_size, form_factor_compatability, name, price) VALUES
 ('Mid Tower', 'ATX, Micro-ATX', 'NZXT H510', 4418),
 ('Full Tower', 'E-ATX, ATX, Micro-ATX', 'Corsair 7000D Airflow', 8314),
@@ -0,0 +1,101 @@
+import re
+from typing import List, Optional
+
+from catalog import TABLES
+
+
+#-------------------full text component search--------------
+#component_search is an fts5 index over every component table (created and kept in sync by init_db.py),
+#one row per component with the columns people type: name, brand, series, model; price rides along unindexed
+#the rowid says which component a row is, (id << CODE_BITS) | table code, so a trigger deletes by rowid
+#and matches come back interleaved across tables, lowest ids first
+#terms are prefix matched for type ahead ("ryz 7" finds "Ryzen 7 7700X"), best bm25 first, name weighted
+#above the other columns; every match is scored (ORDER BY rank inside fts5), so a broad prefix like "r" costs
+#a few microseconds per matching row but still returns the best matches, not the lowest ids
+SEARCH_TABLE = "component_search"
+SEARCH_COLUMNS = ("name", "brand", "series", "model")
+SEARCH_RANK = "bm25(10.0, 4.0, 4.0, 6.0)"
+CODE_BITS = 4
+
+TABLE_CODES = {table: code for code, table in enumerate(TABLES, start=1)}
+CODE_TABLES = {code: table for table, code in TABLE_CODES.items()}
+
+#table -> sql for name, brand, series and model of the row `{r}` (NEW, OLD or the table itself), NULL when
+#the table has no such column; ram and storage get the names build_summary shows for them
+SEARCH_FIELDS = {
+    "cpus": ("{r}.name", "{r}.brand", "{r}.series", "NULL"),
+    "motherboards": ("{r}.name", "NULL", "NULL", "NULL"),
+    "gpus": ("{r}.brand || ' ' || {r}.model", "{r}.brand", "NULL", "{r}.model"),
+    "cases": ("{r}.name", "NULL", "NULL", "NULL"),
+    "cooling_systems": ("{r}.name", "NULL", "NULL", "NULL"),
+    "storage": ("{r}.storage_type || ' ' || {r}.capacity || ' GB Storage'", "NULL", "NULL", "NULL"),
+    "ram": ("{r}.ram_type || ' ' || {r}.size || ' Memory'", "NULL", "NULL", "NULL"),
+    "psus": ("{r}.name", "NULL", "NULL", "NULL"),
+}
+
+#a query is cut to this many terms, type ahead never needs more
+MAX_TERMS = 8
+
+
+#sql for the search rowid of row `ref`, ids are NULL until init_db backfills them so fall back to the rowid
+def rowid_sql(table: str, ref: str) -> str:
+    return f"(COALESCE({ref}.id, {ref}.rowid) << {CODE_BITS}) | {TABLE_CODES[table]}"
+
+
+#sql true for the index rows of one table
+def table_filter_sql(table: str) -> str:
+    return f"(rowid & {(1 << CODE_BITS) - 1}) = {TABLE_CODES[table]}"
+
+
+def field_sql(table: str, ref: str) -> List[str]:
+    return [expr.format(r=ref) for expr in SEARCH_FIELDS[table]]
+
+
+#fts5 query from what was typed: letters and digits only, every term quoted (no operators get through)
+#and prefix matched when `prefix`; None when nothing searchable is left
+def match_query(text: str, prefix: bool = True) -> Optional[str]:
+    terms = re.findall(r"[^\W_]+", text.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    star = "*" if prefix else ""
+    return " ".join(f'"{term}"{star}' for term in terms)
+
+
+#the best `limit` matches, best first
+def search_components(conn, text: str, table: Optional[str] = None, min_price: Optional[int] = None,
+                      max_price: Optional[int] = None, limit: int = 10, prefix: bool = True) -> List[dict]:
+    match = match_query(text, prefix)
+    if match is None:
+        return []
+    where = [f"{SEARCH_TABLE} MATCH ?"]
+    params: list = [match]
+    if table is not None:
+        where.append(table_filter_sql(table))
+    if min_price is not None:
+        where.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        where.append("price <= ?")
+        params.append(max_price)
+    #ranked on rowid and rank alone, the columns are read for the winners only
+    best = conn.execute(
+        f"SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {' AND '.join(where)} ORDER BY rank LIMIT ?", (*params, limit)
+    ).fetchall()
+    if not best:
+        return []
+    rows = {row[0]: row[1:] for row in conn.execute(
+        f"SELECT rowid, name, brand, series, model, price FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join('?' for _ in best)})",
+        [rowid for rowid, _ in best],
+    )}
+    results = []
+    for rowid, rank in best:
+        name, brand, series, model, price = rows[rowid]
+        result = {"type": CODE_TABLES[rowid & ((1 << CODE_BITS) - 1)], "id": rowid >> CODE_BITS, "name": name}
+        for column, value in (("brand", brand), ("series", series), ("model", model)):
+            if value is not None:
+                result[column] = value
+        result["price"] = price
+        #bm25 is lower for better matches, flipped so a higher score is a better match
+        result["score"] = round(-rank, 4)
+        results.append(result)
+    return results
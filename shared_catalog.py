@@ -0,0 +1,413 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from dataclasses import fields
+from functools import lru_cache
+from hashlib import sha1
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from catalog import TABLES
+from columnar import ColumnarCatalog, ColumnTable, np
+
+
+#-------------------catalog shared between worker processes--------------
+#uvicorn --workers N runs N copies of backend.py; instead of every worker querying components.db and holding
+#its own rows, indexes and numpy columns, the first worker compiles the catalog into one file of flat arrays
+#and every worker maps that file read-only: its pages sit in the page cache once however many workers map it,
+#and a worker started later attaches to what is there instead of touching the database
+#every compile is a new generation file; the `current` pointer next to it is swapped with os.replace, so a
+#worker sees the old generation or the new one and never a half written one, and keeps the generation it
+#mapped until its next refresh (a mapped file that gets unlinked stays readable for whoever maps it)
+#rows are not unpacked into lists: a lookup builds the row it returns from the columns (the most recent ones
+#are kept), so what a worker holds on its own is the small key dicts and the rows in use
+#SHARED_CATALOG=1 uvicorn backend:app --workers 4    (files go to SHARED_CATALOG_DIR, /dev/shm by default)
+#the same file written next to the database is the catalog snapshot (see init_db.py snapshot), mapped at startup
+#instead of reading the component tables
+
+#-------------------file layout--------------
+#header: magic, format version, crc32 of everything after the header, the catalog_version it was compiled
+#from, manifest length, where the arrays start, their total length
+#manifest: json, one entry per array (offset, dtype, shape) plus the small key lists (vocab, index keys)
+#arrays: each 64 byte aligned, fixed width columns (int64 numbers, int32 codes into the string table), the
+#string table (offsets + utf-8 bytes), the Catalog indexes as csr key -> positions, the ColumnTable arrays
+#everything an array holds is used in place, opening a file is reading the header and the manifest
+MAGIC = b"PCBCAT\x00\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIqQQQ")
+ALIGN = 64
+#int columns can hold NULL, strings use code -1 for it
+INT_NULL = -(2 ** 63)
+#rows built from the columns that each worker keeps around per table
+ROW_CACHE = 4096
+#generation files kept besides the current one, for workers that have not switched yet
+KEEP_GENERATIONS = 1
+
+#Catalog index attribute -> table its rows come from
+INDEXES = {
+    "cpus_by_series": "cpus",
+    "gpus_by_slot": "gpus",
+    "cases_by_form_factor": "cases",
+    "coolers_by_socket": "cooling_systems",
+    "storage_by_type": "storage",
+    "memory_by_type": "ram",
+    "mobos_by_socket": "motherboards",
+    "mobos_by_socket_and_size": "motherboards",
+}
+
+#Catalog list attribute -> table
+ROW_LISTS = {
+    "cpus": "cpus",
+    "motherboards": "motherboards",
+    "gpus": "gpus",
+    "cases": "cases",
+    "coolers": "cooling_systems",
+    "storage": "storage",
+    "memory": "ram",
+    "psus": "psus",
+}
+
+
+def default_directory() -> Path:
+    shm = Path("/dev/shm")
+    return shm if shm.is_dir() else Path(tempfile.gettempdir())
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+#-------------------writing a generation--------------
+class Layout:
+    def __init__(self):
+        self.arrays: Dict[str, dict] = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, name: str, array):
+        array = np.ascontiguousarray(array)
+        self.size += -self.size % ALIGN
+        self.arrays[name] = {"offset": self.size, "dtype": array.dtype.str, "shape": list(array.shape)}
+        self.chunks.append((self.size, array))
+        self.size += array.nbytes
+
+
+#every string column of every table shares one table of utf-8 strings
+class StringTable:
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return -1
+        return self.codes.setdefault(str(value), len(self.codes))
+
+    def arrays(self):
+        blobs = [value.encode() for value in self.codes]
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(blobs), dtype=np.uint8)
+
+
+def compile_catalog(catalog: ColumnarCatalog, generation: int = 0, fingerprint: str = "",
+                    catalog_version: int = 0) -> bytearray:
+    layout = Layout()
+    strings = StringTable()
+    manifest = {"generation": generation, "fingerprint": fingerprint, "tables": {}, "indexes": {}}
+
+    for table, row_type in TABLES.items():
+        rows = catalog.tables[table]
+        columns = []
+        for field in fields(row_type):
+            values = [getattr(row, field.name) for row in rows]
+            if field.type is int:
+                column = np.array([INT_NULL if v is None else int(v) for v in values], dtype=np.int64)
+            else:
+                column = np.array([strings.code(v) for v in values], dtype=np.int32)
+            layout.add(f"rows.{table}.{field.name}", column)
+            columns.append(field.name)
+
+        #the numpy side of columnar.ColumnTable, the vocab dicts are small and go in the manifest
+        columnar = catalog.columns[table]
+        layout.add(f"columns.{table}.price", columnar.price)
+        layout.add(f"columns.{table}.watts", columnar.watts)
+        layout.add(f"columns.{table}.signature", columnar.signature)
+        layout.add(f"columns.{table}.distinct", columnar.distinct)
+        for column, codes in columnar.codes.items():
+            layout.add(f"columns.{table}.codes.{column}", codes)
+        for column, matrix in columnar.members.items():
+            layout.add(f"columns.{table}.members.{column}", matrix)
+        manifest["tables"][table] = {
+            "rows": len(rows),
+            "codes": list(columnar.codes),
+            "members": list(columnar.members),
+            "vocab": {column: list(vocab) for column, vocab in columnar.vocab.items()},
+        }
+
+    #each Catalog index as keys plus one run of row positions per key (csr)
+    position_of = {table: {id(row): i for i, row in enumerate(catalog.tables[table])} for table in TABLES}
+    for name, table in INDEXES.items():
+        index = getattr(catalog, name)
+        keys, offsets, positions = [], [0], []
+        for key, rows in index.items():
+            keys.append(list(key) if isinstance(key, tuple) else key)
+            positions.extend(position_of[table][id(row)] for row in rows)
+            offsets.append(len(positions))
+        layout.add(f"index.{name}.offsets", np.array(offsets, dtype=np.int64))
+        layout.add(f"index.{name}.positions", np.array(positions, dtype=np.int32))
+        manifest["indexes"][name] = keys
+    layout.add("psu_steps", np.array([position_of["psus"][id(psu)] for psu in catalog.psu_steps], dtype=np.int32))
+
+    offsets, blob = strings.arrays()
+    layout.add("strings.offsets", offsets)
+    layout.add("strings.blob", blob)
+    manifest["arrays"] = layout.arrays
+
+    encoded = json.dumps(manifest).encode()
+    start = HEADER.size + len(encoded)
+    start += -start % ALIGN
+    out = bytearray(start + layout.size)
+    out[HEADER.size:HEADER.size + len(encoded)] = encoded
+    for offset, array in layout.chunks:
+        out[start + offset:start + offset + array.nbytes] = array.tobytes()
+    checksum = zlib.crc32(memoryview(out)[HEADER.size:])
+    HEADER.pack_into(out, 0, MAGIC, FORMAT_VERSION, checksum, catalog_version, len(encoded), start, layout.size)
+    return out
+
+
+def snapshot_path(db_path) -> Path:
+    return Path(db_path).with_suffix(".catalog")
+
+
+#compile to `path` through a temporary file, readers only ever see a complete file
+def write_snapshot(catalog: ColumnarCatalog, path, catalog_version: int) -> int:
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+    data = compile_catalog(catalog, catalog_version=catalog_version)
+    partial.write_bytes(data)
+    os.replace(partial, path)
+    return len(data)
+
+
+#(format version, catalog_version) from a file's header without mapping it, None when there is no usable file
+def snapshot_version(path) -> Optional[tuple]:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return None
+    _, version, _, catalog_version, *_ = HEADER.unpack(header)
+    return version, catalog_version
+
+
+#-------------------reading a generation--------------
+#a table's rows built on demand from its columns
+class SharedTable:
+    def __init__(self, row_type, columns: list, strings_offsets, strings_blob, size: int):
+        self.row_type = row_type
+        self.size = size
+        self.columns = [(column, column.dtype == np.int64) for column in columns]
+        self.string_offsets = strings_offsets
+        self.string_blob = strings_blob
+        self.row = lru_cache(maxsize=ROW_CACHE)(self.build_row)
+
+    def string(self, code: int):
+        if code < 0:
+            return None
+        return bytes(self.string_blob[self.string_offsets[code]:self.string_offsets[code + 1]]).decode()
+
+    def build_row(self, i: int):
+        values = []
+        for column, is_int in self.columns:
+            value = int(column[i])
+            if is_int:
+                values.append(None if value == INT_NULL else value)
+            else:
+                values.append(self.string(value))
+        return self.row_type(*values)
+
+
+#the rows at some positions of a table, what the Catalog lists and index values are in a shared catalog
+class RowList:
+    def __init__(self, table: SharedTable, positions):
+        self.table = table
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RowList(self.table, self.positions[i])
+        return self.table.row(int(self.positions[i]))
+
+    def __iter__(self):
+        row = self.table.row
+        for i in self.positions.tolist():
+            yield row(i)
+
+
+class SharedIndex:
+    def __init__(self, table: SharedTable, keys: list, offsets, positions):
+        self.table = table
+        self.slots = {tuple(key) if isinstance(key, list) else key: slot for slot, key in enumerate(keys)}
+        #one entry per key, small enough to keep as a list
+        self.offsets = offsets.tolist()
+        self.positions = positions
+
+    def get(self, key, default=None):
+        slot = self.slots.get(key)
+        if slot is None:
+            return default
+        return RowList(self.table, self.positions[self.offsets[slot]:self.offsets[slot + 1]])
+
+    def __contains__(self, key):
+        return key in self.slots
+
+
+#a ColumnarCatalog whose rows, indexes and columns are views into a mapped generation file
+class SharedCatalog(ColumnarCatalog):
+    def __init__(self, path: Path, verify: bool = True):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a compiled catalog")
+        _, version, checksum, self.catalog_version, manifest_length, start, length = HEADER.unpack_from(self.map)
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path} is format {version}, this server reads format {FORMAT_VERSION}")
+        if len(self.map) != start + length:
+            raise SnapshotError(f"{path} is truncated")
+        #a crc over the mapped pages, no copy; catches a torn or corrupted file before any lookup reads it
+        if verify and zlib.crc32(memoryview(self.map)[HEADER.size:]) != checksum:
+            raise SnapshotError(f"{path} does not match its checksum")
+        manifest = json.loads(bytes(self.map[HEADER.size:HEADER.size + manifest_length]))
+        self.path = path
+        self.generation = manifest["generation"]
+        self.fingerprint = manifest["fingerprint"]
+
+        def array(name: str):
+            spec = manifest["arrays"][name]
+            count = 1
+            for n in spec["shape"]:
+                count *= n
+            found = np.frombuffer(self.map, dtype=np.dtype(spec["dtype"]), count=count, offset=start + spec["offset"])
+            return found.reshape(spec["shape"])
+
+        strings_offsets, strings_blob = array("strings.offsets"), array("strings.blob")
+        self.shared: Dict[str, SharedTable] = {}
+        self.tables = {}
+        self.columns = {}
+        for table, row_type in TABLES.items():
+            info = manifest["tables"][table]
+            shared = self.shared[table] = SharedTable(
+                row_type, [array(f"rows.{table}.{field.name}") for field in fields(row_type)],
+                strings_offsets, strings_blob, info["rows"],
+            )
+            rows = self.tables[table] = RowList(shared, np.arange(info["rows"], dtype=np.int32))
+            self.columns[table] = ColumnTable(
+                rows,
+                array(f"columns.{table}.price"),
+                array(f"columns.{table}.watts"),
+                {column: {key: code for code, key in enumerate(keys)} for column, keys in info["vocab"].items()},
+                {column: array(f"columns.{table}.codes.{column}") for column in info["codes"]},
+                {column: array(f"columns.{table}.members.{column}") for column in info["members"]},
+                array(f"columns.{table}.signature"),
+                array(f"columns.{table}.distinct"),
+            )
+        for name, table in ROW_LISTS.items():
+            setattr(self, name, self.tables[table])
+        for name, table in INDEXES.items():
+            setattr(self, name, SharedIndex(self.shared[table], manifest["indexes"][name],
+                                            array(f"index.{name}.offsets"), array(f"index.{name}.positions")))
+        self.psu_steps = RowList(self.shared["psus"], array("psu_steps"))
+        self.psu_step_watts = [psu.watt_output for psu in self.psu_steps]
+
+
+#-------------------generations--------------
+class SharedCatalogStore:
+    def __init__(self, db_path, directory=None):
+        if np is None:
+            raise RuntimeError("the shared catalog is made of numpy arrays, install numpy or unset SHARED_CATALOG")
+        self.directory = Path(directory or os.environ.get("SHARED_CATALOG_DIR") or default_directory())
+        self.stem = f"pcbuilder-{sha1(str(Path(db_path).resolve()).encode()).hexdigest()[:12]}"
+        self.pointer = self.directory / f"{self.stem}.current"
+        self.lock_path = self.directory / f"{self.stem}.lock"
+        self.catalog: Optional[SharedCatalog] = None
+        self.compiled = 0
+        self.attached = 0
+        self._lock = threading.Lock()
+
+    def generation_path(self, generation: int) -> Path:
+        return self.directory / f"{self.stem}.{generation}.cat"
+
+    #(generation, fingerprint) the pointer names, None before the first publish
+    def current(self) -> Optional[tuple]:
+        try:
+            pointer = json.loads(self.pointer.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return pointer["generation"], pointer["fingerprint"]
+
+    #write a new generation and point `current` at it; the caller holds the file lock
+    def publish(self, catalog: ColumnarCatalog, fingerprint: str) -> int:
+        found = self.current()
+        generation = found[0] + 1 if found else 1
+        path = self.generation_path(generation)
+        partial = path.with_suffix(".partial")
+        partial.write_bytes(compile_catalog(catalog, generation, fingerprint))
+        os.replace(partial, path)
+        pointer = self.pointer.with_suffix(".partial")
+        pointer.write_text(json.dumps({"generation": generation, "fingerprint": fingerprint}))
+        os.replace(pointer, self.pointer)
+        self.compiled += 1
+        for old in self.directory.glob(f"{self.stem}.*.cat"):
+            try:
+                if int(old.name.split(".")[-2]) < generation - KEEP_GENERATIONS:
+                    old.unlink()
+            except (ValueError, FileNotFoundError):
+                pass
+        return generation
+
+    def attach(self, generation: int) -> SharedCatalog:
+        if self.catalog is None or self.catalog.generation != generation:
+            self.catalog = SharedCatalog(self.generation_path(generation))
+            self.attached += 1
+        return self.catalog
+
+    #the catalog for the database as it is now (fingerprint): the published generation when it was compiled
+    #from that, otherwise compile() it and publish a new one; one worker compiles while the others wait for it
+    def load(self, fingerprint: tuple, compile: Callable[[], ColumnarCatalog]) -> SharedCatalog:
+        wanted = json.dumps(fingerprint)
+        with self._lock:
+            found = self.current()
+            if found is not None and found[1] == wanted:
+                try:
+                    return self.attach(found[0])
+                except FileNotFoundError:
+                    pass
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    found = self.current()
+                    if found is None or found[1] != wanted or not self.generation_path(found[0]).exists():
+                        found = (self.publish(compile(), wanted), wanted)
+                    return self.attach(found[0])
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        catalog = self.catalog
+        return {
+            "generation": catalog.generation if catalog is not None else 0,
+            "mapped_bytes": len(catalog.map) if catalog is not None else 0,
+            "compiled": self.compiled,
+            "attached": self.attached,
+        }
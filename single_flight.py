@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+#-------------------request coalescing--------------
+#concurrent calls for the same key share one computation: the first caller starts it as a task, everyone
+#arriving while it runs awaits that same task and gets its result (or its exception)
+#the task is shielded, a leader whose client goes away doesn't cancel it for the callers still waiting
+#the key is dropped as soon as the task finishes, results are cached elsewhere (see build_cache.py)
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    #(result, True) for the call that ran fn, (result, False) for the ones that joined it
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args) -> Tuple[object, bool]:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), False
+        task = asyncio.ensure_future(fn(*args))
+        self._calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), True
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        #marks the exception as retrieved even when every caller was cancelled before it came
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
@@ -0,0 +1,541 @@
+import heapq
+import itertools
+from bisect import bisect_right
+from dataclasses import dataclass, fields
+from typing import Callable, Dict, Optional
+
+from catalog import BuildParts, Catalog, ComponentNotFound, form_factor_key, form_factor_keys, norm, psu_watts, split_list
+from columnar import STAGE_COLUMNS, ColumnarCatalog, columns_of, np
+from columnar import prune_dominated as prune_dominated_columns
+
+
+#-------------------budget constrained build search--------------
+#picks one component per category so the build is compatible (socket -> motherboard -> gpu slot /
+#cooler socket / case form factor), the psu covers the watts plus 10 percent headroom, the total
+#stays under the budget and the weighted score is as high as possible
+#branch and bound: categories are assigned in SEARCH_ORDER, every node gets an optimistic score and
+#a pessimistic cost for what is left and is cut as soon as it cannot beat the best build found so far
+#before searching, components that are dominated (same compatibility, not cheaper, not better,
+#not lower wattage than another one) are dropped since they can never be in a unique best build
+
+#there is no benchmark data in the catalog so a component's score is its price times a category weight,
+#i.e. how much of the budget should go where; a weight of 0 means "cheapest that works"
+DEFAULT_WEIGHTS = {
+    "cpu": 1.0,
+    "gpu": 1.0,
+    "mobo": 0.3,
+    "memory": 0.5,
+    "storage": 0.3,
+    "cooling": 0.2,
+    "case": 0.1,
+    "psu": 0.0,
+}
+
+SEARCH_ORDER = ("cpu", "mobo", "gpu", "cooling", "case", "memory", "storage")
+
+
+@dataclass
+class SolverResult:
+    parts: BuildParts
+    score: float
+    total_cost: int
+    nodes: int
+    optimal: bool
+
+
+#user side filters, None means anything goes
+@dataclass
+class BuildFilters:
+    cpu_brand: Optional[str] = None
+    cpu_model: Optional[str] = None
+    case_size: Optional[str] = None
+    cooling: Optional[str] = None
+    pref_storage_type: Optional[str] = None
+    pref_storage_size: Optional[int] = None
+    pref_memory_type: Optional[str] = None
+    pref_memory_size: Optional[str] = None
+
+
+def matches(value, wanted) -> bool:
+    return wanted is None or norm(value) == norm(wanted)
+
+
+#the rows of each category the filters allow, in table order
+def filtered_rows(catalog: Catalog, filters: BuildFilters) -> Dict[str, list]:
+    if filters.cpu_model is not None:
+        cpus = catalog.cpus_by_series.get(norm(filters.cpu_model), [])
+    else:
+        cpus = catalog.cpus
+    return {
+        "cpu": [r for r in cpus if matches(r.brand, filters.cpu_brand)],
+        "mobo": list(catalog.motherboards),
+        "gpu": list(catalog.gpus),
+        "cooling": [r for r in catalog.coolers if matches(r.cooling_type, filters.cooling)],
+        "case": [r for r in catalog.cases if matches(r.case_size, filters.case_size)],
+        "memory": [r for r in catalog.memory
+                   if matches(r.ram_type, filters.pref_memory_type) and matches(r.size, filters.pref_memory_size)],
+        "storage": [r for r in catalog.storage
+                    if matches(r.storage_type, filters.pref_storage_type)
+                    and (filters.pref_storage_size is None or int(r.capacity) == int(filters.pref_storage_size))],
+        "psu": list(catalog.psus),
+    }
+
+
+#filtered_rows over a ColumnarCatalog: one mask per category, positions into its table in table order
+def filtered_positions(catalog: ColumnarCatalog, filters: BuildFilters) -> dict:
+    tables = {category: catalog.columns[STAGE_COLUMNS[category]] for category in SIGNATURES}
+    masks = {category: table.everything() for category, table in tables.items()}
+    cpus, coolers, cases, memory, storage = (tables[c] for c in ("cpu", "cooling", "case", "memory", "storage"))
+    if filters.cpu_model is not None:
+        masks["cpu"] = cpus.has("series", norm(filters.cpu_model))
+    if filters.cpu_brand is not None:
+        masks["cpu"] &= cpus.eq("brand", norm(filters.cpu_brand))
+    if filters.cooling is not None:
+        masks["cooling"] &= coolers.eq("cooling_type", norm(filters.cooling))
+    if filters.case_size is not None:
+        masks["case"] &= cases.eq("case_size", norm(filters.case_size))
+    if filters.pref_memory_type is not None:
+        masks["memory"] &= memory.eq("ram_type", norm(filters.pref_memory_type))
+    if filters.pref_memory_size is not None:
+        masks["memory"] &= memory.eq("size", norm(filters.pref_memory_size))
+    if filters.pref_storage_type is not None:
+        masks["storage"] &= storage.eq("storage_type", norm(filters.pref_storage_type))
+    if filters.pref_storage_size is not None:
+        masks["storage"] &= storage.eq("capacity", int(filters.pref_storage_size))
+    return {category: (tables[category], np.flatnonzero(mask)) for category, mask in masks.items()}
+
+
+#what a row connects to; two rows with the same signature are interchangeable as far as compatibility goes
+SIGNATURES: Dict[str, Callable] = {
+    "cpu": lambda r: norm(r.socket_type),
+    "mobo": lambda r: (norm(r.socket_type), norm(r.gpu_socket), form_factor_key(r.form_factor)),
+    "gpu": lambda r: frozenset(split_list(r.compatible_sockets)),
+    "cooling": lambda r: frozenset(split_list(r.compatible_sockets)),
+    "case": lambda r: frozenset(form_factor_keys(r.form_factor_compatability)),
+    "memory": lambda r: (),
+    "storage": lambda r: (),
+    "psu": lambda r: (),
+}
+
+#keys a row is reachable under once its parent is chosen
+INDEX_KEYS: Dict[str, Callable] = {
+    "cpu": lambda r: [None],
+    "mobo": lambda r: [norm(r.socket_type)],
+    "gpu": lambda r: split_list(r.compatible_sockets),
+    "cooling": lambda r: split_list(r.compatible_sockets),
+    "case": lambda r: form_factor_keys(r.form_factor_compatability),
+    "memory": lambda r: [None],
+    "storage": lambda r: [None],
+    "psu": lambda r: [None],
+}
+
+#the lookup keys choosing a row fixes for the categories that depend on it
+CHILD_KEYS: Dict[str, Callable] = {
+    "cpu": lambda r: {"mobo": norm(r.socket_type)},
+    "mobo": lambda r: {"gpu": norm(r.gpu_socket), "cooling": norm(r.socket_type), "case": form_factor_key(r.form_factor)},
+    "gpu": lambda r: {},
+    "cooling": lambda r: {},
+    "case": lambda r: {},
+    "memory": lambda r: {},
+    "storage": lambda r: {},
+}
+
+
+def watts_of(row) -> int:
+    return int(getattr(row, "required_watt", 0) or 0)
+
+
+#lower is better: the watts a part draws, or for a psu the watts it does not deliver
+def burden(category: str, row) -> int:
+    return -int(row.watt_output) if category == "psu" else watts_of(row)
+
+
+#drop rows another row with the same signature beats on price, score and watts
+#(columnar.prune_dominated is the same over a ColumnarCatalog's columns)
+def prune_dominated(rows: list, category: str, score: Callable) -> list:
+    groups: Dict = {}
+    for row in rows:
+        groups.setdefault(SIGNATURES[category](row), []).append(row)
+    kept = []
+    for group in groups.values():
+        #cheapest first, so a row is dominated if a kept row with no more burden scores at least as much
+        best_by_burden: Dict[int, float] = {}
+        for row in sorted(group, key=lambda r: (r.price, -score(r), burden(category, r))):
+            row_score, row_burden = score(row), burden(category, row)
+            if any(b <= row_burden and s >= row_score for b, s in best_by_burden.items()):
+                continue
+            kept.append(row)
+            best_by_burden[row_burden] = max(best_by_burden.get(row_burden, row_score), row_score)
+    return kept
+
+
+#candidates of one category grouped by lookup key, with what the bounds need precomputed
+class Options:
+    def __init__(self, score: Callable, branches: Dict, prices: Dict, min_watts: Dict):
+        self.score = score
+        #key -> rows best score first; None is what a category is looked up under while its parent is not
+        #chosen yet: any of its rows
+        self.branches = branches
+        self.prices = prices
+        self.min_price = {key: prices[0] if prices else None for key, prices in self.prices.items()}
+        self.min_watts = min_watts
+
+
+def row_options(rows: list, keys_of: Callable, score: Callable) -> Options:
+    grouped: Dict = {}
+    for row in rows:
+        for key in keys_of(row):
+            grouped.setdefault(key, []).append(row)
+    grouped[None] = list(rows)
+    return Options(
+        score,
+        {key: sorted(group, key=lambda r: (-score(r), r.price)) for key, group in grouped.items()},
+        {key: sorted(r.price for r in group) for key, group in grouped.items()},
+        {key: min((watts_of(r) for r in group), default=0) for key, group in grouped.items()},
+    )
+
+
+#the column each category's INDEX_KEYS come from in a ColumnarCatalog, multi valued ones are members
+COLUMN_KEYS = {
+    "mobo": "socket_type",
+    "gpu": "compatible_sockets",
+    "cooling": "compatible_sockets",
+    "case": "form_factor_compatability",
+}
+
+
+#row_options over a ColumnarCatalog table: one sort of the candidates, each key's group read off in that order;
+#rows are the candidates at those positions, the branches hold the same row objects (the search keys on id(row))
+def column_options(table, positions, rows: list, category: str, score: Callable, weight: float) -> Options:
+    price = table.price[positions]
+    order = np.lexsort((np.arange(len(positions)), price, -(weight * price)))
+    ranked = positions[order]
+    watts = table.watts if category not in ("psu", "case") else np.zeros_like(table.watts)
+    groups = {None: ranked}
+    column = COLUMN_KEYS.get(category)
+    if column in table.members:
+        inside = table.members[column][:, ranked]
+        for key, code in table.vocab[column].items():
+            if inside[code].any():
+                groups[key] = ranked[inside[code]]
+    elif column is not None:
+        codes = table.codes[column][ranked]
+        for key, code in table.vocab[column].items():
+            found = codes == code
+            if found.any():
+                groups[key] = ranked[found]
+    at = dict(zip(positions.tolist(), rows))
+    return Options(
+        score,
+        {key: [at[i] for i in group.tolist()] for key, group in groups.items()},
+        {key: np.sort(table.price[group]).tolist() for key, group in groups.items()},
+        {key: int(watts[group].min()) if len(group) else 0 for key, group in groups.items()},
+    )
+
+
+class BudgetSolver:
+    def __init__(self, catalog: Catalog, budget: int, filters: Optional[BuildFilters] = None,
+                 weights: Optional[Dict[str, float]] = None, max_nodes: int = 50_000):
+        self.budget = int(budget)
+        self.max_nodes = max_nodes
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or {})
+
+        self.scores = {category: self.scorer(category) for category in SIGNATURES}
+        columns = columns_of(catalog)
+        if columns is not None:
+            #the same pruning and grouping as below, with masks and sorts over whole columns
+            pruned, self.options = {}, {}
+            for category, (table, positions) in filtered_positions(columns, filters or BuildFilters()).items():
+                weight = float(self.weights.get(category, 0.0))
+                burden = -table.watts[positions] if category == "psu" else table.watts[positions]
+                kept = prune_dominated_columns(table, positions, weight * table.price[positions], burden)
+                pruned[category] = table.take(kept)
+                self.options[category] = column_options(table, kept, pruned[category], category, self.scores[category], weight)
+        else:
+            rows = filtered_rows(catalog, filters or BuildFilters())
+            pruned = {category: prune_dominated(group, category, self.scores[category]) for category, group in rows.items()}
+            self.options = {
+                category: row_options(pruned[category], INDEX_KEYS[category], self.scores[category]) for category in pruned
+            }
+        #keys are normalized once per row here rather than on every node of the search
+        self.child_keys = {
+            category: {id(row): CHILD_KEYS[category](row) for row in pruned[category]} for category in SEARCH_ORDER
+        }
+        #the bound hands spare money to the categories that turn it into the most score first
+        self.bound_order = sorted(pruned, key=lambda category: -float(self.weights.get(category, 0.0)))
+
+        self.psus = sorted(pruned["psu"], key=lambda r: (-self.scores["psu"](r), r.price))
+        self.psu_max_watts = max((r.watt_output for r in self.psus), default=0)
+
+        self.plans: Dict[tuple, Optional[tuple]] = {}
+        self.row_plans: Dict[int, Optional[tuple]] = {}
+        self.nodes = 0
+        self.best: Optional[tuple] = None
+
+    def scorer(self, category: str) -> Callable:
+        weight = float(self.weights.get(category, 0.0))
+        return lambda row: weight * row.price
+
+    #highest scoring psu that covers the watts with 10 percent headroom and fits the money left
+    def pick_psu(self, required_watts: int, money_left: int):
+        need = required_watts + int(required_watts * 0.10)
+        for psu in self.psus:
+            if psu.watt_output >= need and psu.price <= money_left:
+                return psu
+        return None
+
+    #what bounding the categories from `depth` on needs that only depends on the keys chosen so far:
+    #their cheapest total (psu included), their lowest draw, and (weight, cheapest, prices) per category
+    #in bound_order, None when some category has nothing left under its key
+    def rest_plan(self, depth: int, keys: dict):
+        plan_key = (depth,) + tuple(keys.get(category) for category in SEARCH_ORDER[depth:])
+        if plan_key in self.plans:
+            return self.plans[plan_key]
+        floors = {"psu": None}
+        for category in SEARCH_ORDER[depth:]:
+            floors[category] = keys.get(category)
+            if self.options[category].min_price.get(floors[category]) is None:
+                self.plans[plan_key] = None
+                return None
+        min_rest, min_watts, base_score, items = 0, 0, 0.0, []
+        for category in self.bound_order:
+            if category not in floors:
+                continue
+            options = self.options[category]
+            key = floors[category]
+            weight = float(self.weights.get(category, 0.0))
+            min_rest += options.min_price[key]
+            min_watts += options.min_watts[key]
+            base_score += weight * options.min_price[key]
+            if weight > 0:
+                items.append((weight, options.min_price[key], options.prices[key]))
+        plan = self.plans[plan_key] = (min_rest, min_watts, base_score, items)
+        return plan
+
+    #optimistic score and pessimistic cost of everything from `depth` on (psu included), None if it cannot fit
+    #every remaining category costs at least its cheapest option; the money left over after that is spent
+    #greedily on the highest weights, each category capped at its dearest option that still fits, which is
+    #never less than what any real completion scores since score is weight * price
+    def bound(self, plan: Optional[tuple], cost: int, watts: int):
+        if plan is None:
+            return None
+        min_rest, min_watts, optimistic, items = plan
+        spare = self.budget - cost - min_rest
+        if spare < 0:
+            return None
+        min_watts += watts
+        if min_watts + int(min_watts * 0.10) > self.psu_max_watts:
+            return None
+        left = spare
+        for weight, price, prices in items:
+            if left <= 0:
+                break
+            extra = min(left, prices[bisect_right(prices, spare + price) - 1] - price)
+            optimistic += weight * extra
+            left -= extra
+        return optimistic, min_rest
+
+    def better(self, score: float, cost: int) -> bool:
+        if self.best is None:
+            return True
+        best_score, best_cost = self.best[0], self.best[1]
+        return score > best_score + 1e-9 or (abs(score - best_score) <= 1e-9 and cost < best_cost)
+
+    def search(self, depth: int, chosen: dict, keys: dict, cost: int, score: float, watts: int):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            return
+        if depth == len(SEARCH_ORDER):
+            psu = self.pick_psu(watts, self.budget - cost)
+            if psu is None:
+                return
+            total_score = score + self.scores["psu"](psu)
+            total_cost = cost + psu.price
+            if self.better(total_score, total_cost):
+                self.best = (total_score, total_cost, dict(chosen, psu=psu))
+            return
+
+        category = SEARCH_ORDER[depth]
+        options = self.options[category]
+        child_keys = self.child_keys[category]
+        #below the motherboard a branch does not change what the later categories can pick, so the rest is
+        #bounded once with all of this node's money; branches come best score first, and once even that
+        #bound cannot beat the best build, no later branch can either
+        plan = rest = None
+        if depth >= 2:
+            plan = self.rest_plan(depth + 1, keys)
+            rest = self.bound(plan, cost, watts)
+            if rest is None:
+                return
+        for row in options.branches.get(keys.get(category), []):
+            new_cost = cost + row.price
+            if new_cost > self.budget:
+                continue
+            new_score = score + options.score(row)
+            if rest is not None and not self.better(new_score + rest[0], new_cost + rest[1]):
+                break
+            new_watts = watts + watts_of(row)
+            new_keys = keys
+            if child_keys[id(row)]:
+                #a cpu or motherboard fixes the keys of everything after it, so its plan is kept per row
+                new_keys = dict(keys, **child_keys[id(row)])
+                if id(row) not in self.row_plans:
+                    self.row_plans[id(row)] = self.rest_plan(depth + 1, new_keys)
+                plan = self.row_plans[id(row)]
+            bound = self.bound(plan, new_cost, new_watts)
+            if bound is None:
+                continue
+            optimistic, min_rest = bound
+            if not self.better(new_score + optimistic, new_cost + min_rest):
+                continue
+            chosen[category] = row
+            self.search(depth + 1, chosen, new_keys, new_cost, new_score, new_watts)
+            del chosen[category]
+            if self.nodes > self.max_nodes:
+                return
+
+    def solve(self) -> Optional[SolverResult]:
+        if self.psus and self.bound(self.rest_plan(0, {}), 0, 0) is not None:
+            self.search(0, {}, {}, 0, 0.0, 0)
+        if self.best is None:
+            return None
+        score, cost, chosen = self.best
+        parts = BuildParts(chosen["cpu"], chosen["mobo"], chosen["gpu"], chosen["case"], chosen["cooling"],
+                           chosen["storage"], chosen["memory"], chosen["psu"])
+        return SolverResult(parts, score, cost, self.nodes, optimal=self.nodes <= self.max_nodes)
+
+
+def solve_budget_build(catalog: Catalog, budget: int, filters: Optional[BuildFilters] = None,
+                       weights: Optional[Dict[str, float]] = None, max_nodes: int = 50_000) -> Optional[SolverResult]:
+    return BudgetSolver(catalog, budget, filters, weights, max_nodes).solve()
+
+
+#-------------------k best builds for one input--------------
+#the alternatives to what get_user_build picks: every compatible build for a UserComponentInput, best first,
+#produced lazily so the first one costs about as much as a single lookup
+#one product of sorted candidate lists per motherboard (its cpus, gpus, cases and coolers plus the shared
+#storage and memory); a heap walks all of them at once, and each popped index vector only pushes the
+#vectors that bump one coordinate at or after its last non zero one, so every build is reached exactly once
+#the psu follows from the other parts' watts (Catalog.psu_for), so builds are ranked on the parts before
+#the psu and held back until no later build can still undercut them once its cheapest possible psu is added
+
+#lower is better; score is DEFAULT_WEIGHTS applied to the prices, as in the budget solver
+RANK_BY: Dict[str, Callable] = {
+    "price": lambda category, row: row.price,
+    "score": lambda category, row: -DEFAULT_WEIGHTS.get(category, 0.0) * row.price,
+}
+
+#RANK_BY over a whole ColumnarCatalog table
+RANK_COLUMNS: Dict[str, Callable] = {
+    "price": lambda category, table: table.price,
+    "score": lambda category, table: -DEFAULT_WEIGHTS.get(category, 0.0) * table.price,
+}
+
+ALTERNATIVE_ORDER = ("cpu", "mobo", "gpu", "case", "cooling", "storage", "memory")
+
+
+@dataclass
+class RankedBuild:
+    rank: int
+    parts: BuildParts
+    value: float
+
+
+#the same component listed twice (same columns, other id) would only make look alike alternatives
+def distinct_rows(rows: list) -> list:
+    seen = set()
+    kept = []
+    for row in rows:
+        key = tuple(getattr(row, field.name) for field in fields(row) if field.name != "id")
+        if key not in seen:
+            seen.add(key)
+            kept.append(row)
+    return kept
+
+
+def iter_alternatives(catalog: Catalog, cpu_model: str, case_size: str, cooling: str, pref_storage_type: str,
+                      pref_storage_size: int, pref_memory_type: str, pref_memory_size: str, rank_by: str = "price"):
+    value = RANK_BY[rank_by]
+    columns = columns_of(catalog)
+
+    #motherboards share gpu slots, form factors and sockets, so each candidate list is sorted once per key
+    lists_by_key: Dict[tuple, list] = {}
+
+    def ranked(category: str, index: dict, key) -> list:
+        if (category, key) not in lists_by_key:
+            if columns is None:
+                rows = distinct_rows(index.get(key, []))
+                lists_by_key[category, key] = sorted(rows, key=lambda row: value(category, row))
+            else:
+                #the same list as a mask over the table and a stable argsort of the rank values
+                table = columns.columns[STAGE_COLUMNS[category]]
+                if category == "cpu":
+                    mask = columns.stage_mask("cpu", cpu_model) & table.eq("socket_type", key)
+                else:
+                    mask = columns.stage_mask(category, *(key if isinstance(key, tuple) else (key,)))
+                values = RANK_COLUMNS[rank_by](category, table)
+                lists_by_key[category, key] = table.take(table.order(mask & table.distinct, values))
+        return lists_by_key[category, key]
+
+    size = norm(case_size)
+    cpus = catalog.cpus_by_series.get(norm(cpu_model), [])
+    storage = ranked("storage", catalog.storage_by_type, (norm(pref_storage_type), int(pref_storage_size)))
+    memory = ranked("memory", catalog.memory_by_type, (norm(pref_memory_type), norm(pref_memory_size)))
+    psu_floor = min((value("psu", psu) for psu in catalog.psu_steps), default=0)
+
+    contexts = []
+    sockets: Dict[str, list] = {}
+    for cpu in cpus:
+        sockets.setdefault(norm(cpu.socket_type), []).append(cpu)
+    for socket in sockets:
+        socket_cpus = ranked("cpu", sockets, socket)
+        for mobo in distinct_rows(catalog.mobos_by_socket_and_size.get((socket, size), [])):
+            lists = (
+                socket_cpus,
+                [mobo],
+                ranked("gpu", catalog.gpus_by_slot, norm(mobo.gpu_socket)),
+                ranked("case", catalog.cases_by_form_factor, (form_factor_key(mobo.form_factor), size)),
+                ranked("cooling", catalog.coolers_by_socket, (norm(mobo.socket_type), norm(cooling))),
+                storage,
+                memory,
+            )
+            if all(lists):
+                contexts.append(lists)
+
+    def total(lists, vector) -> float:
+        return sum(value(category, rows[i]) for category, rows, i in zip(ALTERNATIVE_ORDER, lists, vector))
+
+    heap = []
+    counter = itertools.count()
+    for context, lists in enumerate(contexts):
+        origin = (0,) * len(lists)
+        heapq.heappush(heap, (total(lists, origin), next(counter), context, origin))
+
+    held = []
+    rank = 0
+    while heap or held:
+        #everything still in the heap ends up at least this bad once a psu is added
+        floor = heap[0][0] + psu_floor if heap else None
+        while held and (floor is None or held[0][0] <= floor):
+            build_value, _, parts = heapq.heappop(held)
+            rank += 1
+            yield RankedBuild(rank, parts, build_value)
+        if not heap:
+            break
+
+        partial, _, context, vector = heapq.heappop(heap)
+        lists = contexts[context]
+        last = max((i for i, position in enumerate(vector) if position), default=0)
+        for i in range(last, len(vector)):
+            if vector[i] + 1 < len(lists[i]):
+                successor = vector[:i] + (vector[i] + 1,) + vector[i + 1:]
+                heapq.heappush(heap, (total(lists, successor), next(counter), context, successor))
+
+        cpu, mobo, gpu, case, cooler, drive, ram = (rows[i] for rows, i in zip(lists, vector))
+        try:
+            psu = catalog.psu_for(psu_watts(cpu, mobo, gpu, cooler, drive, ram))
+        except ComponentNotFound:
+            continue
+        parts = BuildParts(cpu, mobo, gpu, case, cooler, drive, ram, psu)
+        heapq.heappush(held, (partial + value("psu", psu), next(counter), parts))
@@ -0,0 +1,63 @@
+import uuid
+
+import pytest
+
+import admission
+from admission import TokenBuckets, client_key, sign_client_id
+
+SECRET = b"gui-secret"
+
+
+def scope(peer: str, *headers) -> dict:
+    return {"type": "http", "client": (peer, 50000), "headers": [(name.encode(), value.encode()) for name, value in headers]}
+
+
+@pytest.fixture
+def signed_ids(monkeypatch):
+    monkeypatch.setattr(admission, "CLIENT_ID_SECRET", SECRET)
+    monkeypatch.setattr(admission, "CLIENT_ID_PEERS", frozenset({"10.0.0.5"}))
+    monkeypatch.setattr(admission, "TRUST_FORWARDED", False)
+
+
+def test_client_id_ignored_by_default():
+    assert client_key(scope("127.0.0.1", ("x-client-id", "abc"))) == "127.0.0.1"
+
+
+def test_client_id_from_untrusted_peer_is_ignored(signed_ids):
+    signed = sign_client_id("abc", SECRET)
+    assert client_key(scope("10.0.0.9", ("x-client-id", signed))) == "10.0.0.9"
+
+
+def test_garbage_client_id_is_ignored(signed_ids):
+    assert client_key(scope("10.0.0.5", ("x-client-id", "\u00e9t\u00e9." + "0" * 64))) == "10.0.0.5"
+    assert client_key(scope("10.0.0.5", ("x-client-id", sign_client_id("x" * 65, SECRET)))) == "10.0.0.5"
+
+
+def test_signed_client_id_from_trusted_peer(signed_ids):
+    signed = sign_client_id("abc", SECRET)
+    assert client_key(scope("10.0.0.5", ("x-client-id", signed))) == "10.0.0.5/abc"
+
+
+def test_rotating_unsigned_ids_share_the_peer_bucket(signed_ids):
+    buckets = TokenBuckets(rate=1, burst=2)
+    waits = []
+    for _ in range(4):
+        forged = f"{uuid.uuid4().hex}.{'0' * 64}"
+        for value in (uuid.uuid4().hex, forged):
+            waits.append(buckets.take(client_key(scope("10.0.0.5", ("x-client-id", value))), now=0.0))
+    assert waits[:2] == [0, 0]
+    assert all(wait > 0 for wait in waits[2:])
+
+
+def test_rotating_signed_ids_get_their_own_buckets(signed_ids):
+    buckets = TokenBuckets(rate=1, burst=1)
+    keys = [client_key(scope("10.0.0.5", ("x-client-id", sign_client_id(f"session{i}", SECRET)))) for i in range(3)]
+    assert len(set(keys)) == 3
+    assert [buckets.take(key, now=0.0) for key in keys] == [0, 0, 0]
+
+
+def test_client_id_keys_on_the_forwarded_address(signed_ids, monkeypatch):
+    monkeypatch.setattr(admission, "TRUST_FORWARDED", True)
+    signed = sign_client_id("abc", SECRET)
+    assert client_key(scope("127.0.0.1", ("x-forwarded-for", "10.0.0.5, 127.0.0.1"), ("x-client-id", signed))) == "10.0.0.5/abc"
+    assert client_key(scope("127.0.0.1", ("x-forwarded-for", "10.0.0.9"), ("x-client-id", signed))) == "10.0.0.9"
@@ -0,0 +1,44 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import backend
+
+BASE = {"cpu_model": "Ryzen 7", "case_size": "Mid Tower", "cooling": "Air", "pref_storage_type": "SSD",
+        "pref_storage_size": 1024, "pref_memory_type": "DDR5", "pref_memory_size": "32 GB"}
+#one miss per stage the caller's text shows up in
+MISSES = [
+    dict(BASE, cpu_model="Xeon"),
+    dict(BASE, cpu_model="XEON "),
+    dict(BASE, case_size="Micro Cube"),
+    dict(BASE, cooling="Peltier"),
+    dict(BASE, pref_storage_type="Tape"),
+    dict(BASE, pref_memory_type="DDR9"),
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(backend.app) as client:
+        yield client
+
+
+#without precomputed rows both endpoints resolve against the catalog
+@pytest.fixture
+def no_precomputed(monkeypatch):
+    monkeypatch.setattr(backend, "PRECOMPUTED", {})
+    backend.BUILD_CACHE.clear()
+
+
+def test_batch_errors_read_like_single_build(client, no_precomputed):
+    batch = client.post("/get_user_builds/batch", json={"inputs": MISSES}).json()["results"]
+    for input, result in zip(MISSES, batch):
+        single = client.post("/get_user_build", json=input)
+        assert single.status_code == 404
+        assert result == single.json()
+
+
+def test_batch_error_keeps_the_callers_spelling(client, no_precomputed):
+    batch = client.post("/get_user_builds/batch", json={"inputs": MISSES[:2]}).json()
+    assert [result["error"] for result in batch["results"]] == ["CPU not found: Xeon", "CPU not found: XEON "]
+    #the two spellings still share one cpu lookup
+    assert batch["stats"]["distinct_lookups"] == 1
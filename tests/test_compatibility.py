@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+import init_db
+from init_db import COMPATIBILITY_SOURCES, migrate, rebuild_compatibility
+
+#values the comma lists and series can hold, spacing, case, aliases and empty parts included
+AWKWARD_ROWS = {
+    "cases": ("name, case_size, form_factor_compatability, price", ("Odd Case", "Mid Tower", "  Micro-ATX ,Mini ITX,, ATX ", 1)),
+    "cooling_systems": ("name, cooling_type, compatible_sockets, price", ("Odd Cooler", "Air", 'AM4,"LGA 1700"\t,am5', 1)),
+    "gpus": ("brand, model, compatible_sockets, price", ("Odd", "GPU", "PCIe 4.0 x16, PCIE 3.0 X16", 1)),
+    "cpus": ("name, series, socket_type, price", ("Odd CPU", "  Core  i7\tX ", "LGA1700", 1)),
+}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db = tmp_path / "components.db"
+    source = sqlite3.connect(str(init_db.DATABASE_URL))
+    target = sqlite3.connect(str(db))
+    source.backup(target)
+    source.close()
+    target.close()
+    migrate(db, snapshot=False, precompute=False)
+    conn = sqlite3.connect(str(db))
+    yield conn
+    conn.close()
+
+
+def join_rows(conn, join_table: str) -> set:
+    return set(conn.execute(f"SELECT * FROM {join_table}"))
+
+
+def test_triggers_split_like_the_loader(conn):
+    with conn:
+        for table, (columns, row) in AWKWARD_ROWS.items():
+            conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' for _ in row)})", row)
+    for join_table, (table, *_) in COMPATIBILITY_SOURCES.items():
+        from_triggers = join_rows(conn, join_table)
+        with conn:
+            rebuild_compatibility(conn, join_table)
+        assert from_triggers == join_rows(conn, join_table)
+        #and every stored row through the triggers again: an id change deletes and reinserts its join rows
+        with conn:
+            conn.execute(f"DELETE FROM {join_table}")
+            conn.execute(f"UPDATE {table} SET id = -id")
+            conn.execute(f"UPDATE {table} SET id = -id")
+        assert from_triggers == join_rows(conn, join_table)
+
+
+def test_plain_writes_reach_the_sql_path(conn):
+    with conn:
+        gpu = conn.execute("INSERT INTO gpus (brand, model, compatible_sockets, required_watt, price) "
+                           "VALUES ('Acme', 'Test 1', 'Test Slot', 100, 1)").lastrowid
+    slot_gpu = "SELECT g.id FROM gpus g JOIN gpu_slots s ON g.id = s.gpu_id WHERE s.slot = ?"
+    assert conn.execute("SELECT id FROM gpus WHERE rowid = ?", (gpu,)).fetchone() == (gpu,)
+    assert conn.execute(slot_gpu, ("test slot",)).fetchall() == [(gpu,)]
+    with conn:
+        conn.execute("UPDATE gpus SET compatible_sockets = 'Other Slot' WHERE id = ?", (gpu,))
+    assert conn.execute(slot_gpu, ("test slot",)).fetchall() == []
+    assert conn.execute(slot_gpu, ("other slot",)).fetchall() == [(gpu,)]
+    with conn:
+        conn.execute("DELETE FROM gpus WHERE id = ?", (gpu,))
+    assert conn.execute("SELECT COUNT(*) FROM gpu_slots WHERE gpu_id = ?", (gpu,)).fetchone() == (0,)